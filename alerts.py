@@ -0,0 +1,169 @@
+import bisect
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from snapshot import write_atomic
+
+# Сколько дней хранить разобранные алерты (окно CME - 7 дней, базовые уровни - сутки)
+RETENTION_DAYS = 30
+
+# Тип алерта - по первому совпадению в product_id и тексте (порядок важен: CME первым)
+ALERT_KINDS = (
+    ('cme', re.compile(r'cme|coronal mass ejection', re.IGNORECASE)),
+    ('geomagnetic', re.compile(r'k-index|geomagnetic', re.IGNORECASE)),
+    ('xray', re.compile(r'x-ray', re.IGNORECASE)),
+    ('proton', re.compile(r'proton', re.IGNORECASE)),
+    ('radio', re.compile(r'radio', re.IGNORECASE)),
+)
+SPEED_PATTERN = re.compile(r'(\d{3,4})\s*km/s', re.IGNORECASE)
+
+
+class Alert:
+    """Разобранный алерт NOAA; время выпуска - секунды Unix (UTC)"""
+
+    __slots__ = ('key', 'kind', 'timestamp', 'date', 'time', 'speed', 'message')
+
+    def __init__(self, key: str, kind: str, timestamp: int, date: str, time: str, speed: int, message: str):
+        self.key = key
+        self.kind = kind
+        self.timestamp = timestamp
+        self.date = date
+        self.time = time
+        self.speed = speed
+        self.message = message
+
+    def to_row(self) -> List:
+        return [self.key, self.kind, self.timestamp, self.date, self.time, self.speed, self.message]
+
+
+def parse_alert(key: str, alert: Dict[str, Any], now: float) -> Optional[Alert]:
+    """Один разбор на алерт: тип, время выпуска, скорость CME, начало текста"""
+    issue_time = alert.get('issue_datetime') or ''
+    if not issue_time:
+        return None
+    message = (alert.get('message') or '').lower()
+    text = (alert.get('product_id') or '') + '\n' + message
+    kind = next((name for name, pattern in ALERT_KINDS if pattern.search(text)), 'other')
+
+    try:
+        # '2024-05-10 12:00:00.000', '2024-05-10T12:00:00', '2024-05-10T12:00:00Z'
+        issued = datetime.strptime(issue_time[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+        timestamp = int(issued.replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        timestamp = int(now)
+
+    speed = 0
+    if kind == 'cme':
+        match = SPEED_PATTERN.search(message)
+        if match:
+            speed = int(match.group(1))
+
+    return Alert(
+        key, kind, timestamp,
+        issue_time[:10],
+        issue_time[11:16] if len(issue_time) > 16 else '00:00',
+        speed,
+        message[:100] + '...' if len(message) > 100 else message,
+    )
+
+
+class AlertIndex:
+    """Постоянный индекс алертов NOAA с дедупликацией по product_id + issue_datetime
+
+    Разбираются только алерты, которых еще не было; по каждому типу время
+    выпуска хранится отсортированным, поэтому окно (например, 7 дней) -
+    двоичный поиск, а не просмотр всей ленты.
+
+    Ключ дедупликации хранится со временем, от которого отсчитывается срок
+    хранения (выпуск алерта или, для пропущенных, когда его увидели), и
+    удаляется вместе с алертами старше RETENTION_DAYS.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys: Dict[str, int] = {}
+        self.times: Dict[str, List[int]] = {}
+        self.alerts: Dict[str, List[Alert]] = {}
+        # Индекс изменился с последнего dump (его нужно сохранить)
+        self.dirty = False
+        self._load()
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.alerts.values())
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            for row in index['alerts']:
+                self._insert(Alert(*row))
+            for key, seen in index.get('skipped', []):
+                self.keys.setdefault(key, seen)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Индекс алертов: не удалось прочитать {self.path}: {e}")
+        self._prune(int(time.time()) - RETENTION_DAYS * 86400)
+
+    def _insert(self, alert: Alert):
+        self.keys[alert.key] = alert.timestamp
+        times = self.times.setdefault(alert.kind, [])
+        index = bisect.bisect_right(times, alert.timestamp)
+        times.insert(index, alert.timestamp)
+        self.alerts.setdefault(alert.kind, []).insert(index, alert)
+
+    def _prune(self, cutoff: int):
+        for kind, times in self.times.items():
+            index = bisect.bisect_left(times, cutoff)
+            if index:
+                del times[:index]
+                del self.alerts[kind][:index]
+        expired = [key for key, since in self.keys.items() if since < cutoff]
+        for key in expired:
+            del self.keys[key]
+        if expired:
+            self.dirty = True
+
+    def ingest(self, feed: List[Dict[str, Any]]) -> int:
+        """Добавляет новые алерты ленты; возвращает их число"""
+        now = time.time()
+        cutoff = int(now) - RETENTION_DAYS * 86400
+        added = 0
+        for alert in feed:
+            key = f"{alert.get('product_id', '')}|{alert.get('issue_datetime', '')}"
+            if key in self.keys:
+                continue
+            parsed = parse_alert(key, alert, now)
+            if parsed is not None and parsed.timestamp >= cutoff:
+                self._insert(parsed)
+                added += 1
+            else:
+                # Ключ запоминается и для пропущенных алертов, чтобы не разбирать их снова
+                self.keys[key] = int(now)
+            self.dirty = True
+        self._prune(cutoff)
+        return added
+
+    def window(self, kind: str, since: float, until: Optional[float] = None) -> List[Alert]:
+        """Алерты типа за [since, until], от новых к старым (как в ленте NOAA)"""
+        times = self.times.get(kind, [])
+        lo = bisect.bisect_left(times, since)
+        hi = len(times) if until is None else bisect.bisect_right(times, until)
+        return self.alerts[kind][lo:hi][::-1] if hi > lo else []
+
+    def dump(self) -> bytes:
+        """Содержимое файла индекса (собирается на event loop, пишется в потоке):
+        алерты и ключи пропущенных алертов, еще не вышедшие из срока хранения"""
+        rows = [alert.to_row() for items in self.alerts.values() for alert in items]
+        retained = {row[0] for row in rows}
+        skipped = [[key, since] for key, since in self.keys.items() if key not in retained]
+        self.dirty = False
+        return json.dumps({'alerts': rows, 'skipped': skipped}, ensure_ascii=False).encode('utf-8')
+
+    def save(self, payload: bytes):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_atomic(self.path, payload)
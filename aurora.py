@@ -0,0 +1,206 @@
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from snapshot import write_atomic
+
+# Сетка OVATION: 1° по долготе (0..359 в.д.) и широте (-90..90)
+LATITUDES = 181
+LONGITUDES = 360
+
+# Северный геомагнитный полюс (дипольное приближение IGRF)
+POLE_LAT = 80.7
+POLE_LON = -72.7
+
+# Экваториальная граница овала по Kp (геомагнитная широта): 66.5° - 2°·Kp;
+# ширина размытия границы и вероятность внутри овала для модели по Kp
+OVAL_BOUNDARY = 66.5
+OVAL_SHIFT_PER_KP = 2.0
+OVAL_EDGE = 1.5
+OVAL_PEAK = 90
+
+# Сияние на высоте 100-300 км видно у горизонта на несколько градусов к экватору
+# от места, где оно над головой: вес падает до половины на краю полосы
+VIEW_DEGREES = 5
+
+# Наукаст OVATION старше этого (сек) не используется - только модель по Kp
+OVATION_MAX_AGE = 2 * 3600
+
+# Сколько последних сеток держать на диске (для воркеров со старым снимком)
+KEEP_GRIDS = 4
+
+
+def magnetic_latitude() -> np.ndarray:
+    """Геомагнитная широта узлов сетки (градусы), дипольное приближение"""
+    lat = np.radians(np.arange(-90, 91, dtype=np.float64))[:, None]
+    lon = np.radians(np.arange(LONGITUDES, dtype=np.float64))[None, :]
+    pole_lat, pole_lon = np.radians(POLE_LAT), np.radians(POLE_LON)
+    sin_mlat = np.sin(lat) * np.sin(pole_lat) + np.cos(lat) * np.cos(pole_lat) * np.cos(lon - pole_lon)
+    return np.degrees(np.arcsin(np.clip(sin_mlat, -1.0, 1.0)))
+
+
+MAGNETIC_LATITUDE = np.abs(magnetic_latitude())
+
+
+def kp_grid(kp: float) -> np.ndarray:
+    """Вероятность (%) увидеть сияние по Kp: край овала, сдвинутый на полосу видимости"""
+    boundary = OVAL_BOUNDARY - OVAL_SHIFT_PER_KP * kp - VIEW_DEGREES
+    probability = OVAL_PEAK / (1.0 + np.exp(-(MAGNETIC_LATITUDE - boundary) / OVAL_EDGE))
+    return np.rint(probability).astype(np.uint8)
+
+
+def parse_ovation(payload: Dict[str, Any]) -> Tuple[np.ndarray, Optional[int]]:
+    """ovation_aurora_latest.json -> (вероятность сияния над головой, % [широта, долгота]; время наблюдения)
+
+    coordinates - список [долгота, широта, вероятность]; разбирается одним
+    преобразованием в массив, узлы раскладываются по индексам без цикла.
+    """
+    points = np.asarray(payload.get('coordinates') or [], dtype=np.float64).reshape(-1, 3)
+    grid = np.zeros((LATITUDES, LONGITUDES), dtype=np.uint8)
+    lon = np.rint(points[:, 0]).astype(np.int64) % LONGITUDES
+    lat = np.rint(points[:, 1]).astype(np.int64) + 90
+    inside = (lat >= 0) & (lat < LATITUDES)
+    grid[lat[inside], lon[inside]] = np.clip(np.rint(points[inside, 2]), 0, 100).astype(np.uint8)
+    return grid, parse_time(payload.get('Observation Time'))
+
+
+def load_ovation(body: bytes) -> Tuple[np.ndarray, Optional[int]]:
+    """Разбор ответа для HTTP-кэша: в памяти остается сетка 65 КБ, а не 65 тыс. списков"""
+    return parse_ovation(json.loads(body))
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        observed = datetime.strptime(value[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return int(observed.replace(tzinfo=timezone.utc).timestamp())
+
+
+def view_grid(overhead: np.ndarray) -> np.ndarray:
+    """Видимость у горизонта: максимум по полосе VIEW_DEGREES к полюсу от точки
+
+    Северное полушарие смотрит на север (к большим индексам широты), южное - на юг.
+    """
+    view = overhead.astype(np.float32)
+    north = np.arange(LATITUDES) >= 90
+    for distance in range(1, VIEW_DEGREES + 1):
+        weight = 1.0 - 0.5 * distance / VIEW_DEGREES
+        poleward = np.empty_like(view)
+        poleward[:-distance] = overhead[distance:]
+        poleward[-distance:] = overhead[-1]
+        equatorward = np.empty_like(view)
+        equatorward[distance:] = overhead[:-distance]
+        equatorward[:distance] = overhead[0]
+        shifted = np.where(north[:, None], poleward, equatorward)
+        np.maximum(view, shifted * weight, out=view)
+    return np.rint(view).astype(np.uint8)
+
+
+def build_grid(kp: float, ovation: Optional[Tuple[np.ndarray, Optional[int]]],
+               now: Optional[float] = None) -> 'AuroraGrid':
+    """Сетка вероятностей на снимок: наукаст OVATION (parse_ovation), если он свежий, иначе - модель по Kp
+
+    Источники не смешиваются: наукаст - наблюдение текущего овала, модель по Kp -
+    лишь его грубое приближение, и смесь сдвинула бы границу овала. Модель -
+    только замена устаревшему или пустому наукасту.
+    """
+    now = time.time() if now is None else now
+    if ovation is not None:
+        overhead, observed = ovation
+        if overhead.any() and (observed is None or now - observed <= OVATION_MAX_AGE):
+            return AuroraGrid(view_grid(overhead), 'ovation', observed, kp)
+    return AuroraGrid(kp_grid(kp), 'kp', None, kp)
+
+
+class AuroraGrid:
+    """Вероятность увидеть сияние (%) в узлах сетки 1°×1°; запрос точки - O(1)"""
+
+    __slots__ = ('grid', 'source', 'observed', 'kp', 'digest')
+
+    def __init__(self, grid: np.ndarray, source: str, observed: Optional[int], kp: float):
+        self.grid = grid
+        self.source = source
+        self.observed = observed
+        self.kp = float(kp)
+        self.digest = hashlib.sha256(grid.tobytes() + f'{source}|{observed}|{self.kp}'.encode()).hexdigest()
+
+    def lookup(self, lat: float, lon: float) -> int:
+        """Вероятность в ближайшем узле сетки"""
+        row = min(max(int(round(lat)) + 90, 0), LATITUDES - 1)
+        return int(self.grid[row, int(round(lon)) % LONGITUDES])
+
+    def lookup_many(self, lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+        """Пакетный запрос: индексы всех точек считаются одной операцией над массивами"""
+        rows = np.clip(np.rint(np.asarray(lats, dtype=np.float64)).astype(np.int64) + 90, 0, LATITUDES - 1)
+        cols = np.rint(np.asarray(lons, dtype=np.float64)).astype(np.int64) % LONGITUDES
+        return self.grid[rows, cols]
+
+    def summary(self) -> Dict[str, Any]:
+        """Раздел снимка: сама сетка не входит, только ссылка на нее"""
+        return {
+            'grid': self.digest,
+            'source': self.source,
+            'observed': datetime.fromtimestamp(self.observed, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            if self.observed is not None else None,
+            'kp': self.kp,
+            'max_probability': int(self.grid.max()),
+            'url': '/api/aurora',
+        }
+
+    def dump(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(buffer, grid=self.grid, meta=np.array([self.source, str(self.observed or ''), str(self.kp)]))
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, payload: bytes) -> 'AuroraGrid':
+        with np.load(io.BytesIO(payload)) as data:
+            source, observed, kp = data['meta'].tolist()
+            return cls(data['grid'], source, int(observed) if observed else None, float(kp))
+
+
+class AuroraStore:
+    """Сетки по хэшу на диске: воркеры без опроса NOAA берут сетку по ссылке из снимка"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.current: Optional[AuroraGrid] = None   # последняя построенная здесь сетка
+        self._loaded: Optional[AuroraGrid] = None   # последняя прочитанная с диска
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.npz")
+
+    def put(self, grid: AuroraGrid):
+        """Запись новой сетки (в потоке) и удаление старых, кроме KEEP_GRIDS последних"""
+        path = self.path_for(grid.digest)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            write_atomic(path, grid.dump())
+            files = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.npz')),
+                           key=lambda entry: entry.stat().st_mtime, reverse=True)
+            for entry in files[KEEP_GRIDS:]:
+                os.remove(entry.path)
+        self.current = grid
+
+    def get(self, digest: str) -> Optional[AuroraGrid]:
+        """Сетка по хэшу: из памяти или с диска"""
+        for grid in (self.current, self._loaded):
+            if grid is not None and grid.digest == digest:
+                return grid
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        try:
+            with open(self.path_for(digest), 'rb') as f:
+                self._loaded = AuroraGrid.load(f.read())
+        except (OSError, ValueError, KeyError):
+            return None
+        return self._loaded
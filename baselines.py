@@ -0,0 +1,230 @@
+import os
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+# Окна скользящих базовых уровней (дни): оборот Кэррингтона, месяц, год
+WINDOWS = (27, 30, 365)
+# Слотов по дням в кольцевом буфере (хватает на самое длинное окно)
+DAY_SLOTS = 366
+# Минимум отсчетов в окне, чтобы базовому уровню можно было доверять
+MIN_SAMPLES = 24
+
+# Метрики: диапазон и ширина интервала гистограммы (точность процентилей);
+# daily - одно значение в сутки (последнее за день замещает предыдущее)
+METRICS = {
+    'kp': {'low': 0.0, 'high': 9.0, 'width': 0.1, 'daily': False},
+    'wind': {'low': 200.0, 'high': 1200.0, 'width': 5.0, 'daily': False},
+    'flares': {'low': 0.0, 'high': 100.0, 'width': 1.0, 'daily': True},
+    'cme': {'low': 0.0, 'high': 50.0, 'width': 1.0, 'daily': True},
+}
+
+# Порядок бейджей по серьезности: бейдж сравнения только повышает бейдж раздела
+BADGE_ORDER = {'status-normal': 0, 'status-warning': 1, 'status-danger': 2}
+
+
+def compare(now: float, average: float) -> Dict[str, Any]:
+    """Отклонение от базового уровня в формате таблицы сравнения"""
+    difference = round(now - average, 1)
+    diff_percent = round(difference / average * 100) if average > 0 else 0
+    diff_percent = max(-999, min(999, diff_percent))
+    if difference > 0:
+        return {'difference': difference, 'dynamics': f'▲ +{diff_percent}%', 'dynamics_class': 'dyn-up'}
+    if difference < 0:
+        return {'difference': difference, 'dynamics': f'▼ {diff_percent}%', 'dynamics_class': 'dyn-down'}
+    return {'difference': difference, 'dynamics': '◆ 0%', 'dynamics_class': 'dyn-flat'}
+
+
+class RollingMetric:
+    """Скользящие среднее и процентили одной метрики по нескольким окнам
+
+    Отсчеты агрегируются по суткам (сумма, число, гистограмма); итоги окон
+    поддерживаются инкрементально: новый отсчет прибавляется, а сутки,
+    выходящие из окна, вычитаются - O(1) на отсчет без пересчета истории.
+    """
+
+    def __init__(self, name: str, low: float, high: float, width: float, daily: bool = False):
+        self.name = name
+        self.low = low
+        self.width = width
+        self.daily = daily
+        bins = int(round((high - low) / width)) + 1
+        self.slot_day = np.full(DAY_SLOTS, -1, dtype=np.int64)
+        self.slot_sum = np.zeros(DAY_SLOTS, dtype=np.float64)
+        self.slot_count = np.zeros(DAY_SLOTS, dtype=np.int64)
+        self.slot_hist = np.zeros((DAY_SLOTS, bins), dtype=np.int32)
+        self.slot_last = np.zeros(DAY_SLOTS, dtype=np.float64)
+        self.window_sum = np.zeros(len(WINDOWS), dtype=np.float64)
+        self.window_count = np.zeros(len(WINDOWS), dtype=np.int64)
+        self.window_hist = np.zeros((len(WINDOWS), bins), dtype=np.int64)
+        self.current_day = -1
+        self.watermark = -1  # время последнего учтенного отсчета (сек)
+
+    def _bin(self, value: float) -> int:
+        index = int((value - self.low) / self.width)
+        return min(max(index, 0), self.slot_hist.shape[1] - 1)
+
+    def _advance(self, day: int):
+        """Переход на новые сутки: вычитаем сутки, покинувшие каждое окно"""
+        start = max(self.current_day + 1, day - DAY_SLOTS + 1)
+        for new_day in range(start, day + 1):
+            for w, width in enumerate(WINDOWS):
+                leaving = new_day - width
+                slot = leaving % DAY_SLOTS
+                if leaving >= 0 and self.slot_day[slot] == leaving:
+                    self.window_sum[w] -= self.slot_sum[slot]
+                    self.window_count[w] -= self.slot_count[slot]
+                    self.window_hist[w] -= self.slot_hist[slot]
+            slot = new_day % DAY_SLOTS
+            self.slot_day[slot] = new_day
+            self.slot_sum[slot] = 0.0
+            self.slot_count[slot] = 0
+            self.slot_hist[slot] = 0
+        self.current_day = day
+
+    def _apply(self, day: int, value: float, sign: int):
+        slot = day % DAY_SLOTS
+        index = self._bin(value)
+        self.slot_sum[slot] += sign * value
+        self.slot_count[slot] += sign
+        self.slot_hist[slot, index] += sign
+        for w, width in enumerate(WINDOWS):
+            if day > self.current_day - width:
+                self.window_sum[w] += sign * value
+                self.window_count[w] += sign
+                self.window_hist[w, index] += sign
+
+    def add(self, timestamp: int, value: float):
+        if timestamp <= self.watermark or value != value:
+            return
+        day = timestamp // 86400
+        if day > self.current_day:
+            self._advance(day)
+        if day <= self.current_day - DAY_SLOTS or self.slot_day[day % DAY_SLOTS] != day:
+            return
+        slot = day % DAY_SLOTS
+        if self.daily and self.slot_count[slot]:
+            self._apply(day, self.slot_last[slot], -1)
+        self._apply(day, value, 1)
+        self.slot_last[slot] = value
+        self.watermark = timestamp
+
+    def stats(self, window: int) -> Optional[Dict[str, float]]:
+        """Среднее и процентили окна; None, пока данных слишком мало"""
+        w = WINDOWS.index(window)
+        count = int(self.window_count[w])
+        minimum = 1 if self.daily else MIN_SAMPLES
+        if count < minimum:
+            return None
+        cumulative = np.cumsum(self.window_hist[w])
+        result = {'mean': round(float(self.window_sum[w] / count), 2), 'samples': count}
+        for p in (10, 50, 90):
+            index = int(np.searchsorted(cumulative, count * p / 100.0))
+            # Нижняя граница интервала гистограммы, в который попал процентиль
+            result[f'p{p}'] = round(self.low + index * self.width, 2)
+        return result
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {
+            'slot_day': self.slot_day, 'slot_sum': self.slot_sum, 'slot_count': self.slot_count,
+            'slot_hist': self.slot_hist, 'slot_last': self.slot_last,
+            'window_sum': self.window_sum, 'window_count': self.window_count, 'window_hist': self.window_hist,
+            'current_day': np.array(self.current_day), 'watermark': np.array(self.watermark),
+        }
+
+    def restore(self, state) -> bool:
+        if state['slot_hist'].shape != self.slot_hist.shape or state['window_hist'].shape != self.window_hist.shape:
+            return False
+        for key in ('slot_day', 'slot_sum', 'slot_count', 'slot_hist', 'slot_last',
+                    'window_sum', 'window_count', 'window_hist'):
+            setattr(self, key, state[key].copy())
+        self.current_day = int(state['current_day'])
+        self.watermark = int(state['watermark'])
+        return True
+
+
+class Baselines:
+    """Скользящие базовые уровни метрик (27 дней, 30 дней, год) с сохранением на диск
+
+    Состояние каждой метрики занимает фиксированный объем и читается при
+    старте целиком, поэтому перезапуск не требует пересчета архива.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.metrics: Dict[str, RollingMetric] = {}
+        self._lock = threading.Lock()
+        for name, params in METRICS.items():
+            metric = RollingMetric(name, **params)
+            self._load(metric)
+            self.metrics[name] = metric
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def _load(self, metric: RollingMetric):
+        path = self._path(metric.name)
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path) as state:
+                if not metric.restore(state):
+                    print(f"⚠️ Базовый уровень {metric.name}: формат изменился, начинаем заново")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Базовый уровень {metric.name}: не удалось прочитать {path}: {e}")
+
+    def save(self, name: str):
+        """Атомарная запись состояния метрики"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp_path = path + '.tmp.npz'
+        with self._lock:
+            np.savez(tmp_path, **self.metrics[name].state())
+        os.replace(tmp_path, path)
+
+    def watermark(self, name: str) -> int:
+        return self.metrics[name].watermark
+
+    def update(self, name: str, times: np.ndarray, values: np.ndarray) -> int:
+        """Учитывает отсчеты новее водяного знака (время - секунды Unix); возвращает их число"""
+        metric = self.metrics[name]
+        added = 0
+        with self._lock:
+            for timestamp, value in zip(np.asarray(times, dtype=np.int64).tolist(),
+                                        np.asarray(values, dtype=np.float64).tolist()):
+                if timestamp > metric.watermark:
+                    metric.add(timestamp, value)
+                    added += 1
+        return added
+
+    def stats(self, name: str, window: int = 30) -> Optional[Dict[str, float]]:
+        with self._lock:
+            return self.metrics[name].stats(window)
+
+    def average(self, name: str, default: float, window: int = 30) -> float:
+        """Среднее за окно или значение по умолчанию, пока базовый уровень не накоплен"""
+        stats = self.stats(name, window)
+        return stats['mean'] if stats else default
+
+    def badge(self, name: str, now: float, default: str, window: int = 30) -> str:
+        """Бейдж сравнения: бейдж раздела, повышенный до warning, если значение выше p90 окна
+
+        Метрики односторонние (бури, вспышки, выбросы, быстрый ветер): низкие
+        значения - спокойные дни, а не отклонение. Бейдж раздела (например,
+        danger при Kp >= 7) только повышается, но не понижается.
+        """
+        stats = self.stats(name, window)
+        if stats is None:
+            return default
+        # p90 - нижняя граница интервала, поэтому сравниваем с его верхней границей
+        if now >= stats['p90'] + self.metrics[name].width:
+            return max(default, 'status-warning', key=lambda badge: BADGE_ORDER.get(badge, 0))
+        return default
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Все окна всех метрик - для снимка"""
+        return {name: {str(window): self.stats(name, window) for window in WINDOWS} for name in self.metrics}
+
+    def compare(self, name: str, now: float, default: float, window: int = 30) -> Tuple[float, Dict[str, Any]]:
+        average = self.average(name, default, window)
+        return average, compare(now, average)
@@ -0,0 +1,105 @@
+"""Индексы геоэффективности по неделе минутных данных RTSW: цикл Python против coupling.py
+
+На каждом обновлении пересчитывается вся сетка: разбор time_tag и слияние
+двух продуктов (resample.py) плюс функция Ньюэлла, давление, Ey, скользящие
+окна и длительности южного Bz (coupling.py).
+
+Запуск из корня проекта:  python -m benchmarks.bench_coupling
+"""
+import math
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from coupling import analyze, NEWELL_WINDOW, EY_WINDOW, PRESSURE_FACTOR
+from resample import feed_columns, align
+from fetcher import RTSW_FIELDS
+
+DAY_MINUTES = 24 * 60
+
+
+def make_feeds(minutes: int):
+    """Синтетические rtsw_wind_1m / rtsw_mag_1m (от новых к старым, как у NOAA) с редкими пропусками"""
+    random.seed(minutes)
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    wind, mag = [], []
+    for i in range(minutes):
+        tag = (now - timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S')
+        if random.random() > 0.01:
+            wind.append({'time_tag': tag, 'active': True, 'source': 'ACE',
+                         'proton_speed': 450 + 150 * math.sin(i / 900) + random.uniform(-10, 10),
+                         'proton_density': 5 + 3 * math.cos(i / 400), 'proton_temperature': 80000.0})
+        if random.random() > 0.01:
+            mag.append({'time_tag': tag, 'active': True, 'source': 'ACE', 'bt': 8.0,
+                        'bx_gsm': 1.0, 'by_gsm': 4 * math.sin(i / 50), 'bz_gsm': 8 * math.sin(i / 300)})
+    return wind, mag
+
+
+def loop_indices(wind, mag):
+    """Прямолинейный вариант: словарь по минутам и проход циклом с очередями окон"""
+    def minute(tag):
+        return int(datetime.strptime(tag[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+
+    plasma = {minute(item['time_tag']): item for item in wind}
+    field = {minute(item['time_tag']): item for item in mag}
+    newell_window, ey_window = deque(), deque()
+    south = 0
+    last = None
+    for t in range(min(min(plasma), min(field)), max(max(plasma), max(field)) + 60, 60):
+        p, b = plasma.get(t), field.get(t)
+        if p is None or b is None:
+            south = 0
+            continue
+        v, by, bz = p['proton_speed'], b['by_gsm'], b['bz_gsm']
+        theta = math.atan2(by, bz)
+        newell = v ** (4 / 3) * math.hypot(by, bz) ** (2 / 3) * abs(math.sin(theta / 2)) ** (8 / 3)
+        for window, size, value in ((newell_window, NEWELL_WINDOW, newell), (ey_window, EY_WINDOW, -v * bz * 1e-3)):
+            window.append((t, value))
+            while window[0][0] <= t - size * 60:
+                window.popleft()
+        south = south + 1 if bz < 0 else 0
+        last = {
+            'newell': round(newell),
+            'newell_1h': round(sum(value for _, value in newell_window) / len(newell_window)),
+            'pressure': round(PRESSURE_FACTOR * p['proton_density'] * v * v, 2),
+            'ey_3h': round(sum(value for _, value in ey_window) / len(ey_window), 2),
+            'south_minutes': south,
+        }
+    return last
+
+
+def vector_indices(wind, mag):
+    frame = align({'proton': feed_columns(wind, RTSW_FIELDS['proton']),
+                   'bz_gms': feed_columns(mag, RTSW_FIELDS['bz_gms'])})
+    return frame, analyze(frame)
+
+
+def best_of(fn, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    print(f"{'days':>5} {'minutes':>8} {'loop, ms':>10} {'numpy, ms':>10} {'indices, ms':>12} {'speedup':>8}")
+    for days in (1, 7, 30):
+        wind, mag = make_feeds(days * DAY_MINUTES)
+        frame, result = vector_indices(wind, mag)
+        expected = loop_indices(wind, mag)
+        # Короткие пропуски на сетке заполнены, поэтому сравниваются значения последней минуты
+        assert expected['newell'] == result['newell'] and expected['pressure'] == result['pressure']
+
+        loop = best_of(loop_indices, wind, mag)
+        vector = best_of(vector_indices, wind, mag)
+        # Только индексы по готовой сетке (ответ 304 по одному из продуктов)
+        indices = best_of(analyze, frame)
+        print(f"{days:>5} {frame.time.size:>8} {loop * 1000:>10.1f} {vector * 1000:>10.1f} "
+              f"{indices * 1000:>12.2f} {loop / vector:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Конвейер вспышек get_flare_data (xray_columns + FlareDetector) против прежнего цикла
+
+Прежний вариант: разбор каждой записи xrays-*.json в цикле и пошаговый
+детектор (отсчет за отсчетом). Текущий: столбцы numpy (xray.py) и поиск
+начала, пика и конца событий операциями над массивами (flares.py).
+Отдельно - детектор по готовым столбцам (бэкфилл из архива).
+
+Запуск из корня проекта:  python -m benchmarks.bench_flares
+"""
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from flares import FlareDetector, RISE_SAMPLES, RISE_RATIO, START_THRESHOLD, MAX_GAP
+from xray import xray_columns, BAND_LONG
+
+FLARES_PER_DAY = 12
+
+
+def make_records(n: int, now: datetime):
+    """Синтетический xrays-*.json: два канала, шаг 1 минута
+
+    Длинный канал - фон B-C с шумом и вспышки (около FLARES_PER_DAY в сутки,
+    как на активном Солнце): линейный рост за 5-15 минут на 0.3-2.5 порядка
+    и экспоненциальный спад.
+    """
+    random.seed(n)
+    start = now - timedelta(minutes=n // 2)
+    records = []
+    background = -6.5
+    flare = None  # (минута начала, длительность роста, амплитуда в порядках, время спада)
+    for i in range(n):
+        minute = i // 2
+        if i % 2 == 0:
+            background = min(-5.5, max(-7.5, background + random.gauss(0, 0.01)))
+            if flare is None and random.random() < FLARES_PER_DAY / 1440:
+                flare = (minute, random.randint(5, 15), random.uniform(0.3, 2.5), random.uniform(10, 40))
+            boost = 0.0
+            if flare is not None:
+                began, rise, amplitude, tau = flare
+                age = minute - began
+                boost = amplitude * age / rise if age <= rise else amplitude * math.exp(-(age - rise) / tau)
+                if age > rise and boost < 0.01:
+                    flare = None
+            level = background + boost + random.gauss(0, 0.005)
+        records.append({
+            'time_tag': (start + timedelta(minutes=minute)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'flux': 10 ** level if i % 2 == 0 else 10 ** (level - 1),
+            'energy': '0.1-0.8nm' if i % 2 == 0 else '0.05-0.4nm',
+        })
+    return records
+
+
+class LoopDetector(FlareDetector):
+    """Прежний детектор: шаг Python на каждый отсчет (эталон для сверки)"""
+
+    def feed(self, samples):
+        for t, f in samples:
+            self._step(t, f)
+
+    def _step(self, t: int, f: float):
+        if self._rise and t - self._rise[-1][0] > MAX_GAP:
+            self._rise = []
+        if self.active is not None:
+            event = self.active
+            if f > event['peak_flux']:
+                event['peak_flux'] = f
+                event['peak'] = t
+            elif f <= (event['peak_flux'] + event['start_flux']) / 2:
+                event['end'] = t
+                self._finish(event)
+                self.active = None
+                self._rise = [(t, f)]
+            return
+        if self._rise and f <= self._rise[-1][1]:
+            self._rise = []
+        if f < START_THRESHOLD:
+            self._rise = []
+            return
+        self._rise.append((t, f))
+        if len(self._rise) == RISE_SAMPLES:
+            start_t, start_f = self._rise[0]
+            if f >= start_f * RISE_RATIO:
+                self.active = {'start': start_t, 'start_flux': start_f, 'peak': t, 'peak_flux': f, 'end': None}
+                self._rise = []
+            else:
+                self._rise.pop(0)
+
+
+def loop_pipeline(records, now: datetime):
+    """Прежний get_flare_data: разбор записей в цикле и пошаговый детектор"""
+    samples = []
+    for item in records:
+        if item.get('energy') != '0.1-0.8nm':
+            continue
+        flux = item.get('flux')
+        if flux is None or math.isnan(flux):
+            continue
+        try:
+            when = datetime.fromisoformat(item['time_tag'].replace('Z', '+00:00'))
+        except (KeyError, ValueError):
+            continue
+        samples.append((int(when.timestamp()), flux))
+    samples.sort(key=lambda sample: sample[0])
+    detector = LoopDetector(keep_days=10_000)
+    detector.feed(samples)
+    return detector, detector.summary(now)
+
+
+def shipped_pipeline(records, now: datetime):
+    """Текущий get_flare_data: xray_columns + FlareDetector.update"""
+    detector = FlareDetector(keep_days=10_000)
+    detector.update(xray_columns(records))
+    return detector, detector.summary(now)
+
+
+def detect_columns(columns, now: datetime):
+    detector = FlareDetector(keep_days=10_000)
+    detector.update(columns)
+    return detector.summary(now)
+
+
+def detect_loop(samples, now: datetime):
+    detector = LoopDetector(keep_days=10_000)
+    detector.feed(samples)
+    return detector.summary(now)
+
+
+def best_of(fn, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    print(f"{'samples':>10} {'events':>7} {'loop, ms':>10} {'numpy, ms':>10} {'speedup':>8} "
+          f"{'loop det, ms':>13} {'numpy det, ms':>14} {'speedup':>8}")
+    for n in (10_000, 100_000, 1_000_000):
+        records = make_records(n, now)
+        loop_detector, _ = loop_pipeline(records, now)
+        detector, summary = shipped_pipeline(records, now)
+        assert loop_detector.events == detector.events and loop_detector.active == detector.active
+
+        loop = best_of(loop_pipeline, records, now)
+        vector = best_of(shipped_pipeline, records, now)
+        # Только детектор по готовым столбцам (бэкфилл из архива, без разбора JSON)
+        columns = xray_columns(records)
+        long_band = columns['band'] == BAND_LONG
+        samples = list(zip(columns['time'][long_band].astype(np.int64).tolist(),
+                           columns['flux'][long_band].tolist()))
+        loop_detect = best_of(detect_loop, samples, now)
+        vector_detect = best_of(detect_columns, columns, now)
+        print(f"{n:>10} {len(detector.events):>7} {loop * 1000:>10.1f} {vector * 1000:>10.1f} "
+              f"{loop / vector:>7.1f}x {loop_detect * 1000:>13.1f} {vector_detect * 1000:>14.2f} "
+              f"{loop_detect / vector_detect:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Память на снимок: списки словарей с дублирующими ключами против records.py
+
+Для каждого варианта в отдельном процессе строятся снимки с недельными
+историями (минутные ряды Kp и ветра, сотни событий) и держатся в памяти;
+измеряются прирост RSS и выделения Python (tracemalloc) на снимок, а также
+размер сериализованного тела.
+
+Запуск из корня проекта:  python -m benchmarks.bench_memory [снимков]
+"""
+import gc
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from records import PointSeries, FlareEvent, CmeEvent
+from snapshot import Snapshot
+
+WEEK_MINUTES = 7 * 24 * 60
+FLARES = 300
+CMES = 100
+
+
+def rss_kb() -> int:
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+
+
+def samples(seed: int):
+    random.seed(seed)
+    now = int(time.time()) // 60 * 60
+    times = [now - (WEEK_MINUTES - i) * 60 for i in range(WEEK_MINUTES)]
+    kp = [round(random.uniform(0, 9), 2) for _ in times]
+    wind = [round(random.uniform(300, 800), 1) for _ in times]
+    flares = [(now - random.randrange(7 * 86400), round(10 ** random.uniform(-6, -3.5), 9)) for _ in range(FLARES)]
+    cmes = [(now - random.randrange(7 * 86400), random.randrange(300, 2000)) for _ in range(CMES)]
+    return times, kp, wind, flares, cmes
+
+
+def legacy_data(seed: int):
+    """Прежнее представление: списки словарей и их копии под ключами-псевдонимами"""
+    times, kp, wind, flares, cmes = samples(seed)
+    hour = lambda t: datetime.fromtimestamp(t).strftime('%H:00')
+    clock = lambda t: datetime.fromtimestamp(t, timezone.utc).strftime('%H:%M:%S')
+    kp_section = {'history': list(kp), 'history_formatted': [{'label': hour(t), 'value': v} for t, v in zip(times, kp)]}
+    wind_section = {'history': [{'time': clock(t), 'speed': v} for t, v in zip(times, wind)]}
+    flare_events = []
+    for peak, flux in flares:
+        peak_time = datetime.fromtimestamp(peak, timezone.utc)
+        flare_events.append({
+            'date': peak_time.strftime('%Y-%m-%d'), 'time': peak_time.strftime('%H:%M'), 'class': 'M',
+            'class_full': 'M1.0', 'flux': flux, 'start': peak_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'peak': peak_time.strftime('%Y-%m-%dT%H:%M:%SZ'), 'end': peak_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+    cme_events = [{'date': datetime.fromtimestamp(t).strftime('%Y-%m-%d'),
+                   'time': datetime.fromtimestamp(t).strftime('%H:%M'), 'speed': speed,
+                   'message': 'cme detected, coronal mass ejection with speed %d km/s' % speed} for t, speed in cmes]
+    return {
+        'kp': kp_section, 'solar_wind': wind_section,
+        'flares': {'events': flare_events}, 'cme': {'events': cme_events},
+        'kpHistoryFormatted': kp_section['history_formatted'], 'windHistory': wind_section['history'],
+        'flareEvents': flare_events,
+    }
+
+
+def compact_data(seed: int):
+    """records.py: параллельные массивы и записи со __slots__, без псевдонимов"""
+    times, kp, wind, flares, cmes = samples(seed)
+    kp_history = PointSeries(times, kp, label_format='%H:00', utc=False)
+    wind_history = PointSeries(times, wind, label_key='time', value_key='speed', label_format='%H:%M:%S')
+    flare_events = [FlareEvent(peak, peak, peak, flux, 'M1.0') for peak, flux in flares]
+    cme_events = []
+    for t, speed in cmes:
+        local = datetime.fromtimestamp(t)
+        cme_events.append(CmeEvent(local.strftime('%Y-%m-%d'), local.strftime('%H:%M'), speed,
+                                   'cme detected, coronal mass ejection with speed %d km/s' % speed))
+    return {
+        'kp': {'history': kp_history.values, 'history_formatted': kp_history},
+        'solar_wind': {'history': wind_history},
+        'flares': {'events': flare_events}, 'cme': {'events': cme_events},
+    }
+
+
+def measure(variant: str, count: int):
+    """Дочерний процесс: строит count снимков и печатает метрики одной строкой"""
+    build = legacy_data if variant == 'dicts' else compact_data
+    gc.collect()
+    base_rss = rss_kb()
+    kept = [Snapshot(build(seed)) for seed in range(count)]
+    gc.collect()
+    rss_per_snapshot = (rss_kb() - base_rss) / count
+
+    # Разбивка одного снимка: данные разделов и готовые байты (тело, разделы, gzip)
+    tracemalloc.start()
+    data = build(count)
+    data_bytes = tracemalloc.get_traced_memory()[0]
+    snapshot = Snapshot(data)
+    total = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{variant:>8} {rss_per_snapshot:>14.0f} {data_bytes / 1024:>13.0f} "
+          f"{total / 1024:>16.0f} {len(snapshot.body) / 1024:>10.0f}")
+    return kept
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    print(f"Снимков: {count}, история: {WEEK_MINUTES} точек на ряд, событий: {FLARES + CMES}")
+    print(f"{'variant':>8} {'RSS, KB/snap':>14} {'data, KB':>13} {'+encoded, KB':>16} {'body, KB':>10}")
+    for variant in ('dicts', 'records'):
+        subprocess.run([sys.executable, '-c', f'from benchmarks.bench_memory import measure; '
+                                              f'measure({variant!r}, {count})'], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
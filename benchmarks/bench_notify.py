@@ -0,0 +1,147 @@
+"""Нагрузочный тест рассылки уведомлений (notify.py) на 100 тыс. подписчиков
+
+Поднимает отдельный процесс-заглушку Telegram Bot API (sendMessage), которая
+отвечает 429 (retry_after) и 500 на небольшую долю запросов и считает
+доставленные сообщения по чатам. Подписки пишутся в журнал во временном
+каталоге, правило Kp≥5 срабатывает на синтетическом снимке; измеряются
+постановка в очередь, время и скорость доставки, повторы и память.
+Общий лимит отправки снят (rate=0): замеряется пропускная способность
+самого диспетчера, а не лимит Telegram.
+
+Запуск из корня проекта:  python -m benchmarks.bench_notify [N ...]
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from notify import Notifier, GLOBAL_RATE
+
+PORT = 8792
+BASE = f"http://127.0.0.1:{PORT}"
+TOKEN = 'bench'
+# Доля ответов 429 и 500 заглушки
+RATE_LIMITED = 0.01
+SERVER_ERRORS = 0.01
+
+
+def serve():
+    """Заглушка Bot API: sendMessage со сбоями и счетчик доставок по чатам"""
+    from aiohttp import web
+
+    delivered = {}
+    counters = {'requests': 0, '429': 0, '500': 0}
+
+    async def send_message(request):
+        payload = await request.json()
+        counters['requests'] += 1
+        roll = random.random()
+        if roll < RATE_LIMITED:
+            counters['429'] += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}},
+                                     status=429)
+        if roll < RATE_LIMITED + SERVER_ERRORS:
+            counters['500'] += 1
+            return web.json_response({'ok': False, 'error_code': 500}, status=500)
+        chat_id = payload['chat_id']
+        delivered[chat_id] = delivered.get(chat_id, 0) + 1
+        return web.json_response({'ok': True, 'result': {'message_id': counters['requests']}})
+
+    async def stats(request):
+        duplicates = sum(1 for count in delivered.values() if count > 1)
+        return web.json_response(dict(counters, chats=len(delivered), duplicates=duplicates))
+
+    async def reset(request):
+        delivered.clear()
+        for key in counters:
+            counters[key] = 0
+        return web.json_response({'ok': True})
+
+    app = web.Application()
+    app.router.add_post(f'/bot{TOKEN}/sendMessage', send_message)
+    app.router.add_get('/stats', stats)
+    app.router.add_post('/reset', reset)
+    web.run_app(app, host='127.0.0.1', port=PORT, print=None, backlog=4096)
+
+
+def rss_kb() -> int:
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+
+
+def snapshot():
+    """Снимок с бурей Kp 6.3: срабатывает правило Kp≥5"""
+    return {
+        'kpIndex': 6.3,
+        'solar_wind': {'speed': 720.0},
+        'geomagnetic': {'bz': -14.2, 'bt': 18.5},
+        'sun': {'sunspot_number': 142},
+        'cmeCount': 3,
+        'flareCount': 12,
+        'flares': {'strongest_class': 'M5.1'},
+    }
+
+
+async def run(n: int, workers: int = 64):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{BASE}/reset"):
+            pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            notifier = Notifier(directory, token=TOKEN, api=BASE, workers=workers, rate=0)
+            random.seed(n)
+            records = [{'op': 'add', 'chat_id': 10_000_000 + i, 'username': f'@user{i}',
+                        'events': random.sample(['CME', 'X-вспышка', 'Ежедневно'], 1) + ['Kp≥5'],
+                        'token': f'{i:032x}', 'created': 0} for i in range(n)]
+            base_rss = rss_kb()
+            started = time.perf_counter()
+            await asyncio.to_thread(notifier.store.append, records)
+            load_s = time.perf_counter() - started
+            store_kb = rss_kb() - base_rss
+            del records
+
+            await notifier.start()
+            started = time.perf_counter()
+            recipients = await notifier.evaluate(snapshot())
+            enqueue_ms = (time.perf_counter() - started) * 1000
+            await notifier.dispatcher.wait_idle()
+            deliver_s = time.perf_counter() - started
+            stats = notifier.dispatcher.summary()
+            await notifier.stop()
+
+        async with session.get(f"{BASE}/stats") as r:
+            server = await r.json()
+
+    assert recipients == n, recipients
+    assert server['chats'] == n and server['duplicates'] == 0, server
+    assert stats['failed'] == 0, stats
+    print(f"{n:>7} {load_s:>7.2f} {store_kb / 1024:>9.1f} {enqueue_ms:>11.0f} {deliver_s:>10.1f} "
+          f"{n / deliver_s:>9.0f} {server['requests']:>9} {stats['rate_limited']:>6} {stats['retried']:>8}")
+    return deliver_s
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    server = subprocess.Popen([sys.executable, '-c', 'from benchmarks.bench_notify import serve; serve()'], env=env)
+    try:
+        time.sleep(2)
+        print(f"{'subs':>7} {'load,s':>7} {'store,MB':>9} {'enqueue,ms':>11} {'deliver,s':>10} "
+              f"{'msg/s':>9} {'requests':>9} {'429':>6} {'retries':>8}")
+        for n in sizes:
+            asyncio.run(run(n))
+        n = sizes[-1]
+        print(f"\nС лимитом Telegram ({GLOBAL_RATE:.0f} сообщений/с) рассылка {n} подписчикам "
+              f"займет около {n / GLOBAL_RATE / 60:.0f} мин")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Нагрузочный тест push-канала (PushHub, Server-Sent Events)
+
+Поднимает отдельный процесс uvicorn с тем же PushHub, что и /api/events,
+открывает N одновременных подписок и измеряет задержку доставки
+(от publish до получения каждым клиентом), время рассылки на сервере
+(от publish до записи кадра в сокет последнего подписчика) и память
+сервера на соединение.
+
+Цель: рассылка на сервере - не больше TARGET_US_PER_SUBSCRIBER мкс на
+подписчика (5000 подписчиков - 200 мс). Клиенты работают в этом же
+процессе бенчмарка: на одном ядре их разбор входит в задержку доставки.
+
+Запуск из корня проекта:  python -m benchmarks.bench_push [N ...]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+PORT = 8791
+BASE = f"http://127.0.0.1:{PORT}"
+TARGET_US_PER_SUBSCRIBER = 40
+
+
+def serve():
+    """Серверная часть: минимальное приложение только с push-каналом"""
+    import uvicorn
+    from fastapi import FastAPI
+    from starlette.requests import Request
+    from push import PushHub
+
+    app = FastAPI()
+    hub = PushHub()
+
+    @app.get("/events")
+    async def events(request: Request):
+        return hub.response(request)
+
+    @app.post("/publish")
+    async def publish():
+        target = hub.delivered + hub.subscribers
+        started = time.perf_counter()
+        hub.publish({'live': f'"v{hub.generation + 1}"'})
+        while hub.delivered < target:
+            await asyncio.sleep(0)
+        return dict(hub.stats, fanout_ms=(time.perf_counter() - started) * 1000)
+
+    @app.get("/stats")
+    async def stats():
+        with open('/proc/self/status') as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+        return dict(hub.stats, rss_kb=rss_kb)
+
+    uvicorn.run(app, host='127.0.0.1', port=PORT, log_level='warning', backlog=4096)
+
+
+async def subscriber(session, ready: asyncio.Event, connected: list, latencies: list, rounds: int):
+    async with session.get(f"{BASE}/events") as resp:
+        connected.append(1)
+        received = 0
+        async for line in resp.content:
+            if not line.startswith(b'data: '):
+                continue
+            sent_at = float(line.split(b'"sent_at":')[1].split(b'}')[0].split(b',')[0])
+            if ready.is_set():
+                latencies.append(time.time() - sent_at)
+                received += 1
+                if received >= rounds:
+                    return
+
+
+async def run(n: int, rounds: int = 5):
+    connector = aiohttp.TCPConnector(limit=0, force_close=True)
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async with session.get(f"{BASE}/stats") as r:
+            base_rss = (await r.json())['rss_kb']
+
+        ready = asyncio.Event()
+        connected, latencies = [], []
+        tasks = [asyncio.create_task(subscriber(session, ready, connected, latencies, rounds)) for _ in range(n)]
+        started = time.perf_counter()
+        while len(connected) < n:
+            await asyncio.sleep(0.05)
+        connect_s = time.perf_counter() - started
+        await asyncio.sleep(0.5)
+
+        async with session.get(f"{BASE}/stats") as r:
+            stats = await r.json()
+        per_conn_kb = (stats['rss_kb'] - base_rss) / n
+
+        ready.set()
+        fanout, server_ms = [], []
+        for i in range(rounds):
+            before = len(latencies)
+            t0 = time.perf_counter()
+            async with session.post(f"{BASE}/publish") as r:
+                server_ms.append((await r.json())['fanout_ms'])
+            while len(latencies) < before + n:
+                await asyncio.sleep(0.001)
+            fanout.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.2)
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    ms = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    server = sorted(server_ms)[len(server_ms) // 2]
+    target = n * TARGET_US_PER_SUBSCRIBER / 1000
+    print(f"{n:>7} {connect_s:>9.1f} {stats['subscribers']:>7} {per_conn_kb:>9.1f} "
+          f"{ms(0.5):>8.1f} {ms(0.99):>8.1f} {ms(1.0):>8.1f} {min(fanout) * 1000:>10.1f} "
+          f"{server:>10.1f} {target:>9.0f} {'да' if server <= target else 'нет':>4}")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    server = subprocess.Popen([sys.executable, '-c', 'from benchmarks.bench_push import serve; serve()'], env=env)
+    try:
+        time.sleep(2)
+        print(f"{'subs':>7} {'connect,s':>9} {'active':>7} {'KB/conn':>9} "
+              f"{'p50, ms':>8} {'p99, ms':>8} {'max, ms':>8} {'fanout, ms':>10} "
+              f"{'server, ms':>10} {'target':>9} {'ok':>4}")
+        for n in sizes:
+            asyncio.run(run(n))
+            time.sleep(1)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import numpy as np
+from typing import Dict, Any, Optional
+
+from resample import AlignedFrame
+
+# Масса протона (кг): давление в нПа = PROTON_MASS * n[см⁻³]·10⁶ * (V[км/с]·10³)² * 10⁹
+PROTON_MASS = 1.6726e-27
+PRESSURE_FACTOR = PROTON_MASS * 1e6 * 1e6 * 1e9
+
+# Скользящие окна (минуты сетки): функция Ньюэлла - час, Ey - 3 часа
+NEWELL_WINDOW = 60
+EY_WINDOW = 180
+
+# Пороги бурь по длительности южного Bz (Gonzalez & Tsurutani, 1987; Gonzalez et al., 1994):
+# умеренная - Bz <= -5 нТл не менее 2 часов, сильная - Bz <= -10 нТл не менее 3 часов
+SOUTHWARD_LEVELS = (
+    ('danger', -10.0, 180),
+    ('warning', -5.0, 120),
+)
+# Часовое среднее функции Ньюэлла, (км/с)^4/3·нТл^2/3: в спокойном ветре - единицы тысяч
+NEWELL_WARNING = 10000.0
+NEWELL_DANGER = 20000.0
+# Динамическое давление (нПа): сжатие магнитосферы, внезапное начало бури
+PRESSURE_WARNING = 10.0
+
+LEVEL_ORDER = {'normal': 0, 'warning': 1, 'danger': 2}
+
+
+def newell_coupling(speed: np.ndarray, by: np.ndarray, bz: np.ndarray) -> np.ndarray:
+    """dΦ/dt = V^4/3 · B_T^2/3 · sin^8/3(θ/2), B_T = √(By²+Bz²), θ = atan2(By, Bz)"""
+    bt = np.hypot(by, bz)
+    theta = np.arctan2(by, bz)
+    return np.power(speed, 4 / 3) * np.power(bt, 2 / 3) * np.power(np.abs(np.sin(theta / 2)), 8 / 3)
+
+
+def dynamic_pressure(density: np.ndarray, speed: np.ndarray) -> np.ndarray:
+    """Pdyn = m_p·n·V² (нПа), только протоны"""
+    return PRESSURE_FACTOR * density * speed * speed
+
+
+def electric_field(speed: np.ndarray, bz: np.ndarray) -> np.ndarray:
+    """Ey = -V·Bz (мВ/м): положителен при южном Bz"""
+    return -speed * bz * 1e-3
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее по window последним точкам без пропусков - O(n) через накопленные суммы"""
+    present = ~np.isnan(values)
+    total = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    count = np.concatenate(([0], np.cumsum(present)))
+    # Окно точки i - (i-window, i]; в начале ряда окно неполное
+    end = np.arange(1, values.size + 1)
+    start = np.maximum(end - window, 0)
+    total = total[end] - total[start]
+    count = count[end] - count[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def run_length(mask: np.ndarray) -> np.ndarray:
+    """Длина непрерывной серии True, заканчивающейся в каждой точке - O(n)"""
+    index = np.arange(mask.size)
+    last_break = np.maximum.accumulate(np.where(mask, -1, index))
+    return index - last_break
+
+
+def analyze(frame: AlignedFrame) -> Optional[Dict[str, Any]]:
+    """Индексы геоэффективности по всей сетке RTSW и оценка для последней минуты
+
+    Ряды считаются целиком (для графиков и окон), в ответ попадают последние
+    значения, скользящие средние и длительности южного Bz.
+    """
+    required = ('proton_speed', 'proton_density', 'by_gsm', 'bz_gsm')
+    if not all(name in frame for name in required):
+        return None
+    speed = frame.columns['proton_speed']
+    bz = frame.columns['bz_gsm']
+    newell = newell_coupling(speed, frame.columns['by_gsm'], bz)
+    pressure = dynamic_pressure(frame.columns['proton_density'], speed)
+    ey = electric_field(speed, bz)
+
+    # Последняя минута, где есть и плазма, и поле
+    complete = np.flatnonzero(~np.isnan(newell))
+    if not complete.size:
+        return None
+    last = complete[-1]
+    # Давление - по своей последней точке: плотности в ту же минуту может не быть
+    measured_pressure = np.flatnonzero(~np.isnan(pressure))
+
+    newell_hour = rolling_mean(newell, NEWELL_WINDOW)
+    ey_mean = rolling_mean(ey, EY_WINDOW)
+    # Пропуск прерывает серию: отсутствие данных не считается южным Bz
+    south = {threshold: run_length(bz <= threshold) for _, threshold, _ in SOUTHWARD_LEVELS}
+    south[0.0] = run_length(bz < 0)
+
+    result = {
+        'time': int(frame.time[last]),
+        'newell': round(float(newell[last])),
+        'newell_1h': round(float(newell_hour[last])),
+        'pressure': round(float(pressure[measured_pressure[-1]]), 2) if measured_pressure.size else None,
+        'ey': round(float(ey[last]), 2),
+        'ey_3h': round(float(ey_mean[last]), 2),
+        'south_minutes': int(south[0.0][last]),
+        'south5_minutes': int(south[-5.0][last]),
+        'south10_minutes': int(south[-10.0][last]),
+        'level': 'normal',
+        'reasons': [],
+    }
+
+    for level, threshold, minutes in SOUTHWARD_LEVELS:
+        if south[threshold][last] >= minutes:
+            raise_level(result, level, f"Bz ≤ {threshold:.0f} нТл {south[threshold][last] // 60} ч")
+            break
+    if result['newell_1h'] >= NEWELL_DANGER:
+        raise_level(result, 'danger', "очень сильная связь ветра с магнитосферой")
+    elif result['newell_1h'] >= NEWELL_WARNING:
+        raise_level(result, 'warning', "сильная связь ветра с магнитосферой")
+    if result['pressure'] is not None and result['pressure'] >= PRESSURE_WARNING:
+        raise_level(result, 'warning', f"давление {result['pressure']:.1f} нПа")
+    return result
+
+
+def raise_level(result: Dict[str, Any], level: str, reason: str):
+    """Повышает итоговый уровень (понижать нельзя) и добавляет причину"""
+    if LEVEL_ORDER[level] > LEVEL_ORDER[result['level']]:
+        result['level'] = level
+    result['reasons'].append(reason)
@@ -0,0 +1,403 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from fetcher import SpaceWeatherFetcher, save_data_to_json, SECTION_SCHEDULE, DATA_DIR
+from snapshot import Snapshot, SnapshotStore
+from push import PushHub
+from notify import Notifier
+from httpclient import HttpClient
+from shared import LeaderLock, SharedRegion, pack_bundle, unpack_bundle
+
+# Общие для воркеров uvicorn файлы: блокировка ведущего и область снимков
+SHARED_DIR = os.path.join(DATA_DIR, 'shared')
+# Подписки Telegram и состояние правил уведомлений
+NOTIFY_DIR = os.path.join(DATA_DIR, 'notify')
+# Как часто читатель проверяет поколение снимка и ведущий - запросы обновления (сек)
+FOLLOW_INTERVAL = 0.5
+# Ручные запросы чаще этого интервала (сек) присоединяются к последнему обновлению
+MIN_MANUAL_INTERVAL = 30
+# Сколько последних заданий ручного обновления хранить для /api/update-data/{id}
+MAX_JOBS = 100
+# Переданное ведущему задание без ответа дольше этого (сек) считается неудачным
+FORWARD_TIMEOUT = 120
+
+
+class LoopLagMonitor:
+    """Измеряет задержки event loop: насколько позже срока просыпается таймер"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self) -> float:
+        """Возвращает максимальную задержку с прошлого сброса (сек) и обнуляет её"""
+        lag, self.max_lag = self.max_lag, 0.0
+        return lag
+
+
+class RefreshEngine:
+    """Обновление данных NOAA внутри процесса сервера, на его же event loop
+
+    Каждый раздел снимка обновляется по своему расписанию (SECTION_SCHEDULE);
+    разделы, подошедшие к сроку одновременно, обновляются вместе и
+    публикуются одним снимком.
+
+    При запуске с --workers N данные получает только ведущий процесс
+    (держит LeaderLock) и выкладывает готовые байты снимков в общую
+    область; остальные воркеры лишь подхватывают новые поколения.
+    """
+
+    def __init__(self, persist: bool = True, store: Optional[SnapshotStore] = None,
+                 live_store: Optional[SnapshotStore] = None):
+        self.persist = persist
+        self.store = store if store is not None else SnapshotStore()
+        # Компактные данные для страницы (/api/live)
+        self.live_store = live_store if live_store is not None else SnapshotStore()
+        # Уведомления подписчикам о новых версиях (/api/events)
+        self.push = PushHub()
+        # Уведомления подписчикам Telegram (правила проверяет ведущий процесс)
+        self.notifier = Notifier(NOTIFY_DIR)
+        self.fetcher = SpaceWeatherFetcher()
+        # Пул соединений к NOAA живет столько же, сколько процесс
+        self.client = HttpClient()
+        self.monitor = LoopLagMonitor()
+        self.data: Optional[Dict] = None
+        self.stats: Dict[str, Any] = {
+            'cycles': 0,
+            'last_started': None,
+            'last_duration_ms': None,
+            'last_first_publish_ms': None,
+            'last_loop_stall_ms': None,
+            'max_loop_stall_ms': 0.0,
+            'last_error': None,
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._versions: Dict[str, Optional[str]] = {}
+        self.lock = LeaderLock(os.path.join(SHARED_DIR, 'leader.lock'))
+        self.shared = SharedRegion(os.path.join(SHARED_DIR, 'snapshot.bin'))
+        self._shared_generation = 0
+        self._shared_etags: Dict[str, Optional[str]] = {}
+        # Одновременно идет не больше одного обновления (по расписанию или ручного)
+        self._refresh_lock = asyncio.Lock()
+        self.jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._manual_job: Optional[Dict[str, Any]] = None
+        self._job_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lock.held
+
+    async def start(self):
+        """Ведущий: сессия и периодическое обновление; остальные - чтение общей области"""
+        self.monitor.start()
+        if self._task is not None:
+            return
+        await self.notifier.start()
+        if self.lock.try_acquire():
+            print(f"👑 Процесс {os.getpid()} - ведущий: получает данные NOAA")
+            self.client.open()
+            self._task = asyncio.create_task(self._run_periodically())
+        else:
+            print(f"👥 Процесс {os.getpid()} - читатель: снимки публикует ведущий процесс")
+            self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.monitor.stop()
+        await self.notifier.stop()
+        await self.client.close()
+        self.lock.release()
+
+    async def _follow(self):
+        """Воркер-читатель: подхватывает новые поколения; если ведущий исчез - сменяет его"""
+        while True:
+            try:
+                if await asyncio.to_thread(self.adopt_shared):
+                    self.notify()
+            except Exception as e:
+                # Поврежденная публикация не должна останавливать чтение: ждем следующую
+                print(f"⚠️ Не удалось принять снимок из общей области: {e}")
+            self._check_forwarded()
+            if self.lock.try_acquire():
+                print(f"👑 Ведущий процесс завершился, процесс {os.getpid()} становится ведущим")
+                await self._run_periodically()
+                return
+            await asyncio.sleep(FOLLOW_INTERVAL)
+
+    def adopt_shared(self) -> bool:
+        """Принимает снимки из общей области, если вышло новое поколение (в потоке)"""
+        update = self.shared.read(self._shared_generation)
+        if update is None:
+            return False
+        generation, payload = update
+        bundle = unpack_bundle(payload)
+        for name, store in (('snapshot', self.store), ('live', self.live_store)):
+            if name in bundle:
+                store.adopt(Snapshot.from_shared(*bundle[name]))
+        self._shared_generation = generation
+        return True
+
+    def publish_shared(self):
+        """Ведущий выкладывает готовые байты снимков для остальных воркеров (в потоке)"""
+        stores = {'snapshot': self.store.current, 'live': self.live_store.current}
+        etags = {name: snapshot.etag if snapshot is not None else None for name, snapshot in stores.items()}
+        if not self.lock.held or etags == self._shared_etags:
+            return
+        self._shared_generation = self.shared.write(pack_bundle(stores))
+        self._shared_etags = etags
+
+    def request_update(self) -> Tuple[Dict[str, Any], str]:
+        """Ручное обновление с объединением запросов (single-flight) и антидребезгом
+
+        Возвращает задание и исход: started; joined - присоединен к идущему
+        обновлению; debounced - последнее завершилось меньше MIN_MANUAL_INTERVAL назад;
+        unavailable - ведущий процесс еще не создал общую область.
+        На читателе запрос передается ведущему процессу через общую область:
+        сам читатель NOAA не опрашивает.
+        """
+        job = self._manual_job
+        if job is not None:
+            if job['finished_at'] is None:
+                job['requests'] += 1
+                return job, 'joined'
+            if job['status'] == 'done' and time.time() - job['finished_at'] < MIN_MANUAL_INTERVAL:
+                job['requests'] += 1
+                return job, 'debounced'
+
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'status': 'queued',
+            'requests': 1,
+            'requested_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'version': None,
+            'error': None,
+        }
+        self.jobs[job['id']] = job
+        while len(self.jobs) > MAX_JOBS:
+            self.jobs.popitem(last=False)
+        self._manual_job = job
+
+        if self.is_leader:
+            self._job_task = asyncio.create_task(self._run_job(job))
+            return job, 'started'
+        ticket = self.shared.request_refresh()
+        if ticket is None:
+            self._finish_job(job, 'Ведущий процесс еще не опубликовал данные')
+            return job, 'unavailable'
+        job['status'] = 'forwarded'
+        job['ticket'] = ticket
+        return job, 'started'
+
+    async def _run_job(self, job: Dict[str, Any]):
+        async with self._refresh_lock:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            await self._refresh()
+        self._finish_job(job, self.stats['last_error'])
+
+    def _finish_job(self, job: Dict[str, Any], error: Optional[str] = None):
+        snapshot = self.store.current
+        job['finished_at'] = time.time()
+        job['version'] = snapshot.version if snapshot is not None else None
+        job['error'] = error
+        job['status'] = 'failed' if error else 'done'
+
+    def _check_forwarded(self):
+        """Задание, переданное ведущему: завершено, когда его запрос отмечен выполненным
+
+        Проверяется и читателем, и ведущим (этот процесс мог сам стать ведущим);
+        без ответа дольше FORWARD_TIMEOUT задание считается неудачным.
+        """
+        job = self._manual_job
+        if job is None or job['status'] != 'forwarded':
+            return
+        if self.shared.refresh_served() >= job['ticket']:
+            self._finish_job(job)
+        elif time.time() - job['requested_at'] > FORWARD_TIMEOUT:
+            self._finish_job(job, f'Ведущий процесс не выполнил запрос за {FORWARD_TIMEOUT} с')
+
+    @staticmethod
+    def job_info(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Состояние задания для API: время в ISO, длительности в мс"""
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec='milliseconds') if ts is not None else None
+
+        def ms(start, end):
+            return round((end - start) * 1000, 1) if start is not None and end is not None else None
+
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'joined': job['requests'] - 1,
+            'requested_at': iso(job['requested_at']),
+            'started_at': iso(job['started_at']),
+            'finished_at': iso(job['finished_at']),
+            'wait_ms': ms(job['requested_at'], job['started_at']),
+            'duration_ms': ms(job['started_at'] or job['requested_at'], job['finished_at']),
+            'version': job['version'],
+            'error': job['error'],
+        }
+
+    async def publish(self) -> Dict:
+        """Собирает снимок из текущих разделов и атомарно подменяет опубликованный"""
+        data = self.fetcher.build_snapshot()
+        self.data = data
+        # Сериализация и gzip - вне event loop
+        await asyncio.to_thread(self.store.publish, data)
+        await asyncio.to_thread(self.publish_live)
+        await asyncio.to_thread(self.publish_shared)
+        self.notify()
+        if self.is_leader:
+            # Правила уведомлений проверяет только ведущий - иначе рассылки повторятся
+            try:
+                await self.notifier.evaluate(data)
+            except Exception as e:
+                print(f"⚠️ Уведомления: ошибка проверки правил: {e}")
+        return data
+
+    def notify(self):
+        """Сообщает подписчикам версии снимков, если хотя бы одна изменилась"""
+        snapshot, live = self.store.current, self.live_store.current
+        versions = {
+            'version': snapshot.version if snapshot is not None else None,
+            'snapshot': snapshot.etag if snapshot is not None else None,
+            'live': live.etag if live is not None else None,
+        }
+        if versions != self._versions:
+            self._versions = versions
+            self.push.publish(versions)
+
+    def publish_live(self):
+        """Данные для страницы: чтение архива и сериализация (вызывается в потоке)"""
+        self.live_store.publish(self.fetcher.build_live())
+
+    async def refresh(self, sections: Optional[List[str]] = None) -> Optional[Dict]:
+        """Обновление разделов (по умолчанию всех) с публикацией по мере готовности
+
+        Каждый раздел попадает в снимок сразу после своего обновления, поэтому
+        быстрые продукты не ждут самый медленный. Обновления не пересекаются:
+        следующее ждет окончания текущего.
+        """
+        async with self._refresh_lock:
+            return await self._refresh(sections)
+
+    async def _refresh(self, sections: Optional[List[str]] = None) -> Optional[Dict]:
+        self.client.open()
+
+        self.monitor.reset()
+        self.stats['last_started'] = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
+        started = time.perf_counter()
+        first_publish_ms = None
+        data = None
+        try:
+            if len(self.fetcher.sections) < len(self.fetcher.section_processors()):
+                # Стартовый снимок из HTTP-кэша, пока идут сетевые запросы
+                await self.fetcher.seed_sections()
+                data = await self.publish()
+
+            names = sections if sections is not None else list(self.fetcher.section_processors())
+            tasks = [asyncio.create_task(self.fetcher.refresh_section(self.client, name)) for name in names]
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    await finished
+                except Exception as e:
+                    print(f"❌ Ошибка обновления раздела: {e}")
+                data = await self.publish()
+                if first_publish_ms is None:
+                    first_publish_ms = (time.perf_counter() - started) * 1000
+            self.stats['last_error'] = None
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            print(f"❌ Исключение в автообновлении: {e}")
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        stall_ms = self.monitor.reset() * 1000
+        self.stats['cycles'] += 1
+        self.stats['last_duration_ms'] = round(duration_ms, 1)
+        self.stats['last_first_publish_ms'] = round(first_publish_ms, 1) if first_publish_ms is not None else None
+        self.stats['last_loop_stall_ms'] = round(stall_ms, 1)
+        self.stats['max_loop_stall_ms'] = round(max(self.stats['max_loop_stall_ms'], stall_ms), 1)
+        label = ', '.join(sections) if sections is not None else 'все разделы'
+        print(f"⏱ Обновление ({label}): {duration_ms:.0f} мс, первый раздел опубликован через "
+              f"{first_publish_ms or 0:.0f} мс, макс. задержка event loop: {stall_ms:.1f} мс")
+
+        if sections is None and data is not None:
+            self.fetcher.print_summary()
+
+        if data is not None and self.persist:
+            # Файл нужен только для перезапуска; пишем его вне event loop
+            # Текущий снимок совпадает с data по содержимому (publish пропускает дубли),
+            # поэтому файлы пишутся из его готовых байтов
+            await asyncio.to_thread(save_data_to_json, data, 'static', self.store.current)
+
+        return data
+
+    @staticmethod
+    def next_interval(name: str) -> float:
+        """Период раздела со случайным разбросом, чтобы запросы не шли пачкой"""
+        schedule = SECTION_SCHEDULE[name]
+        jitter = schedule['interval'] * schedule['jitter']
+        return schedule['interval'] + random.uniform(-jitter, jitter)
+
+    async def _run_periodically(self):
+        print(f"\n{'=' * 60}")
+        print(f"🕐 Автоматическое обновление в {datetime.now().strftime('%H:%M:%S')}")
+        print(f"{'=' * 60}\n")
+
+        # Первый запуск - все разделы сразу; он же выполняет запросы, пришедшие до него
+        # (в том числе переданные прежнему ведущему, который завершился)
+        refresh_requests = self.shared.refresh_requests()
+        await self.refresh()
+        self.shared.mark_served(refresh_requests)
+
+        loop = asyncio.get_running_loop()
+        next_due = {name: loop.time() + self.next_interval(name) for name in SECTION_SCHEDULE}
+        while True:
+            self._check_forwarded()
+            # Ждем ближайший срок, проверяя запросы ручного обновления от читателей
+            await asyncio.sleep(min(FOLLOW_INTERVAL, max(0.0, min(next_due.values()) - loop.time())))
+
+            requests = self.shared.refresh_requests()
+            if requests != refresh_requests:
+                refresh_requests = requests
+                for name in next_due:
+                    next_due[name] = 0.0
+
+            now = loop.time()
+            due = [name for name, due_at in next_due.items() if due_at <= now]
+            if not due:
+                continue
+            await self.refresh(due)
+            for name in due:
+                next_due[name] = loop.time() + self.next_interval(name)
+            if requests != self.shared.refresh_served():
+                self.shared.mark_served(requests)
@@ -0,0 +1,122 @@
+import numpy as np
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _is_number(value) -> bool:
+    return value is not None and not isinstance(value, bool) and _number(value) == _number(value)
+
+
+def _is_header(row) -> bool:
+    """Строка-заголовок табличного продукта NOAA: одни строки, ни одного числа"""
+    return bool(row) and all(isinstance(cell, str) and not _is_number(cell) for cell in row)
+
+
+def fingerprint(rows: Sequence) -> Optional[Tuple]:
+    """Отпечаток формата продукта по первой и последней строке - O(1) от длины
+
+    dict - упорядоченные ключи записи; rows - ширина строки и заголовок, если он есть.
+    """
+    if not rows:
+        return None
+    first, last = rows[0], rows[-1]
+    if isinstance(last, dict):
+        return ('dict', tuple(last))
+    if isinstance(last, (list, tuple)):
+        return ('rows', len(last), tuple(first) if _is_header(first) else None)
+    return ('scalar', type(last).__name__)
+
+
+class Extractor:
+    """Извлечение одного числового поля из всех строк продукта за один проход
+
+    Формат определен заранее (compile_extractor), поэтому проход идет в C
+    (map + itemgetter) без проверок типа и перебора ключей в каждой строке.
+    """
+
+    __slots__ = ('schema', 'key', 'skip', 'getter', 'description')
+
+    def __init__(self, schema: Tuple, key, skip: int, description: str):
+        self.schema = schema
+        self.key = key
+        self.skip = skip
+        self.getter = itemgetter(key)
+        self.description = description
+
+    def raw(self, rows: Sequence, last: Optional[int] = None) -> List:
+        """Значения поля как есть (None - поля нет в строке); last - только последние строки"""
+        start = self.skip if last is None else max(self.skip, len(rows) - last)
+        body = rows[start:]
+        try:
+            return list(map(self.getter, body))
+        except (KeyError, IndexError, TypeError):
+            key = self.key
+            if self.schema[0] == 'dict':
+                return [row.get(key) if isinstance(row, dict) else None for row in body]
+            return [row[key] if isinstance(row, (list, tuple)) and len(row) > key else None for row in body]
+
+    def __call__(self, rows: Sequence, last: Optional[int] = None) -> np.ndarray:
+        """Значения поля как float64 (NaN - пропуск или нечисловое значение)"""
+        values = self.raw(rows, last)
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.array([_number(value) for value in values], dtype=np.float64)
+
+    def __repr__(self) -> str:
+        return self.description
+
+
+def compile_extractor(schema: Tuple, rows: Sequence, candidates: List[str], column: int = 1) -> Optional[Extractor]:
+    """Извлекатель под формат: какой ключ (столбец) хранит значение, есть ли заголовок"""
+    kind = schema[0]
+    if kind == 'dict':
+        sample = rows[-1]
+        present = [key for key in candidates if key in sample]
+        # Первый ключ с числом; ключ с пропуском в последней строке - только если других нет
+        key = next((key for key in present if _is_number(sample[key])), present[0] if present else None)
+        if key is None:
+            return None
+        return Extractor(schema, key, 0, f"ключ '{key}'")
+    if kind == 'rows':
+        header = schema[2]
+        if header is not None:
+            index = next((header.index(name) for name in candidates if name in header), column)
+            name = header[index] if index < len(header) else index
+            return Extractor(schema, index, 1, f"столбец {index} ('{name}'), строка заголовка")
+        if schema[1] <= column:
+            return None
+        return Extractor(schema, column, 0, f"столбец {column}")
+    return None
+
+
+class ExtractorCache:
+    """Извлекатели по отпечатку формата: определение формата - один раз на формат
+
+    Смена формата продукта у NOAA пишется в журнал.
+    """
+
+    def __init__(self):
+        self.extractors: Dict[Tuple, Optional[Extractor]] = {}
+        self.schemas: Dict[str, Tuple] = {}
+
+    def get(self, feed: str, rows: Sequence, candidates: List[str], column: int = 1) -> Optional[Extractor]:
+        schema = fingerprint(rows)
+        if schema is None:
+            return None
+        cache_key = (feed, tuple(candidates), column, schema)
+        if cache_key not in self.extractors:
+            self.extractors[cache_key] = compile_extractor(schema, rows, candidates, column)
+        extractor = self.extractors[cache_key]
+        if self.schemas.get(feed) != schema:
+            change = "формат изменился" if feed in self.schemas else "формат"
+            print(f"🧬 {feed}: {change} {schema[0]}, значение - {extractor or 'не найдено'}")
+            self.schemas[feed] = schema
+        return extractor
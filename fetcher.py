@@ -1,103 +1,319 @@
-import aiohttp
 import asyncio
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
-import base64
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple
+import hashlib
 import os
 import sys
 import io
-import re
+import time
+import numpy as np
+
+from httpcache import HttpCache
+from httpclient import HttpClient
+from snapshot import (Snapshot, save_manifest, read_manifest, write_atomic, sync_directory,
+                      ENCODINGS, ENCODING_SUFFIXES)
+from imagestore import ImageStore
+from xray import xray_columns, flux_class, BAND_LONG
+from flares import FlareDetector
+from timeseries import TimeSeriesStore, parse_time_tags
+from baselines import Baselines
+from extractors import ExtractorCache
+from records import PointSeries, FlareEvent, CmeEvent
+from alerts import AlertIndex
+from resample import AlignedFrame, feed_columns, sort_columns, align
+from coupling import analyze, LEVEL_ORDER, PRESSURE_WARNING
+from aurora import AuroraStore, build_grid, load_ovation
 
 # Устанавливаем кодировку stdout на UTF-8 для Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-# Константы
-NOAA_BASE = "https://services.swpc.noaa.gov/json"
+# Константы: адрес сервиса NOAA SWPC (переопределяется переменной NOAA_BASE
+# или параметром SpaceWeatherFetcher, например для зеркала или тестов)
+NOAA_BASE = "https://services.swpc.noaa.gov"
 
-# РАБОЧИЕ эндпоинты NOAA
+# Каталог для служебных данных (изображения, кэши, история)
+DATA_DIR = "data"
+
+# РАБОЧИЕ эндпоинты NOAA (пути относительно NOAA_BASE)
 ENDPOINTS = {
-    'kp_forecast': f'{NOAA_BASE}/geospace/predicted_kp.json',
-    'kp_index': f'{NOAA_BASE}/planetary_k_index_1m.json',
-    'dst': f'{NOAA_BASE}/geospace/geospace_dst_1_hour.json',
-    'flux_7day': f'{NOAA_BASE}/goes/primary/xrays-7-day.json',
-    'proton': f'{NOAA_BASE}/rtsw/rtsw_wind_1m.json',
-    'bz_gms': f'{NOAA_BASE}/rtsw/rtsw_mag_1m.json',
-    'sunspots': f'{NOAA_BASE}/solar-cycle/sunspots.json',
-    'alerts': f'{NOAA_BASE}/alerts.json',
-    'aurora_forecast': 'https://services.swpc.noaa.gov/images/aurora-forecast-northern-hemisphere.jpg',
-    'aurora_forecast_south': 'https://services.swpc.noaa.gov/images/aurora-forecast-southern-hemisphere.jpg',
+    'kp_forecast': '/json/geospace/predicted_kp.json',
+    'kp_index': '/json/planetary_k_index_1m.json',
+    'dst': '/json/geospace/geospace_dst_1_hour.json',
+    'flux_7day': '/json/goes/primary/xrays-7-day.json',
+    'proton': '/json/rtsw/rtsw_wind_1m.json',
+    'bz_gms': '/json/rtsw/rtsw_mag_1m.json',
+    'sunspots': '/json/solar-cycle/sunspots.json',
+    'alerts': '/json/alerts.json',
+    'ovation': '/json/ovation_aurora_latest.json',
+    'aurora_forecast': '/images/aurora-forecast-northern-hemisphere.jpg',
+    'aurora_forecast_south': '/images/aurora-forecast-southern-hemisphere.jpg',
+}
+
+# Расписание обновления разделов снимка: период (сек), случайный разброс
+# (доля периода) и крайний срок одного запуска. Периоды подобраны под то,
+# как часто NOAA обновляет соответствующие продукты.
+SECTION_SCHEDULE = {
+    'kp': {'interval': 60, 'jitter': 0.1, 'deadline': 20},             # 1-минутный Kp
+    'solar_wind': {'interval': 60, 'jitter': 0.1, 'deadline': 20},     # RTSW, 1 мин
+    'geomagnetic': {'interval': 60, 'jitter': 0.1, 'deadline': 20},    # RTSW mag, 1 мин + Dst
+    'flares': {'interval': 300, 'jitter': 0.1, 'deadline': 45},        # GOES X-ray, 7 дней
+    'cme': {'interval': 300, 'jitter': 0.1, 'deadline': 30},           # алерты
+    'images': {'interval': 300, 'jitter': 0.1, 'deadline': 45},        # OVATION, 5 мин
+    'aurora': {'interval': 300, 'jitter': 0.1, 'deadline': 45},        # наукаст OVATION, 5 мин
+    'kp_forecast': {'interval': 900, 'jitter': 0.1, 'deadline': 30},
+    'sun': {'interval': 21600, 'jitter': 0.1, 'deadline': 30},         # месячные числа Вольфа
+}
+
+# Какие продукты NOAA (ключи ENDPOINTS) питают каждый раздел
+SECTION_FEEDS = {
+    'kp': ['kp_index'],
+    'solar_wind': ['proton'],
+    'geomagnetic': ['dst', 'bz_gms'],
+    'flares': ['flux_7day'],
+    'cme': ['alerts'],
+    'images': ['aurora_forecast', 'aurora_forecast_south'],
+    'aurora': ['ovation'],
+    'kp_forecast': ['kp_forecast'],
+    'sun': ['sunspots'],
+}
+
+# Какие поля продуктов NOAA пишутся в архив временных рядов (ряд -> ключ записи)
+HISTORY_FIELDS = {
+    'kp_index': {'kp': 'kp_index'},
+    'proton': {'proton_speed': 'proton_speed', 'proton_density': 'proton_density',
+               'proton_temperature': 'proton_temperature'},
+    'bz_gms': {'bt': 'bt', 'bz_gsm': 'bz_gsm'},
+    'dst': {'dst': 'dst'},
+}
+# Все ряды архива; xray_flux (канал 0.1-0.8 нм) пишется из столбцов X-ray
+HISTORY_SERIES = [name for fields in HISTORY_FIELDS.values() for name in fields] + ['xray_flux']
+
+# Ряды архива, по которым ведутся скользящие базовые уровни (ряд -> метрика)
+BASELINE_SERIES = {'kp': 'kp', 'proton_speed': 'wind'}
+# Средние по умолчанию, пока базовые уровни не накоплены
+DEFAULT_AVERAGES = {'kp': 3.2, 'wind': 420, 'flares': 5.3, 'cme': 2.5}
+
+# 1-минутные продукты: запаздывающий запрос дублируется (хеджирование)
+HEDGED_FEEDS = {'kp_index', 'proton', 'bz_gms'}
+
+# Где искать значение Kp в записях продуктов (по порядку); в табличном
+# формате без подходящего заголовка значение - во втором столбце
+KP_KEYS = ['kp', 'kp_index', 'Kp', 'value']
+KP_FORECAST_KEYS = ['predicted_kp', 'kp']
+KP_TIME_KEYS = ['time_tag', 'time-tag']
+
+# Поля 1-минутных продуктов RTSW, сводимых на общую сетку
+RTSW_FIELDS = {
+    'proton': ['proton_speed', 'proton_density', 'proton_temperature'],
+    'bz_gms': ['bt', 'bx_gsm', 'by_gsm', 'bz_gsm'],
+}
+# Точек истории: ветер - последние минуты, Kp - последние часы
+WIND_HISTORY_POINTS = 48
+KP_HISTORY_HOURS = 24
+
+# Минимальный возраст кэша для редких продуктов внутри частых разделов (сек)
+FEED_MAX_AGE = {
+    'dst': 900,  # часовые значения
 }
 
 
 class SpaceWeatherFetcher:
     """Асинхронный сборщик данных о космической погоде"""
 
-    def __init__(self):
+    def __init__(self, data_dir: str = DATA_DIR, base_url: Optional[str] = None):
+        self.base_url = (base_url or os.environ.get('NOAA_BASE', NOAA_BASE)).rstrip('/')
+        # Полные URL продуктов (ключи ENDPOINTS)
+        self.endpoints = {key: self.base_url + path for key, path in ENDPOINTS.items()}
         self.data = {}
-        self.images = {}
-
-    def calculate_aurora_probability(self, kp: float, lat: float = 55.0) -> str:
-        """Рассчитывает вероятность полярных сияний для заданной широты"""
-        if kp >= 7:
-            prob = 90 if lat > 50 else (50 if lat > 40 else 20)
-        elif kp >= 6:
-            prob = 70 if lat > 50 else 30
-        elif kp >= 5:
-            prob = 40 if lat > 55 else 15
-        else:
-            prob = 5
-        return f"{prob}%"
-
-    async def fetch_json(self, session: aiohttp.ClientSession, url: str, name: str) -> Optional[Any]:
-        """Асинхронный GET запрос JSON"""
+        self.sections: Dict[str, Any] = {}
+        self.section_stats: Dict[str, Dict[str, Any]] = {}
+        # Свежесть разделов: время последнего удачного обновления и признак устаревания
+        self.section_meta: Dict[str, Dict[str, Any]] = {}
+        # URL продуктов, последний запрос к которым завершился ошибкой
+        self.feed_errors: Dict[str, float] = {}
+        # Последний обработанный ответ xrays-7-day и детектор вспышек по нему
+        self._xray_source = None
+        self.flares = FlareDetector()
+        self.images = ImageStore(os.path.join(data_dir, 'images'))
+        # Сетка вероятности сияний (по хэшу на диске) и входы, из которых она построена
+        self.aurora = AuroraStore(os.path.join(data_dir, 'aurora'))
+        self._aurora_source = None
+        self.http_cache = HttpCache(os.path.join(data_dir, 'http_cache'))
+        self.history = TimeSeriesStore(os.path.join(data_dir, 'history'), HISTORY_SERIES)
+        self.baselines = Baselines(os.path.join(data_dir, 'baselines'))
+        # Последний записанный в архив ответ каждого продукта
+        self._history_sources: Dict[str, Any] = {}
+        # Разобранные алерты NOAA (разбираются только новые) и последний учтенный ответ
+        self.alerts = AlertIndex(os.path.join(data_dir, 'alerts', 'index.json'))
+        self._alerts_source = None
+        # Извлекатели значений по формату продукта (формат определяется один раз)
+        self.extractors = ExtractorCache()
+        # Продукты RTSW на общей минутной сетке и ответы, из которых она построена
+        self.rtsw = AlignedFrame.empty()
+        # Индексы геоэффективности по этой сетке (функция Ньюэлла, давление, Ey)
+        self.coupling: Optional[Dict[str, Any]] = None
+        self._rtsw_sources: Dict[str, Any] = {}
+        self._rtsw_lock = asyncio.Lock()
+
+    def current_aurora_probability(self, lat: float = 55.75, lon: float = 37.61) -> str:
+        """Вероятность полярных сияний сейчас в точке (по умолчанию - Москва)
+
+        Берется из сетки раздела aurora (наукаст OVATION или модель по текущему
+        Kp); пока сетки нет - из модели по текущему Kp раздела kp. Для прогноза
+        по другому Kp нужна своя сетка: aurora.build_grid(kp, None).
+        """
+        grid = self.aurora.current
+        if grid is None:
+            grid = build_grid(self.sections.get('kp', {}).get('current', 3.3), None)
+        return f"{grid.lookup(lat, lon)}%"
+
+    async def fetch_cached(self, session: Optional[HttpClient], url: str, name: str, parse,
+                           max_age: float = 0) -> Optional[Any]:
+        """GET через HTTP-кэш: условный запрос, при 304 - ранее разобранный результат
+
+        Без сессии работает только из кэша (последний удачный ответ или None).
+        """
+        cache = self.http_cache
+        stats = cache.feed_stats(name)
+        entry = cache.get(url)
+
+        if entry is not None and entry.parsed is None:
+            # После перезапуска: тело есть на диске, разбираем его один раз
+            body = await asyncio.to_thread(cache.read_body, entry)
+            if body is not None:
+                entry.parsed = await asyncio.to_thread(parse, body)
+            else:
+                cache.entries.pop(url, None)
+                entry = None
+
+        if session is None:
+            return entry.parsed if entry is not None else None
+
+        if entry is not None and entry.is_fresh(max_age):
+            stats['hits'] += 1
+            stats['bytes_saved'] += entry.size
+            return entry.parsed
+
+        headers = entry.conditional_headers() if entry is not None else {}
+        hedge = url in {self.endpoints[key] for key in HEDGED_FEEDS}
+        status, response_headers, body = await session.get(url, headers=headers, hedge=hedge)
+        if status == 304 and entry is not None:
+            cache.refresh_validators(entry, response_headers)
+            stats['revalidations'] += 1
+            stats['bytes_saved'] += entry.size
+            return entry.parsed
+        if status == 200:
+            parsed = await asyncio.to_thread(parse, body)
+            await asyncio.to_thread(cache.store, url, response_headers, body, parsed)
+            stats['misses'] += 1
+            return parsed
+        raise RuntimeError(f"HTTP {status}")
+
+    def cached_value(self, url: str) -> Optional[Any]:
+        """Последний удачный ответ из HTTP-кэша (если есть в памяти)"""
+        entry = self.http_cache.entries.get(url)
+        return entry.parsed if entry is not None else None
+
+    async def fetch_json(self, session: Optional[HttpClient], url: str, name: str,
+                         max_age: float = 0, parse=json.loads) -> Optional[Any]:
+        """Асинхронный GET запрос JSON; при ошибке - последний удачный ответ"""
         try:
-            async with session.get(url, timeout=30) as response:
-                if response.status == 200:
-                    return await response.json()
-                print(f"⚠️ {name}: HTTP {response.status}")
-                return None
+            data = await self.fetch_cached(session, url, name, parse, max_age)
+            self.feed_errors.pop(url, None)
+            return data
         except Exception as e:
             print(f"⚠️ {name}: {str(e)}")
-            return None
+            self.feed_errors[url] = time.time()
+            return self.cached_value(url)
 
-    async def fetch_image(self, session: aiohttp.ClientSession, url: str, name: str) -> Optional[str]:
-        """Асинхронная загрузка изображения в base64"""
+    async def fetch_image(self, session: Optional[HttpClient], url: str, name: str) -> Optional[bytes]:
+        """Асинхронная загрузка изображения (сырые байты)"""
         try:
-            async with session.get(url, timeout=30) as response:
-                if response.status == 200:
-                    img_data = await response.read()
-                    return base64.b64encode(img_data).decode('utf-8')
-                return None
+            content = await self.fetch_cached(session, url, name, bytes)
+            self.feed_errors.pop(url, None)
+            return content
         except Exception as e:
-            return None
+            self.feed_errors[url] = time.time()
+            return self.cached_value(url)
+
+    async def record_history(self, feed: str, records: Optional[List[Dict]]):
+        """Дописывает в архив новые отсчеты продукта (только для нового ответа)"""
+        if not records or self._history_sources.get(feed) is records:
+            return
+        self._history_sources[feed] = records
+        try:
+            added = await asyncio.to_thread(self._archive, records, HISTORY_FIELDS[feed])
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Архив {feed}: не удалось записать: {e}")
+            return
+        if any(added.values()):
+            print(f"🗄 Архив {feed}: +{max(added.values())} отсчетов")
+
+    def _archive(self, records: List[Dict], fields: Dict[str, str]) -> Dict[str, int]:
+        """Запись в архив и досчет базовых уровней по новым отсчетам (в потоке)"""
+        added = self.history.ingest(records, fields)
+        for series, metric in BASELINE_SERIES.items():
+            if added.get(series):
+                times, values = self.history.series(series).read(self.baselines.watermark(metric) + 1, 2 ** 62)
+                if self.baselines.update(metric, times, values):
+                    self.baselines.save(metric)
+        return added
+
+    async def record_daily_baseline(self, metric: str, value: float):
+        """Суточный отсчет счетчика событий (последний за день замещает предыдущий)"""
+        if self.baselines.update(metric, [int(time.time())], [value]):
+            try:
+                await asyncio.to_thread(self.baselines.save, metric)
+            except OSError as e:
+                print(f"⚠️ Базовый уровень {metric}: не удалось сохранить: {e}")
+
+    async def update_rtsw(self, feed: str, records: Optional[List[Dict]]) -> AlignedFrame:
+        """Общая сетка продуктов RTSW; перестраивается, только если пришел новый ответ
+
+        Второй продукт берется из последнего удачного ответа (его раздел
+        обновляется по своему расписанию).
+        """
+        sources = {name: self.cached_value(self.endpoints[name]) for name in RTSW_FIELDS}
+        if records:
+            sources[feed] = records
+        async with self._rtsw_lock:
+            if any(sources[name] is not self._rtsw_sources.get(name) for name in RTSW_FIELDS):
+                self.rtsw, self.coupling = await asyncio.to_thread(self._align_rtsw, sources)
+                self._rtsw_sources = sources
+        return self.rtsw
+
+    @staticmethod
+    def _align_rtsw(sources: Dict[str, Any]) -> Tuple[AlignedFrame, Optional[Dict[str, Any]]]:
+        """Разбор time_tag, слияние продуктов на сетке и индексы по всей сетке (в потоке)"""
+        frame = align({name: feed_columns(sources[name] or [], fields) for name, fields in RTSW_FIELDS.items()})
+        return frame, analyze(frame)
 
     async def get_kp_forecast(self, session) -> float:
         """Получение прогноза Kp из NOAA"""
-        data = await self.fetch_json(session, ENDPOINTS['kp_forecast'], 'Kp forecast')
-        if data and len(data) > 0:
-            try:
-                # Проверяем разные форматы данных
-                if isinstance(data[0], dict):
-                    return float(data[0].get('predicted_kp', 3.3))
-                elif isinstance(data[0], list) and len(data[0]) >= 2:
-                    return float(data[0][1])
-            except (ValueError, TypeError, IndexError):
-                pass
+        data = await self.fetch_json(session, self.endpoints['kp_forecast'], 'Kp forecast')
+        extractor = self.extractors.get('kp_forecast', data, KP_FORECAST_KEYS) if data else None
+        if extractor is not None:
+            values = extractor(data)
+            if values.size and np.isfinite(values[0]):
+                return float(values[0])
         return 3.3
 
-    async def get_kp_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_kp_data(self, session: HttpClient) -> Dict:
         """Kp-индекс - для карточек и графика"""
-        data = await self.fetch_json(session, ENDPOINTS['kp_index'], 'Kp index')
+        data = await self.fetch_json(session, self.endpoints['kp_index'], 'Kp index')
+        await self.record_history('kp_index', data)
 
+        # Один ряд на оба представления истории: список чисел и точки графика
+        history = PointSeries(label_format='%H:00')
         result = {
             'current': 3.3,
             'forecast': 3.5,
             'status': 'normal',
-            'history': [],
-            'history_formatted': [],
+            'history': history.values,
+            'history_formatted': history,
             'status_text': 'Спокойно',
             'status_badge': 'status-normal'
         }
@@ -105,62 +321,25 @@ class SpaceWeatherFetcher:
         if data and len(data) > 0:
             print(f"📡 Kp data sample: {data[-1]}")
 
-            # Определяем структуру данных
-            sample = data[-1]
+            # Формат определяется один раз на формат продукта, затем один проход
+            # по всем записям без проверок в каждой строке
+            extractor = self.extractors.get('kp_index', data, KP_KEYS)
+            time_extractor = self.extractors.get('kp_index', data, KP_TIME_KEYS, column=0)
             current = 3.3
-            possible_keys = ['kp', 'kp_index', 'Kp', 'value']
-
-            # Получаем текущее значение
-            if isinstance(sample, dict):
-                for key in possible_keys:
-                    if key in sample and sample[key] is not None:
-                        try:
-                            current = float(sample[key])
-                            print(f"✅ Kp по ключу '{key}': {current}")
-                            break
-                        except (ValueError, TypeError):
-                            continue
-            elif isinstance(sample, list) and len(sample) >= 2:
-                try:
-                    current = float(sample[1])
-                    print(f"✅ Kp из списка: {current}")
-                except (ValueError, TypeError):
-                    pass
-
+            if extractor is not None and time_extractor is not None:
+                times = parse_time_tags(time_extractor.raw(data)).astype(np.int64)
+                frame = align({'kp_index': sort_columns(times, {'kp': extractor(data)})})
+                latest = frame.latest('kp')
+                if latest is not None:
+                    current = latest[1]
+                    print(f"✅ Kp ({extractor}): {current}")
+
+                    # История - максимум Kp за последние часы, подписи - часы UTC из time_tag
+                    hours, peaks = frame.window('kp', KP_HISTORY_HOURS, 3600, 'max')
+                    history.times.extend(hours.tolist())
+                    history.values.extend(peaks.tolist())
             result['current'] = current
 
-            # Формируем историю (24 последних значения)
-            recent = data[-24:] if len(data) > 24 else data
-            history_values = []
-            now = datetime.now()
-
-            for i, item in enumerate(recent):
-                val = 0
-                if isinstance(item, dict):
-                    for key in possible_keys:
-                        if key in item and item[key] is not None:
-                            try:
-                                val = float(item[key])
-                                break
-                            except (ValueError, TypeError):
-                                continue
-                elif isinstance(item, list) and len(item) >= 2:
-                    try:
-                        val = float(item[1])
-                    except (ValueError, TypeError):
-                        pass
-
-                history_values.append(val)
-
-                # Создаем форматированную историю для графиков
-                hour = (now - timedelta(hours=len(recent) - i - 1)).strftime('%H:00')
-                result['history_formatted'].append({
-                    'label': hour,
-                    'value': val
-                })
-
-            result['history'] = history_values
-
             # Определяем статус
             if current >= 7:
                 result['status'] = 'danger'
@@ -177,9 +356,9 @@ class SpaceWeatherFetcher:
 
         return result
 
-    async def get_flare_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_flare_data(self, session: HttpClient) -> Dict:
         """Солнечные вспышки - с фильтрацией по 7 дням и классам"""
-        flux_data = await self.fetch_json(session, ENDPOINTS['flux_7day'], 'NOAA Flares')
+        flux_data = await self.fetch_json(session, self.endpoints['flux_7day'], 'NOAA Flares')
 
         result = {
             'count': 0,
@@ -192,67 +371,36 @@ class SpaceWeatherFetcher:
             'status_badge': 'status-normal',
             'events': [],
             'probability': 15,
-            'average': 5.3,
+            'average': DEFAULT_AVERAGES['flares'],
             'difference': 0,
             'dynamics': '◆ 0%',
             'dynamics_class': 'dyn-flat'
         }
 
         if flux_data and len(flux_data) > 0:
-            week_ago = datetime.now() - timedelta(days=7)
-            flares_last_7days = []
-
-            for item in flux_data:
-                flux = item.get('flux', 0)
-
-                # Фильтруем только значимые вспышки (>= C1.0)
-                if flux < 1e-6:  # меньше C1.0
-                    continue
-
-                time_tag = item.get('time_tag', '')
-                if time_tag:
-                    try:
-                        if 'T' in time_tag:
-                            item_date = datetime.fromisoformat(time_tag.replace('Z', '+00:00'))
-                        else:
-                            item_date = datetime.strptime(time_tag[:19], '%Y-%m-%d %H:%M:%S')
-
-                        # Только за последние 7 дней
-                        if item_date > week_ago:
-                            flares_last_7days.append(item)
-                    except:
-                        # Если дату не удалось распарсить, пропускаем
-                        continue
-
-            result['count'] = len(flares_last_7days)
+            # Новый ответ: детектор обрабатывает только отсчеты после водяного знака
+            if flux_data is not self._xray_source:
+                columns = xray_columns(flux_data)
+                processed = self.flares.update(columns)
+                self._xray_source = flux_data
+                long_band = columns['band'] == BAND_LONG
+                try:
+                    await asyncio.to_thread(self.history.append, 'xray_flux',
+                                            columns['time'][long_band], columns['flux'][long_band])
+                except OSError as e:
+                    print(f"⚠️ Архив xray_flux: не удалось записать: {e}")
+                if processed:
+                    print(f"🔎 Детектор вспышек: новых отсчетов {processed}")
+            summary = self.flares.summary(datetime.now(timezone.utc))
+
+            result['count'] = summary['count']
             print(f"✅ Вспышек за 7 дней: {result['count']}")
 
             if result['count'] > 0:
-                # Подсчет M и X класса
-                for flare in flares_last_7days:
-                    flux = flare.get('flux', 0)
-                    if flux >= 1e-4:
-                        result['x_count'] += 1
-                    elif flux >= 1e-5:
-                        result['m_count'] += 1
-
-                # Определяем самый сильный класс
-                strongest_full = 'C0.0'
-                for flare in flares_last_7days:
-                    flux = flare.get('flux', 0)
-                    if flux >= 1e-4:
-                        class_val = f"X{flux / 1e-4:.1f}"
-                    elif flux >= 1e-5:
-                        class_val = f"M{flux / 1e-5:.1f}"
-                    else:
-                        class_val = f"C{flux / 1e-6:.1f}"
-
-                    if class_val[0] > strongest_full[0]:
-                        strongest_full = class_val
-                    elif class_val[0] == strongest_full[0]:
-                        if float(class_val[1:]) > float(strongest_full[1:]):
-                            strongest_full = class_val
+                result['m_count'] = summary['m_count']
+                result['x_count'] = summary['x_count']
 
+                strongest_full = flux_class(summary['strongest_flux'])
                 result['strongest_class'] = strongest_full
                 result['strongest_class_display'] = strongest_full[0]
 
@@ -268,51 +416,25 @@ class SpaceWeatherFetcher:
                     result['status_badge'] = 'status-warning'
                     result['probability'] = 15
 
-                # Последние 5 событий
-                recent_flares = flares_last_7days[-5:]
-                for flare in recent_flares:
-                    flux = flare.get('flux', 0)
-                    if flux >= 1e-4:
-                        flare_class = 'X'
-                        class_full = f"X{flux / 1e-4:.1f}"
-                    elif flux >= 1e-5:
-                        flare_class = 'M'
-                        class_full = f"M{flux / 1e-5:.1f}"
-                    else:
-                        flare_class = 'C'
-                        class_full = f"C{flux / 1e-6:.1f}"
-
-                    result['events'].append({
-                        'date': flare.get('time_tag', '')[:10],
-                        'class': flare_class,
-                        'class_full': class_full,
-                        'flux': flux
-                    })
-
-                # Расчет для таблицы сравнения
-                result['average'] = 5.3
-                result['difference'] = round(result['count'] - result['average'], 1)
-
-                diff_percent = 0
-                if result['average'] > 0:
-                    diff_percent = round((result['difference'] / result['average']) * 100)
-                    diff_percent = max(-999, min(999, diff_percent))
-
-                if result['difference'] > 0:
-                    result['dynamics'] = f'▲ +{diff_percent}%'
-                    result['dynamics_class'] = 'dyn-up'
-                elif result['difference'] < 0:
-                    result['dynamics'] = f'▼ {diff_percent}%'
-                    result['dynamics_class'] = 'dyn-down'
-                else:
-                    result['dynamics'] = '◆ 0%'
-                    result['dynamics_class'] = 'dyn-flat'
+                # Последние 5 событий (класс - по пику)
+                result['events'] = [
+                    FlareEvent(flare['start'], flare['peak'], flare['end'], flare['peak_flux'],
+                               flux_class(flare['peak_flux']))
+                    for flare in summary['recent']
+                ]
+
+            # Сравнение со скользящим 30-дневным базовым уровнем
+            await self.record_daily_baseline('flares', result['count'])
+            result['average'], comparison = self.baselines.compare('flares', result['count'],
+                                                                   DEFAULT_AVERAGES['flares'])
+            result.update(comparison)
 
         return result
 
-    async def get_solar_wind_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_solar_wind_data(self, session: HttpClient) -> Dict:
         """Солнечный ветер - с историей"""
-        data = await self.fetch_json(session, ENDPOINTS['proton'], 'Solar wind')
+        data = await self.fetch_json(session, self.endpoints['proton'], 'Solar wind')
+        await self.record_history('proton', data)
 
         result = {
             'speed': 410,
@@ -321,33 +443,31 @@ class SpaceWeatherFetcher:
             'status': 'normal',
             'status_text': 'В пределах нормы',
             'status_badge': 'status-normal',
-            'average': 420,
+            'average': DEFAULT_AVERAGES['wind'],
             'difference': 0,
             'dynamics': '◆ 0%',
             'dynamics_class': 'dyn-flat',
-            'history': []
+            'history': PointSeries(label_key='time', value_key='speed', label_format='%H:%M:%S')
         }
 
-        if data and len(data) > 0:
-            # Берем последние 48 записей для истории
-            recent_data = data[-48:] if len(data) > 48 else data
-
-            # Текущее значение - последнее
-            latest = data[-1]
-            speed = latest.get('proton_speed', 410)
+        frame = await self.update_rtsw('proton', data)
+        latest = frame.latest('proton_speed')
+        if latest is not None:
+            # Текущие значения - последние измеренные по времени отсчета
+            speed = latest[1]
             result['speed'] = round(speed, 1)
-            result['density'] = round(latest.get('proton_density', 4.8), 2)
-            result['temperature'] = round(latest.get('proton_temperature', 80000))
-
-            # Формируем историю для графика
-            for item in recent_data:
-                time_tag = item.get('time_tag', '')
-                speed_val = item.get('proton_speed')
-                if speed_val is not None:
-                    result['history'].append({
-                        'time': time_tag[-8:] if time_tag else '',
-                        'speed': round(speed_val, 1)
-                    })
+            for key, field, digits in (('density', 'proton_density', 2), ('temperature', 'proton_temperature', None)):
+                value = frame.latest(field)
+                if value is not None:
+                    result[key] = round(value[1], digits)
+
+            # История для графика - последние минуты общей сетки (время - из time_tag, UTC)
+            times, speeds = frame.window('proton_speed', WIND_HISTORY_POINTS)
+            result['history'].times.extend(times.tolist())
+            result['history'].values.extend(np.round(speeds, 1).tolist())
+            gaps = frame.gaps('proton_speed', WIND_HISTORY_POINTS)
+            if gaps:
+                result['gaps'] = gaps
 
             # Определяем статус
             if speed > 600:
@@ -363,25 +483,27 @@ class SpaceWeatherFetcher:
                 result['status_text'] = 'Пониженная скорость'
                 result['status_badge'] = 'status-warning'
 
-            # Расчет динамики
-            result['average'] = 420
-            result['difference'] = round(result['speed'] - result['average'], 1)
-            diff_percent = round((result['difference'] / result['average']) * 100)
+            # Динамическое давление - последнее, для которого есть плотность (coupling.analyze)
+            if self.coupling is not None:
+                result['pressure'] = self.coupling['pressure']
+                if (result['status'] == 'normal' and result['pressure'] is not None
+                        and result['pressure'] >= PRESSURE_WARNING):
+                    result['status'] = 'warning'
+                    result['status_text'] = 'Высокое давление'
+                    result['status_badge'] = 'status-warning'
 
-            if result['difference'] > 0:
-                result['dynamics'] = f'▲ +{diff_percent}%'
-                result['dynamics_class'] = 'dyn-up'
-            elif result['difference'] < 0:
-                result['dynamics'] = f'▼ {diff_percent}%'
-                result['dynamics_class'] = 'dyn-down'
+            # Динамика относительно скользящего 30-дневного среднего
+            result['average'], comparison = self.baselines.compare('wind', result['speed'],
+                                                                   DEFAULT_AVERAGES['wind'])
+            result.update(comparison)
 
             print(f"✅ Solar wind: {result['speed']} км/с")
 
         return result
 
-    async def get_sun_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_sun_data(self, session: HttpClient) -> Dict:
         """Солнечная активность - для карточки Солнца"""
-        sunspots_data = await self.fetch_json(session, ENDPOINTS['sunspots'], 'Sunspots')
+        sunspots_data = await self.fetch_json(session, self.endpoints['sunspots'], 'Sunspots')
 
         result = {
             'sunspot_number': 85,
@@ -415,10 +537,13 @@ class SpaceWeatherFetcher:
 
         return result
 
-    async def get_geomagnetic_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_geomagnetic_data(self, session: HttpClient) -> Dict:
         """Геомагнитные данные - Dst и Bz"""
-        dst_data = await self.fetch_json(session, ENDPOINTS['dst'], 'Dst')
-        bz_data = await self.fetch_json(session, ENDPOINTS['bz_gms'], 'Bz')
+        dst_data, bz_data = await asyncio.gather(
+            self.fetch_json(session, self.endpoints['dst'], 'Dst', FEED_MAX_AGE['dst']),
+            self.fetch_json(session, self.endpoints['bz_gms'], 'Bz'),
+        )
+        await asyncio.gather(self.record_history('dst', dst_data), self.record_history('bz_gms', bz_data))
 
         result = {
             'dst': -10,
@@ -433,10 +558,12 @@ class SpaceWeatherFetcher:
             result['dst'] = round(dst_data[-1].get('dst', -10), 2)
             print(f"✅ Dst: {result['dst']} nT")
 
-        if bz_data and len(bz_data) > 0:
-            latest = bz_data[-1]
-            result['bt'] = round(latest.get('bt', 5), 2)
-            result['bz'] = round(latest.get('bz_gsm', 0), 2)
+        frame = await self.update_rtsw('bz_gms', bz_data)
+        bt, bz = frame.latest('bt'), frame.latest('bz_gsm')
+        if bt is not None:
+            result['bt'] = round(bt[1], 2)
+        if bz is not None:
+            result['bz'] = round(bz[1], 2)
             print(f"✅ Bz: {result['bz']} nT")
 
         bz = result['bz']
@@ -449,11 +576,20 @@ class SpaceWeatherFetcher:
             result['status_text'] = 'Южное направление'
             result['status_badge'] = 'status-warning'
 
+        # Оценка по всей сетке: длительность южного Bz, функция Ньюэлла, давление
+        coupling = self.coupling
+        if coupling is not None:
+            result['coupling'] = coupling
+            if LEVEL_ORDER[coupling['level']] > LEVEL_ORDER[result['status']]:
+                result['status'] = coupling['level']
+                result['status_text'] = coupling['reasons'][0].capitalize()
+                result['status_badge'] = f"status-{coupling['level']}"
+
         return result
 
-    async def get_cme_data(self, session: aiohttp.ClientSession) -> Dict:
+    async def get_cme_data(self, session: HttpClient) -> Dict:
         """Данные о CME из алертов NOAA"""
-        alerts_data = await self.fetch_json(session, ENDPOINTS['alerts'], 'NOAA Alerts')
+        alerts_data = await self.fetch_json(session, self.endpoints['alerts'], 'NOAA Alerts')
 
         result = {
             'count': 0,
@@ -462,7 +598,7 @@ class SpaceWeatherFetcher:
             'status_text': 'В пределах нормы',
             'status_badge': 'status-normal',
             'events': [],
-            'average': 2.5,
+            'average': DEFAULT_AVERAGES['cme'],
             'difference': 0,
             'dynamics': '◆ 0%',
             'dynamics_class': 'dyn-flat',
@@ -472,53 +608,34 @@ class SpaceWeatherFetcher:
             }
         }
 
-        if alerts_data and len(alerts_data) > 0:
-            week_ago = datetime.now() - timedelta(days=7)
-            cme_events = []
-
-            for alert in alerts_data:
-                message = alert.get('message', '').lower()
-                product_id = alert.get('product_id', '').lower()
-
-                if 'cme' in message or 'cme' in product_id or 'coronal mass ejection' in message:
-                    issue_time = alert.get('issue_datetime', '')
-                    if issue_time:
-                        try:
-                            for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ']:
-                                try:
-                                    alert_date = datetime.strptime(issue_time[:19], fmt)
-                                    break
-                                except:
-                                    continue
-                            else:
-                                alert_date = datetime.now()
-
-                            if alert_date > week_ago:
-                                speed = 0
-                                speed_match = re.search(r'(\d{3,4})\s*km/s', message, re.IGNORECASE)
-                                if speed_match:
-                                    speed = int(speed_match.group(1))
-
-                                cme_events.append({
-                                    'date': issue_time[:10],
-                                    'time': issue_time[11:16] if len(issue_time) > 16 else '00:00',
-                                    'speed': speed,
-                                    'message': message[:100] + '...' if len(message) > 100 else message
-                                })
-                        except:
-                            continue
+        if alerts_data and alerts_data is not self._alerts_source:
+            # Ответ 304 возвращает тот же объект - тогда лента не просматривается вовсе
+            added = self.alerts.ingest(alerts_data)
+            self._alerts_source = alerts_data
+            if added:
+                print(f"🔔 Алерты NOAA: новых {added}")
+            if self.alerts.dirty:
+                payload = self.alerts.dump()
+                try:
+                    await asyncio.to_thread(self.alerts.save, payload)
+                except OSError as e:
+                    print(f"⚠️ Индекс алертов: не удалось сохранить: {e}")
+
+        if alerts_data or len(self.alerts):
+            cme_events = [CmeEvent(alert.date, alert.time, alert.speed, alert.message)
+                          for alert in self.alerts.window('cme', time.time() - 7 * 86400)]
 
             result['count'] = len(cme_events)
             result['events'] = cme_events
 
             if cme_events:
-                speeds = [e['speed'] for e in cme_events if e['speed'] > 0]
+                speeds = [e.speed for e in cme_events if e.speed > 0]
                 result['max_speed'] = max(speeds) if speeds else 0
 
                 # Данные для графика
                 result['chart_data'] = {
                     'speeds': speeds[-5:],
-                    'dates': [e['date'] for e in cme_events][-5:]
+                    'dates': [e.date for e in cme_events][-5:]
                 }
 
             # Определяем статус
@@ -531,175 +648,415 @@ class SpaceWeatherFetcher:
                 result['status_text'] = 'Превышение нормы'
                 result['status_badge'] = 'status-warning'
 
-            # Расчет динамики
-            result['difference'] = round(result['count'] - result['average'], 1)
-            diff_percent = round((result['difference'] / result['average']) * 100) if result['average'] > 0 else 0
-
-            if result['difference'] > 0:
-                result['dynamics'] = f'▲ +{diff_percent}%'
-                result['dynamics_class'] = 'dyn-up'
-            elif result['difference'] < 0:
-                result['dynamics'] = f'▼ {diff_percent}%'
-                result['dynamics_class'] = 'dyn-down'
+            # Динамика относительно скользящего 30-дневного базового уровня
+            await self.record_daily_baseline('cme', result['count'])
+            result['average'], comparison = self.baselines.compare('cme', result['count'],
+                                                                   DEFAULT_AVERAGES['cme'])
+            result.update(comparison)
 
             print(f"✅ CME событий за 7 дней: {result['count']}")
 
         return result
 
-    async def get_aurora_image(self, session: aiohttp.ClientSession) -> Dict:
+    async def store_image(self, name: str, content: Optional[bytes]) -> Optional[Dict]:
+        """Кладет изображение в хранилище по хэшу; в снимок попадает только ссылка"""
+        if content is None:
+            # Оставляем последнее удачно загруженное изображение
+            digest = self.images.current.get(name)
+        else:
+            digest = hashlib.sha256(content).hexdigest()
+            if self.images.is_known(digest):
+                self.images.put(name, content, digest)
+            else:
+                # Новое изображение: запись на диск - вне event loop
+                await asyncio.to_thread(self.images.put, name, content, digest)
+                print(f"🖼 Aurora {name}: новое изображение {digest[:12]}")
+
+        if digest is None:
+            return None
+        return {
+            'hash': digest,
+            'url': f'/api/aurora/image/{digest}'
+        }
+
+    async def get_aurora_image(self, session: HttpClient) -> Dict:
         """Загрузка изображений полярных сияний"""
-        north = await self.fetch_image(session, ENDPOINTS['aurora_forecast'], 'Aurora North')
-        south = await self.fetch_image(session, ENDPOINTS['aurora_forecast_south'], 'Aurora South')
+        north, south = await asyncio.gather(
+            self.fetch_image(session, self.endpoints['aurora_forecast'], 'Aurora North'),
+            self.fetch_image(session, self.endpoints['aurora_forecast_south'], 'Aurora South'),
+        )
 
         return {
-            'north': north,
-            'south': south
+            'north': await self.store_image('north', north),
+            'south': await self.store_image('south', south)
         }
 
-    async def get_all_data(self) -> Dict:
-        """Главная функция - сбор всех данных"""
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.get_kp_data(session),
-                self.get_flare_data(session),
-                self.get_solar_wind_data(session),
-                self.get_sun_data(session),
-                self.get_geomagnetic_data(session),
-                self.get_cme_data(session),
-                self.get_aurora_image(session),
-                self.get_kp_forecast(session)
-            ]
-
-            results = await asyncio.gather(*tasks)
-
-            # Распаковываем результаты
-            kp_data = results[0]
-            flares_data = results[1]
-            wind_data = results[2]
-            sun_data = results[3]
-            geo_data = results[4]
-            cme_data = results[5]
-            aurora_images = results[6]
-            kp_forecast = results[7]
-
-            # Используем реальный прогноз
-            kp_data['forecast'] = kp_forecast
-
-            self.data = {
-                'kp': kp_data,
-                'flares': flares_data,
-                'solar_wind': wind_data,
-                'sun': sun_data,
-                'geomagnetic': geo_data,
-                'cme': cme_data,
-                'images': aurora_images if aurora_images else {},
-                'last_update': datetime.now().strftime('%d.%m.%Y %H:%M:%S'),
-
-                # Упрощенные поля для карточек
-                'kpIndex': kp_data['current'],
-                'kpStatus': kp_data['status_text'],
-                'kpStatusBadge': kp_data['status_badge'],
-                'kpHistoryFormatted': kp_data.get('history_formatted', []),
-
-                'cmeCount': cme_data['count'],
-                'cmeSpeed': f"{cme_data['max_speed']} км/с" if cme_data['max_speed'] > 0 else "—",
-                'cmeStatus': cme_data['status_badge'],
-                'cmeChartData': cme_data.get('chart_data', {'speeds': [], 'dates': []}),
-
-                'flareCount': flares_data['count'],
-                'flareClass': flares_data['strongest_class_display'],
-                'flaresStatus': flares_data['status_badge'],
-                'flareEvents': flares_data.get('events', []),
-
-                'windSpeed': f"{wind_data['speed']} км/с",
-                'windDensity': f"{wind_data['density']} p/см³",
-                'windStatus': wind_data['status_badge'],
-                'windHistory': wind_data.get('history', []),
-
-                'sunspotNumber': sun_data['display'],
-                'sunStatus': sun_data['status_badge'],
-
-                'eventsCount': flares_data['count'] + cme_data['count'],
-                'eventsStatus': 'status-warning' if flares_data['status'] in ['warning', 'danger'] or cme_data[
-                    'status'] in ['warning', 'danger'] else 'status-normal',
-
-                'flareProb': f"{flares_data['probability']}%",
-                'kpForecast': str(kp_data['forecast']),
-                'auroraProb': self.calculate_aurora_probability(kp_data['current']),
-
-                # Данные для сравнения
-                'comparison': {
-                    'cme': {
-                        'now': str(cme_data['count']),
-                        'avg': str(cme_data['average']),
-                        'diff': str(cme_data['difference']),
-                        'dyn': cme_data['dynamics'],
-                        'dyn_class': cme_data['dynamics_class'],
-                        'badge': cme_data['status_badge']
-                    },
-                    'flares': {
-                        'now': str(flares_data['count']),
-                        'avg': str(flares_data['average']),
-                        'diff': str(flares_data['difference']),
-                        'dyn': flares_data['dynamics'],
-                        'dyn_class': flares_data['dynamics_class'],
-                        'badge': flares_data['status_badge']
-                    },
-                    'kp': {
-                        'now': str(kp_data['current']),
-                        'avg': '3.2',
-                        'diff': str(round(kp_data['current'] - 3.2, 1)),
-                        'dyn': '◆ +3%',
-                        'dyn_class': 'dyn-flat',
-                        'badge': kp_data['status_badge']
-                    },
-                    'wind': {
-                        'now': str(wind_data['speed']),
-                        'avg': str(wind_data['average']),
-                        'diff': str(wind_data['difference']),
-                        'dyn': wind_data['dynamics'],
-                        'dyn_class': wind_data['dynamics_class'],
-                        'badge': wind_data['status_badge']
-                    }
-                },
+    async def get_aurora_grid(self, session: HttpClient) -> Dict:
+        """Сетка вероятности сияний 1°×1° по наукасту OVATION и текущему Kp"""
+        ovation = await self.fetch_json(session, self.endpoints['ovation'], 'OVATION', parse=load_ovation)
+        kp = self.sections.get('kp', {}).get('current', 3.3)
+        source = self._aurora_source
+        if source is None or source[0] is not ovation or source[1] != kp or self.aurora.current is None:
+            grid = await asyncio.to_thread(build_grid, kp, ovation)
+            try:
+                await asyncio.to_thread(self.aurora.put, grid)
+            except OSError as e:
+                print(f"⚠️ Сетка сияний: не удалось сохранить: {e}")
+                self.aurora.current = grid
+            self._aurora_source = (ovation, kp)
+            print(f"🌌 Сетка сияний ({grid.source}): максимум {grid.grid.max()}%")
+        return self.aurora.current.summary()
+
+    def section_processors(self) -> Dict:
+        """Обработчики разделов снимка (ключи совпадают с SECTION_SCHEDULE)"""
+        return {
+            'kp': self.get_kp_data,
+            'flares': self.get_flare_data,
+            'solar_wind': self.get_solar_wind_data,
+            'sun': self.get_sun_data,
+            'geomagnetic': self.get_geomagnetic_data,
+            'cme': self.get_cme_data,
+            'images': self.get_aurora_image,
+            'aurora': self.get_aurora_grid,
+            'kp_forecast': self.get_kp_forecast,
+        }
+
+    def feeds_validated_at(self, name: str) -> Optional[float]:
+        """Когда данные раздела последний раз подтверждались сервером NOAA"""
+        times = []
+        for key in SECTION_FEEDS[name]:
+            entry = self.http_cache.entries.get(self.endpoints[key])
+            if entry is None:
+                return None
+            times.append(entry.validated_at)
+        return min(times) if times else None
+
+    async def seed_sections(self):
+        """Заполняет отсутствующие разделы из HTTP-кэша без сетевых запросов
+
+        Так снимок можно опубликовать сразу, не дожидаясь самого медленного
+        продукта; такие разделы помечаются устаревшими.
+        """
+        processors = self.section_processors()
+        missing = [name for name in processors if name not in self.sections]
+        results = await asyncio.gather(*(processors[name](None) for name in missing))
+        for name, result in zip(missing, results):
+            self.sections[name] = result
+            self.section_meta[name] = {'updated_at': self.feeds_validated_at(name), 'stale': True}
+
+    async def refresh_section(self, session: HttpClient, name: str) -> bool:
+        """Обновляет один раздел в пределах его крайнего срока
+
+        Если срок пропущен или NOAA ответил ошибкой, остается последнее удачное
+        значение с пометкой stale. Возвращает True, если раздел обновлен свежими данными.
+        """
+        processor = self.section_processors()[name]
+        deadline = SECTION_SCHEDULE[name]['deadline']
+        stats = self.section_stats.setdefault(name, {'runs': 0, 'timeouts': 0, 'errors': 0})
+        meta = self.section_meta.setdefault(name, {'updated_at': None, 'stale': True})
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(processor(session), deadline)
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            meta['stale'] = True
+            print(f"⚠️ {name}: превышен срок {deadline} с, оставляем последние данные")
+            if name in self.sections:
+                return False
+            # Первого значения еще нет - берем последний ответ из HTTP-кэша
+            result = await processor(None)
+            self.sections[name] = result
+            return False
+
+        self.sections[name] = result
+        stats['runs'] += 1
+        stats['last_run'] = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
+        stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+        if any(self.endpoints[key] in self.feed_errors for key in SECTION_FEEDS[name]):
+            stats['errors'] += 1
+            meta['stale'] = True
+            return False
+        meta['updated_at'] = time.time()
+        meta['stale'] = False
+        return True
 
-                'total_events': flares_data['count'] + cme_data['count']
+    def freshness(self) -> Dict[str, Dict[str, Any]]:
+        """Свежесть разделов для снимка: признак stale и возраст данных (сек)"""
+        now = time.time()
+        result = {}
+        for name, meta in self.section_meta.items():
+            updated_at = meta['updated_at']
+            age = round(now - updated_at) if updated_at else None
+            # Раздел, не обновлявшийся дольше двух периодов, тоже считаем устаревшим
+            overdue = age is not None and age > 2 * SECTION_SCHEDULE[name]['interval']
+            result[name] = {
+                'stale': meta['stale'] or overdue,
+                'age_seconds': age,
+                'updated': datetime.fromtimestamp(updated_at).strftime('%d.%m.%Y %H:%M:%S') if updated_at else None,
             }
+        return result
 
-            # Общий статус
-            statuses = [kp_data['status'], flares_data['status'], cme_data['status']]
-            if 'danger' in statuses:
-                self.data['overall_status'] = 'danger'
-            elif 'warning' in statuses:
-                self.data['overall_status'] = 'warning'
-            else:
-                self.data['overall_status'] = 'normal'
-
-            # Выводим сводку
-            print("\n" + "=" * 60)
-            print("📊 СВОДКА СОБРАННЫХ ДАННЫХ")
-            print("=" * 60)
-            print(f"Kp: {kp_data['current']} ({kp_data['status_text']})")
-            print(f"Прогноз Kp: {kp_forecast}")
-            print(
-                f"Вспышки (7 дней): {flares_data['count']} (M: {flares_data['m_count']}, X: {flares_data['x_count']})")
-            print(f"Сильнейший класс: {flares_data['strongest_class']}")
-            print(f"CME (7 дней): {cme_data['count']}")
-            print(f"Солнечный ветер: {wind_data['speed']} км/с")
-            print(f"Пятен: {sun_data['sunspot_number']}")
-            print(f"Вероятность сияний: {self.data['auroraProb']}")
-            print("=" * 60)
-
-            return self.data
-
-
-def save_data_to_json(data: Dict, static_dir: str = 'static'):
-    """Сохранение данных в JSON файл"""
+    async def get_all_data(self, session: Optional[HttpClient] = None,
+                           sections: Optional[List[str]] = None) -> Dict:
+        """Главная функция - сбор данных и сборка снимка
+
+        sections - какие разделы обновить (по умолчанию все). Если передан
+        долгоживущий клиент (сервер), используем его; иначе открываем временный
+        (запуск как отдельного скрипта).
+        """
+        if session is None:
+            async with HttpClient() as client:
+                return await self.get_all_data(client, sections)
+
+        await self.seed_sections()
+        names = sections if sections is not None else list(self.section_processors())
+        await asyncio.gather(*(self.refresh_section(session, name) for name in names))
+
+        self.build_snapshot()
+        if sections is None:
+            self.print_summary()
+        return self.data
+
+    def build_snapshot(self) -> Dict:
+        """Сборка плоского снимка из последних значений разделов"""
+        # Копия, чтобы не менять уже опубликованный раздел
+        kp_data = dict(self.sections['kp'])
+        flares_data = self.sections['flares']
+        wind_data = self.sections['solar_wind']
+        sun_data = self.sections['sun']
+        geo_data = self.sections['geomagnetic']
+        cme_data = self.sections['cme']
+        aurora_images = self.sections['images']
+        kp_forecast = self.sections['kp_forecast']
+
+        # Используем реальный прогноз
+        kp_data['forecast'] = kp_forecast
+        kp_average, kp_comparison = self.baselines.compare('kp', kp_data['current'], DEFAULT_AVERAGES['kp'])
+
+        self.data = {
+            'kp': kp_data,
+            'flares': flares_data,
+            'solar_wind': wind_data,
+            'sun': sun_data,
+            'geomagnetic': geo_data,
+            'cme': cme_data,
+            'images': aurora_images if aurora_images else {},
+            'aurora': self.sections['aurora'],
+            'last_update': datetime.now().strftime('%d.%m.%Y %H:%M:%S'),
+            'freshness': self.freshness(),
+
+            # Упрощенные поля для карточек
+            'kpIndex': kp_data['current'],
+            'kpStatus': kp_data['status_text'],
+            'kpStatusBadge': kp_data['status_badge'],
+
+            'cmeCount': cme_data['count'],
+            'cmeSpeed': f"{cme_data['max_speed']} км/с" if cme_data['max_speed'] > 0 else "—",
+            'cmeStatus': cme_data['status_badge'],
+
+            'flareCount': flares_data['count'],
+            'flareClass': flares_data['strongest_class_display'],
+            'flaresStatus': flares_data['status_badge'],
+
+            'windSpeed': f"{wind_data['speed']} км/с",
+            'windDensity': f"{wind_data['density']} p/см³",
+            'windStatus': wind_data['status_badge'],
+
+            'sunspotNumber': sun_data['display'],
+            'sunStatus': sun_data['status_badge'],
+
+            'eventsCount': flares_data['count'] + cme_data['count'],
+            'eventsStatus': 'status-warning' if flares_data['status'] in ['warning', 'danger'] or cme_data[
+                'status'] in ['warning', 'danger'] else 'status-normal',
+
+            'flareProb': f"{flares_data['probability']}%",
+            'kpForecast': str(kp_data['forecast']),
+            'auroraProb': self.current_aurora_probability(),
+
+            # Данные для сравнения со скользящими 30-дневными базовыми уровнями
+            'comparison': {
+                'cme': {
+                    'now': str(cme_data['count']),
+                    'avg': str(cme_data['average']),
+                    'diff': str(cme_data['difference']),
+                    'dyn': cme_data['dynamics'],
+                    'dyn_class': cme_data['dynamics_class'],
+                    'badge': self.baselines.badge('cme', cme_data['count'], cme_data['status_badge'])
+                },
+                'flares': {
+                    'now': str(flares_data['count']),
+                    'avg': str(flares_data['average']),
+                    'diff': str(flares_data['difference']),
+                    'dyn': flares_data['dynamics'],
+                    'dyn_class': flares_data['dynamics_class'],
+                    'badge': self.baselines.badge('flares', flares_data['count'], flares_data['status_badge'])
+                },
+                'kp': {
+                    'now': str(kp_data['current']),
+                    'avg': str(kp_average),
+                    'diff': str(kp_comparison['difference']),
+                    'dyn': kp_comparison['dynamics'],
+                    'dyn_class': kp_comparison['dynamics_class'],
+                    'badge': self.baselines.badge('kp', kp_data['current'], kp_data['status_badge'])
+                },
+                'wind': {
+                    'now': str(wind_data['speed']),
+                    'avg': str(wind_data['average']),
+                    'diff': str(wind_data['difference']),
+                    'dyn': wind_data['dynamics'],
+                    'dyn_class': wind_data['dynamics_class'],
+                    'badge': self.baselines.badge('wind', wind_data['speed'], wind_data['status_badge'])
+                }
+            },
+            'baselines': self.baselines.summary(),
+
+            'total_events': flares_data['count'] + cme_data['count']
+        }
+
+        # Общий статус
+        statuses = [kp_data['status'], flares_data['status'], cme_data['status']]
+        if 'danger' in statuses:
+            self.data['overall_status'] = 'danger'
+        elif 'warning' in statuses:
+            self.data['overall_status'] = 'warning'
+        else:
+            self.data['overall_status'] = 'normal'
+
+        return self.data
+
+    def history_points(self, series: str, hours: int, step: int, reduce: str) -> List[Dict]:
+        """Точки графика из архива: {label: 'ЧЧ:ММ' (UTC), value} за последние hours часов"""
+        t_to = int(time.time())
+        points = self.history.query(series, t_to - hours * 3600, t_to, step)['points']
+        return [{'label': point['time'][11:16], 'value': point[reduce]} for point in points]
+
+    def build_live(self) -> Dict:
+        """Компактные данные для страницы - ровно то, что использует applyAllData в script.js
+
+        Строится из тех же разделов, что и снимок; историю для графиков
+        берем из архива, поэтому браузеру не нужны минутные ряды NOAA.
+        """
+        kp_data = self.sections['kp']
+        flares_data = self.sections['flares']
+        wind_data = self.sections['solar_wind']
+        geo_data = self.sections['geomagnetic']
+        cme_data = self.sections['cme']
+        coupling = geo_data.get('coupling')
+
+        kp_history = [{'label': p['label'], 'value': round(p['value'], 2)}
+                      for p in self.history_points('kp', 24, 3600, 'max')]
+        if not kp_history:
+            kp_history = kp_data['history_formatted'].points()
+        wind_history = [{'label': p['label'], 'value': round(p['value'])}
+                        for p in self.history_points('proton_speed', 24, 1800, 'mean')]
+        if not wind_history:
+            history = wind_data['history']
+            wind_history = [{'label': label[:5], 'value': round(value)}
+                            for label, value in zip(history.labels(), history.values)]
+
+        cme_events = []
+        for i, event in enumerate(cme_data.get('events', [])):
+            date = event.date
+            cme_events.append({
+                'num': i + 1,
+                'date': f"{date[8:10]}.{date[5:7]}.{date[:4]}",
+                'time': event.time,
+                'speed': event.speed or None,
+                'warn': event.speed > 450,
+            })
+
+        flare_events = []
+        for event in flares_data.get('events', []):
+            peak = event.peak_time
+            flare_events.append({
+                'date': peak.strftime('%d.%m.%Y'),
+                'time': peak.strftime('%H:%M'),
+                'cls': event.class_full,
+                'warn': event.cls in ('M', 'X'),
+            })
+
+        return {
+            'kp': kp_data['current'],
+            'kpForecast': self.sections['kp_forecast'],
+            'windSpeed': round(wind_data['speed']),
+            'windDensity': f"{wind_data['density']:.1f}",
+            'bz': f"{geo_data['bz']:.1f}",
+            'bt': f"{geo_data['bt']:.1f}",
+            'sunspots': self.sections['sun']['sunspot_number'],
+            'flareCount': flares_data['count'],
+            'flareClass': flares_data['strongest_class'],
+            'cmeCount': cme_data['count'],
+            'kpHistory': kp_history,
+            'windHistory': wind_history,
+            'cmeEvents': cme_events,
+            'flareEvents': flare_events,
+            'averages': {
+                'cme': cme_data['average'],
+                'flares': flares_data['average'],
+                'kp': self.baselines.average('kp', DEFAULT_AVERAGES['kp']),
+                'wind': wind_data['average'],
+            },
+            # Угроза бури по минутным данным RTSW (для баннера)
+            'storm': {'level': coupling['level'], 'reasons': coupling['reasons']} if coupling else None,
+            # Только признаки устаревания: ETag меняется лишь вместе с данными
+            'stale': sorted(name for name, meta in self.freshness().items() if meta['stale']),
+        }
+
+    def print_summary(self):
+        """Выводит сводку по текущему снимку"""
+        kp_data = self.data['kp']
+        flares_data = self.data['flares']
+        cme_data = self.data['cme']
+        wind_data = self.data['solar_wind']
+        sun_data = self.data['sun']
+
+        print("\n" + "=" * 60)
+        print("📊 СВОДКА СОБРАННЫХ ДАННЫХ")
+        print("=" * 60)
+        print(f"Kp: {kp_data['current']} ({kp_data['status_text']})")
+        print(f"Прогноз Kp: {kp_data['forecast']}")
+        print(
+            f"Вспышки (7 дней): {flares_data['count']} (M: {flares_data['m_count']}, X: {flares_data['x_count']})")
+        print(f"Сильнейший класс: {flares_data['strongest_class']}")
+        print(f"CME (7 дней): {cme_data['count']}")
+        print(f"Солнечный ветер: {wind_data['speed']} км/с")
+        print(f"Пятен: {sun_data['sunspot_number']}")
+        print(f"Вероятность сияний: {self.data['auroraProb']}")
+        for name, feed in self.http_cache.stats.items():
+            print(f"HTTP кэш {name}: hits {feed['hits']}, 304 {feed['revalidations']}, "
+                  f"загрузок {feed['misses']}, сэкономлено {feed['bytes_saved'] // 1024} КБ")
+        print("=" * 60)
+
+
+def save_data_to_json(data: Dict, static_dir: str = 'static', snapshot: Optional[Snapshot] = None):
+    """Сохранение снимка: компактный JSON, gzip/brotli варианты и манифест рядом с ним
+
+    Каждый файл пишется атомарно (временный файл, fsync, rename); манифест -
+    последним, поэтому его ETag подтверждает, что варианты от одного тела.
+    Если содержимое не изменилось, запись пропускается.
+    """
     os.makedirs(static_dir, exist_ok=True)
     json_path = os.path.join(static_dir, 'space_weather_data.json')
-
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if snapshot is None:
+        snapshot = Snapshot(data)
+
+    saved = read_manifest(json_path)
+    if saved is not None and saved.get('etag') == snapshot.etag and os.path.exists(json_path):
+        print(f"💾 Данные не изменились, {json_path} не перезаписан")
+        return json_path
+
+    write_atomic(json_path, snapshot.body)
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        payload = snapshot.encoded(encoding) if encoding in ENCODINGS else None
+        if payload is not None:
+            write_atomic(json_path + suffix, payload)
+        elif os.path.exists(json_path + suffix):
+            # Устаревший вариант не должен остаться рядом с новым телом
+            os.remove(json_path + suffix)
+    # Манифест: размеры, хэши и свежесть разделов - чтобы не читать весь снимок
+    save_manifest(snapshot.manifest(), json_path)
+    sync_directory(static_dir)
 
     print(f"💾 Данные сохранены в {json_path}")
     return json_path
@@ -0,0 +1,177 @@
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from xray import BAND_LONG, C_THRESHOLD, M_THRESHOLD, X_THRESHOLD
+
+# Критерии начала вспышки по методике SWPC (канал 0.1-0.8 нм):
+# четыре минутных отсчета подряд с монотонным ростом, каждый выше B1.0,
+# последний не меньше чем в 1.4 раза больше первого
+RISE_SAMPLES = 4
+RISE_RATIO = 1.4
+START_THRESHOLD = 1e-7
+# Разрыв в данных длиннее этого сбрасывает накопленный рост (секунды)
+MAX_GAP = 120
+# Начальное окно поиска конца события (отсчетов)
+MIN_WINDOW = 64
+
+
+class FlareDetector:
+    """Потоковый детектор вспышек: начало, пик и конец события
+
+    Состояние (водяной знак, незавершенное событие, окно роста) хранится
+    между обновлениями, поэтому каждый цикл обрабатывает только отсчеты,
+    пришедшие после последнего водяного знака.
+    """
+
+    def __init__(self, keep_days: int = 7):
+        self.keep_days = keep_days
+        self.watermark: Optional[np.datetime64] = None
+        self.events: List[Dict[str, Any]] = []
+        self.active: Optional[Dict[str, Any]] = None
+        self._rise: List[tuple] = []  # [(time, flux)] последние отсчеты роста
+
+    def update(self, columns: Dict[str, np.ndarray]) -> int:
+        """Обрабатывает новые отсчеты канала 0.1-0.8 нм; возвращает их число"""
+        times = columns['time']
+        flux = columns['flux']
+        mask = (columns['band'] == BAND_LONG) & ~np.isnat(times) & ~np.isnan(flux)
+        if self.watermark is not None:
+            mask &= times > self.watermark
+        if not mask.any():
+            return 0
+
+        new_times = times[mask]
+        new_flux = flux[mask]
+        order = np.argsort(new_times, kind='stable')
+        new_times = new_times[order]
+        new_flux = new_flux[order]
+
+        self._scan(new_times.astype('int64'), new_flux)
+        self.watermark = new_times[-1]
+        return int(new_times.size)
+
+    def _scan(self, times: np.ndarray, flux: np.ndarray):
+        """Проход по новым отсчетам: серии роста и триггеры начала считаются один раз
+        операциями над массивами, в Python - только переходы между состояниями
+        (по несколько скалярных операций на событие)
+
+        Окно роста из прошлого прохода (до RISE_SAMPLES - 1 отсчетов) ставится
+        перед новыми отсчетами.
+        """
+        carried = len(self._rise)
+        t = np.concatenate((np.array([item[0] for item in self._rise], dtype=np.int64), times))
+        f = np.concatenate((np.array([item[1] for item in self._rise], dtype=np.float64), flux))
+        valid = f >= START_THRESHOLD
+        valid[:carried] = True
+        # Отсчет продолжает рост предыдущего: оба годны, поток растет, разрыв не длиннее MAX_GAP
+        joined = np.zeros(f.size, dtype=bool)
+        joined[1:] = valid[1:] & valid[:-1] & (f[1:] > f[:-1]) & (np.diff(t) <= MAX_GAP)
+        index = np.arange(f.size)
+        length = np.where(valid, index - np.maximum.accumulate(np.where(joined, 0, index)) + 1, 0)
+        shift = RISE_SAMPLES - 1
+        trigger = np.zeros(f.size, dtype=bool)
+        trigger[shift:] = (length[shift:] >= RISE_SAMPLES) & (f[shift:] >= f[:-shift] * RISE_RATIO)
+        hits = np.flatnonzero(trigger)
+
+        self._rise = []
+        pos, end = 0, None
+        while True:
+            if self.active is not None:
+                end = self._track(t, f, pos)
+                if end is None:
+                    return
+                pos = end + 1
+                continue
+            k = self._next_trigger(t, f, valid, joined, hits, pos, end)
+            if k is None:
+                break
+            self.active = {
+                'start': int(t[k - shift]),
+                'start_flux': float(f[k - shift]),
+                'peak': int(t[k]),
+                'peak_flux': float(f[k]),
+                'end': None,
+            }
+            pos = k + 1
+
+        # Рост продолжается в следующем обновлении: хранятся последние отсчеты серии
+        last = f.size - 1
+        if end is not None and last - end < shift:
+            keep = 1
+            for i in range(end + 1, last + 1):
+                keep = keep + 1 if valid[i] and f[i] > f[i - 1] and t[i] - t[i - 1] <= MAX_GAP else int(valid[i])
+        else:
+            keep = int(length[-1]) if f.size else 0
+        keep = min(keep, shift)
+        self._rise = list(zip(t[f.size - keep:].tolist(), f[f.size - keep:].tolist())) if keep else []
+
+    @staticmethod
+    def _next_trigger(t: np.ndarray, f: np.ndarray, valid: np.ndarray, joined: np.ndarray,
+                      hits: np.ndarray, pos: int, end: Optional[int]) -> Optional[int]:
+        """Первый триггер начала вспышки не раньше pos; end - конец предыдущего события
+
+        После события рост начинается заново с его конца, поэтому триггер возможен
+        не раньше чем через RISE_SAMPLES - 1 отсчетов. Конец события входит в рост
+        и ниже порога - этот единственный случай проверяется отдельно.
+        """
+        shift = RISE_SAMPLES - 1
+        first = pos if end is None else end + shift
+        if end is not None and not valid[end] and first < f.size:
+            if (valid[end + 1] and f[end + 1] > f[end] and t[end + 1] - t[end] <= MAX_GAP
+                    and joined[end + 2:first + 1].all() and f[first] >= f[end] * RISE_RATIO):
+                return first
+        i = int(np.searchsorted(hits, first))
+        return int(hits[i]) if i < hits.size else None
+
+    def _track(self, t: np.ndarray, f: np.ndarray, pos: int) -> Optional[int]:
+        """Пик и конец активного события с отсчета pos: конец - поток опустился до
+        середины между пиком и фоном; индекс отсчета-конца или None
+
+        Поиск идет окнами, удваивающимися, пока конец не найден.
+        """
+        event = self.active
+        size = MIN_WINDOW
+        while pos < f.size:
+            window = f[pos:pos + size]
+            peak = np.maximum(np.maximum.accumulate(window), event['peak_flux'])
+            ends = np.flatnonzero(window <= (peak + event['start_flux']) / 2)
+            last = int(ends[0]) if ends.size else window.size
+            if last:
+                top = int(np.argmax(window[:last]))
+                if window[top] > event['peak_flux']:
+                    event['peak_flux'] = float(window[top])
+                    event['peak'] = int(t[pos + top])
+            if ends.size:
+                event['end'] = int(t[pos + last])
+                self._finish(event)
+                self.active = None
+                return pos + last
+            pos += window.size
+            size *= 2
+        return None
+
+    def _finish(self, event: Dict[str, Any]):
+        # Событие ниже C1.0 в пике вспышкой не считаем
+        if event['peak_flux'] >= C_THRESHOLD:
+            self.events.append(event)
+        if self.watermark is not None:
+            horizon = int(self.watermark.astype('int64')) - self.keep_days * 86400
+            while self.events and self.events[0]['peak'] < horizon:
+                self.events.pop(0)
+
+    def summary(self, now: datetime, recent: int = 5) -> Dict[str, Any]:
+        """Вспышки >= C1.0 за keep_days дней (включая незавершенную)"""
+        since = now.timestamp() - self.keep_days * 86400
+        events = [e for e in self.events if e['peak'] > since]
+        if self.active is not None and self.active['peak_flux'] >= C_THRESHOLD and self.active['peak'] > since:
+            events.append(self.active)
+
+        peaks = [e['peak_flux'] for e in events]
+        return {
+            'count': len(events),
+            'm_count': sum(1 for p in peaks if M_THRESHOLD <= p < X_THRESHOLD),
+            'x_count': sum(1 for p in peaks if p >= X_THRESHOLD),
+            'strongest_flux': max(peaks) if peaks else 0.0,
+            'recent': events[-recent:],
+        }
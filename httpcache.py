@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+
+class CacheEntry:
+    """Сохраненный ответ: валидаторы, тело на диске и разобранный результат в памяти"""
+
+    __slots__ = ('url', 'etag', 'last_modified', 'expires_at', 'size', 'stored_at', 'validated_at', 'parsed')
+
+    def __init__(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 expires_at: float = 0.0, size: int = 0, stored_at: float = 0.0,
+                 validated_at: Optional[float] = None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.size = size
+        self.stored_at = stored_at
+        self.validated_at = validated_at if validated_at is not None else stored_at
+        self.parsed: Any = None
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def is_fresh(self, max_age: float = 0) -> bool:
+        """Свеж ли ответ: по заголовкам сервера или по нашему минимальному возрасту"""
+        now = time.time()
+        return now < self.expires_at or now < self.validated_at + max_age
+
+    def to_meta(self) -> Dict:
+        return {
+            'url': self.url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'expires_at': self.expires_at,
+            'size': self.size,
+            'stored_at': self.stored_at,
+            'validated_at': self.validated_at,
+        }
+
+
+def expiry_from_headers(headers) -> float:
+    """Срок свежести ответа по Cache-Control: max-age или Expires (0 - сразу устарел)"""
+    cache_control = headers.get('Cache-Control', '')
+    for part in cache_control.split(','):
+        part = part.strip().lower()
+        if part in ('no-cache', 'no-store'):
+            return 0.0
+        if part.startswith('max-age='):
+            try:
+                return time.time() + int(part[8:])
+            except ValueError:
+                return 0.0
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+class HttpCache:
+    """Постоянный HTTP-кэш ответов NOAA с условными запросами (ETag / Last-Modified)
+
+    Тело ответа хранится на диске, разобранный результат - в памяти, поэтому
+    ответ 304 не требует ни загрузки, ни повторного разбора JSON.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.entries: Dict[str, CacheEntry] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+    def _paths(self, url: str):
+        key = self._key(url)
+        return (os.path.join(self.directory, f"{key}.body"),
+                os.path.join(self.directory, f"{key}.meta.json"))
+
+    def feed_stats(self, name: str) -> Dict[str, int]:
+        if name not in self.stats:
+            self.stats[name] = {'hits': 0, 'revalidations': 0, 'misses': 0, 'bytes_saved': 0}
+        return self.stats[name]
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Запись для URL; при первом обращении подгружаются метаданные с диска"""
+        entry = self.entries.get(url)
+        if entry is not None:
+            return entry
+        body_path, meta_path = self._paths(url)
+        try:
+            if os.path.exists(meta_path) and os.path.exists(body_path):
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta.get('url') == url:
+                    entry = CacheEntry(**meta)
+                    self.entries[url] = entry
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ HTTP кэш: не удалось прочитать {meta_path}: {e}")
+        return entry
+
+    def read_body(self, entry: CacheEntry) -> Optional[bytes]:
+        body_path, _ = self._paths(entry.url)
+        try:
+            with open(body_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, url: str, headers, body: bytes, parsed: Any) -> CacheEntry:
+        """Сохраняет новый ответ 200 (тело и метаданные пишутся атомарно)"""
+        entry = CacheEntry(
+            url,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+            expires_at=expiry_from_headers(headers),
+            size=len(body),
+            stored_at=time.time(),
+        )
+        entry.parsed = parsed
+        self.entries[url] = entry
+
+        if entry.etag or entry.last_modified or entry.expires_at:
+            os.makedirs(self.directory, exist_ok=True)
+            body_path, meta_path = self._paths(url)
+            for path, content in ((body_path, body),
+                                  (meta_path, json.dumps(entry.to_meta()).encode('utf-8'))):
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+        return entry
+
+    def refresh_validators(self, entry: CacheEntry, headers):
+        """Ответ 304 может продлить срок свежести и сменить валидаторы"""
+        entry.etag = headers.get('ETag', entry.etag)
+        entry.last_modified = headers.get('Last-Modified', entry.last_modified)
+        entry.expires_at = expiry_from_headers(headers)
+        entry.validated_at = time.time()
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+import aiohttp
+
+# Пул соединений: всего и на один хост (NOAA - один хост, поэтому лимит важен)
+POOL_LIMIT = 20
+POOL_LIMIT_PER_HOST = 6
+# Раздельные таймауты: установка соединения и ожидание данных (сек)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+# Повторы при сетевых ошибках, 5xx и 429: экспоненциальная задержка с полным разбросом
+RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4.0
+# Хеджирование: второй запрос, если первый дольше p90 недавних ответов (сек)
+HEDGE_DELAY_DEFAULT = 1.0
+HEDGE_DELAY_MIN = 0.2
+LATENCY_WINDOW = 50
+# Предохранитель: после стольких неудач подряд эндпоинт отключается на время
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 60
+BREAKER_MAX_COOLDOWN = 900
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Эндпоинт временно отключен предохранителем - запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """Предохранитель одного эндпоинта: closed -> open -> пробный запрос (half-open)
+
+    После BREAKER_THRESHOLD неудач подряд запросы не отправляются в течение
+    паузы; затем пропускается один пробный. Неудачный пробный удваивает паузу.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        # Пробный запрос; остальные ждут его результата еще одну паузу
+        self.opened_at = time.monotonic()
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = self.base_cooldown
+
+    def failure(self):
+        self.failures += 1
+        if self.opened_at is not None:
+            self.opened_at = time.monotonic()
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    """Долгоживущий HTTP-клиент сборщика: пул keep-alive соединений, повторы,
+    хеджирование запросов и предохранители по эндпоинтам
+
+    Ответ читается целиком и возвращается как (статус, заголовки, тело).
+    """
+
+    def __init__(self, limit: int = POOL_LIMIT, limit_per_host: int = POOL_LIMIT_PER_HOST,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 retries: int = RETRIES):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout,
+                                             sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, deque] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def closed(self) -> bool:
+        return self.session is None or self.session.closed
+
+    def open(self):
+        if self.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=300, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> 'HttpClient':
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def endpoint_stats(self, url: str) -> Dict[str, Any]:
+        if url not in self.stats:
+            self.stats[url] = {'requests': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0,
+                               'failures': 0, 'short_circuited': 0}
+        return self.stats[url]
+
+    def hedge_delay(self, url: str) -> float:
+        """p90 последних задержек эндпоинта - дольше ждать первый запрос нет смысла"""
+        window = self.latencies.get(url)
+        if not window or len(window) < 5:
+            return HEDGE_DELAY_DEFAULT
+        ordered = sorted(window)
+        return max(HEDGE_DELAY_MIN, ordered[int(len(ordered) * 0.9)])
+
+    async def _attempt(self, url: str, headers: Dict[str, str]) -> Tuple[int, Any, bytes]:
+        started = time.monotonic()
+        async with self.session.get(url, headers=headers) as response:
+            body = await response.read()
+        # Задержка одной попытки (без ожидания хеджа) - основа для hedge_delay
+        self.latencies.setdefault(url, deque(maxlen=LATENCY_WINDOW)).append(time.monotonic() - started)
+        return response.status, response.headers.copy(), body
+
+    async def _hedged(self, url: str, headers: Dict[str, str], stats: Dict[str, Any]) -> Tuple[int, Any, bytes]:
+        """Если первый запрос не ответил за hedge_delay, отправляется второй; берется первый удачный"""
+        first = asyncio.create_task(self._attempt(url, headers))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(url))
+            if done:
+                return first.result()
+            stats['hedged'] += 1
+            second = asyncio.create_task(self._attempt(url, headers))
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is second:
+                            stats['hedge_wins'] += 1
+                        return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None,
+                  hedge: bool = False) -> Tuple[int, Any, bytes]:
+        """GET с повторами и предохранителем; hedge - для частых продуктов, где важна задержка"""
+        self.open()
+        headers = headers or {}
+        stats = self.endpoint_stats(url)
+        breaker = self.breakers.setdefault(url, CircuitBreaker())
+        if not breaker.allow():
+            stats['short_circuited'] += 1
+            raise CircuitOpenError(f"эндпоинт отключен после {breaker.failures} неудач подряд")
+
+        stats['requests'] += 1
+        for attempt in range(self.retries + 1):
+            try:
+                if hedge:
+                    status, response_headers, body = await self._hedged(url, headers, stats)
+                else:
+                    status, response_headers, body = await self._attempt(url, headers)
+                error = f"HTTP {status}" if status in RETRY_STATUSES else None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            if error is None:
+                if status < 400:
+                    breaker.success()
+                else:
+                    breaker.failure()
+                return status, response_headers, body
+            if attempt < self.retries:
+                stats['retries'] += 1
+                await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+        stats['failures'] += 1
+        breaker.failure()
+        raise RuntimeError(error)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по эндпоинтам с состоянием предохранителя - для /api/status"""
+        result = {}
+        for url, stats in self.stats.items():
+            breaker = self.breakers.get(url)
+            result[url] = dict(stats, breaker=breaker.state if breaker else 'closed',
+                               hedge_delay_ms=round(self.hedge_delay(url) * 1000))
+        return result
@@ -0,0 +1,89 @@
+import hashlib
+import os
+from typing import Dict, Optional, Set
+
+# Сколько последних изображений держать на диске сверх актуальных
+# (для воркеров и страниц, которые еще ссылаются на предыдущий снимок)
+KEEP_IMAGES = 4
+
+
+class ImageStore:
+    """Хранилище изображений по хэшу содержимого (content-addressed)
+
+    Каждое изображение записывается на диск один раз под именем <sha256>.jpg;
+    повторная загрузка той же картинки не вызывает никакого ввода-вывода.
+    Старые изображения удаляются, кроме актуальных и KEEP_IMAGES последних.
+
+    Хэши файлов на диске известны в памяти (их обновляют put и prune), поэтому
+    is_known и cached не обращаются к диску и годятся для event loop.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.current: Dict[str, str] = {}   # имя (north/south) -> хэш
+        self._blobs: Dict[str, bytes] = {}  # хэш -> байты актуальных изображений
+        self._stored: Set[str] = set()      # хэши изображений на диске
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def is_known(self, digest: str) -> bool:
+        """Изображение уже сохранено (только по памяти, без обращения к диску)"""
+        return digest in self._blobs or digest in self._stored
+
+    def put(self, name: str, content: bytes, digest: Optional[str] = None) -> str:
+        """Сохраняет изображение, если такого хэша еще нет; возвращает хэш
+
+        Для неизвестного хэша (is_known - False) вызывать в потоке: проверка
+        и запись файла, prune - дисковые операции.
+        """
+        digest = digest or hashlib.sha256(content).hexdigest()
+        known = self.is_known(digest)
+        if not known and not os.path.exists(self.path_for(digest)):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.path_for(digest) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, self.path_for(digest))
+        self._stored.add(digest)
+
+        previous = self.current.get(name)
+        self.current[name] = digest
+        self._blobs[digest] = content
+        # В памяти держим только актуальные изображения
+        if previous and previous != digest and previous not in self.current.values():
+            self._blobs.pop(previous, None)
+        if not known:
+            self.prune()
+        return digest
+
+    def prune(self):
+        """Удаляет с диска изображения, кроме актуальных и KEEP_IMAGES последних"""
+        current = {self.path_for(digest) for digest in self.current.values()}
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.jpg')]
+        files = sorted((entry for entry in entries if entry.path not in current),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in files[KEEP_IMAGES:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        removed = {entry.name for entry in files[KEEP_IMAGES:]}
+        self._stored = {entry.name[:-4] for entry in entries if entry.name not in removed}
+
+    def cached(self, digest: str) -> Optional[bytes]:
+        """Байты актуального изображения из памяти (без обращения к диску)"""
+        return self._blobs.get(digest)
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Байты изображения по хэшу (из памяти или с диска - вызывать в потоке)"""
+        content = self._blobs.get(digest)
+        if content is not None:
+            return content
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        return None
@@ -1,16 +1,18 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi import BackgroundTasks
-import subprocess
+from fastapi import Query
 from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 import asyncio
 import os
-import json
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional
+import time
 import uvicorn
-import sys
+
+from engine import RefreshEngine
+from snapshot import SnapshotStore, read_manifest, negotiate_encoding
 
 # Создаем FastAPI приложение
 app = FastAPI(title="Space Weather Monitor", description="Мониторинг космической погоды")
@@ -18,6 +20,17 @@ app = FastAPI(title="Space Weather Monitor", description="Мониторинг 
 # Монтируем статические файлы (CSS, JS, JSON)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Путь к сохраненному снимку (используется при старте, до первого обновления)
+JSON_PATH = os.path.join("static", "space_weather_data.json")
+
+# Текущий снимок в памяти: готовые байты, gzip и ETag
+store = SnapshotStore()
+# Компактные данные для страницы (то, что выводит script.js)
+live_store = SnapshotStore()
+
+# Фоновое обновление данных NOAA в процессе сервера (у каждого раздела свой период)
+engine = RefreshEngine(store=store, live_store=live_store)
+
 
 # Настраиваем шаблоны (если используете Jinja2)
 # templates = Jinja2Templates(directory="templates")
@@ -26,29 +39,119 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ============================================
 
+def get_snapshot():
+    """Текущий снимок из памяти; до первого обновления - загружается из JSON файла"""
+    if store.current is None:
+        store.load_file(JSON_PATH)
+    return store.current
+
+
 def get_weather_data():
-    """Получить данные из JSON файла"""
-    json_path = os.path.join("static", "space_weather_data.json")
-    try:
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return None
-    except Exception as e:
-        print(f"Ошибка чтения JSON: {e}")
-        return None
+    """Получить текущие данные"""
+    snapshot = get_snapshot()
+    return snapshot.data if snapshot is not None else None
+
+
+def get_manifest():
+    """Сводка текущего снимка (без данных); до загрузки - манифест с диска"""
+    snapshot = store.current
+    if snapshot is not None:
+        return snapshot.manifest()
+    return read_manifest(JSON_PATH)
 
 
 def get_last_update_time():
     """Получить время последнего обновления данных"""
-    json_path = os.path.join("static", "space_weather_data.json")
-    try:
-        if os.path.exists(json_path):
-            mod_time = os.path.getmtime(json_path)
-            return datetime.fromtimestamp(mod_time).strftime("%d.%m.%Y %H:%M:%S")
+    snapshot = store.current
+    timestamp = snapshot.timestamp if snapshot is not None else (read_manifest(JSON_PATH) or {}).get("timestamp")
+    if timestamp is None:
         return "Данные отсутствуют"
-    except Exception as e:
-        return "Ошибка"
+    return datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y %H:%M:%S")
+
+
+def current_image_hash(hemisphere: str):
+    """Хэш актуального изображения сияний (из хранилища или из снимка)"""
+    digest = engine.fetcher.images.current.get(hemisphere)
+    if digest is None and store.current is not None:
+        image = store.current.section("images", {}).get(hemisphere)
+        if isinstance(image, dict):
+            digest = image.get("hash")
+    return digest
+
+
+async def load_image(digest: str):
+    """Изображение по хэшу: актуальное - из памяти, остальные (и у воркеров-читателей) - с диска в потоке"""
+    images = engine.fetcher.images
+    content = images.cached(digest)
+    if content is None:
+        content = await asyncio.to_thread(images.get, digest)
+    return content
+
+
+def current_aurora_grid():
+    """Сетка вероятности сияний текущего снимка (воркер без опроса NOAA читает ее с диска)"""
+    aurora = engine.fetcher.aurora
+    section = store.current.section("aurora") if store.current is not None else None
+    if isinstance(section, dict) and section.get("grid"):
+        return aurora.get(section["grid"]) or aurora.current
+    return aurora.current
+
+
+class SnapshotBytesResponse(Response):
+    """Response, который принимает и memoryview: байты снимка из общей области
+    отдаются без копирования"""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, memoryview):
+            return content
+        return super().render(content)
+
+
+def snapshot_response(request: Request, snapshot) -> Response:
+    """Отдает готовые байты снимка: 304, brotli, gzip или несжатый вариант"""
+    if snapshot.not_modified(request.headers.get("if-none-match"),
+                             request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=snapshot.headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is not None:
+        headers = dict(snapshot.headers)
+        headers["Content-Encoding"] = encoding
+        return SnapshotBytesResponse(content=snapshot.encoded(encoding), media_type="application/json",
+                                     headers=headers)
+    return SnapshotBytesResponse(content=snapshot.body, media_type="application/json", headers=snapshot.headers)
+
+
+def parse_time_param(value: Optional[str], default: int) -> int:
+    """Граница диапазона истории: секунды Unix или ISO дата/время (UTC)"""
+    if not value:
+        return default
+    if value.lstrip('-').isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Неверное время: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+STEP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Предел пакетного запроса вероятности сияний
+MAX_AURORA_POINTS = 10000
+
+
+def parse_step(value: Optional[str]) -> int:
+    """Шаг свертки: 300, 5m, 1h, 1d (0 - сырые отсчеты)"""
+    if not value:
+        return 0
+    unit = STEP_UNITS.get(value[-1].lower())
+    number = value[:-1] if unit else value
+    if not number.isdigit():
+        raise HTTPException(status_code=400, detail=f"Неверный шаг: {value}")
+    return int(number) * (unit or 1)
 
 
 # ============================================
@@ -66,96 +169,263 @@ async def read_root():
     return HTMLResponse(content="<h1>Файл index.html не найден</h1>")
 
 
+def parse_fields(fields: Optional[str]) -> Optional[list]:
+    """?fields=kp,solar_wind -> ['kp', 'solar_wind']"""
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()]
+
+
+def projection_response(request: Request, snapshot, fields: list) -> Response:
+    """Только запрошенные разделы из готовых байтов снимка (сжатые варианты кэшируются в снимке)"""
+    variant = snapshot.projection(fields)
+    headers = {"ETag": variant.etag, "X-Snapshot-Version": str(snapshot.version),
+               "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == variant.etag:
+        return Response(status_code=304, headers=headers)
+    body, encoding = variant.encoded(negotiate_encoding(request.headers.get("accept-encoding", "")))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def delta_response(request: Request, snapshot, since: int, patch: bool, fields: Optional[list] = None) -> Response:
+    """Только разделы, изменившиеся после версии клиента (или JSON Patch)"""
+    headers = {"X-Snapshot-Version": str(snapshot.version), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if since == snapshot.version:
+        return Response(status_code=304, headers=headers)
+    variant = snapshot.delta_variant(since, fields, patch)
+    media_type = "application/json-patch+json" if patch else "application/json"
+    body, encoding = variant.encoded(negotiate_encoding(request.headers.get("accept-encoding", "")))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 @app.get("/api/weather-data")
-async def api_weather_data():
-    """API endpoint для получения данных в формате JSON"""
-    data = get_weather_data()
-    if data:
-        return JSONResponse(content=data)
+async def api_weather_data(request: Request, since: Optional[int] = None, format: Optional[str] = None,
+                           fields: Optional[str] = None):
+    """API endpoint для получения данных в формате JSON
+
+    since - версия, которая уже есть у клиента (заголовок X-Snapshot-Version):
+    в ответе только изменившиеся с нее разделы; format=patch - в виде JSON Patch.
+    fields=kp,solar_wind - только перечисленные разделы.
+    """
+    snapshot = store.current
+    if snapshot is not None:
+        selected = parse_fields(fields)
+        # Версия из будущего (другой сервер) - отдаем полный снимок
+        if since is not None and 0 <= since <= snapshot.version:
+            return delta_response(request, snapshot, since, format == "patch", selected)
+        if selected is not None:
+            return projection_response(request, snapshot, selected)
+        return snapshot_response(request, snapshot)
     return JSONResponse(
         status_code=404,
         content={"error": "Данные не найдены", "last_update": get_last_update_time()}
     )
 
 
+@app.get("/api/live")
+async def api_live(request: Request):
+    """Данные для страницы одним небольшим ответом: браузеры не обращаются к NOAA"""
+    snapshot = live_store.current
+    if snapshot is not None:
+        return snapshot_response(request, snapshot)
+    return JSONResponse(status_code=503, content={"error": "Данные еще не собраны"})
+
+
+@app.get("/api/events")
+async def api_events(request: Request):
+    """Push-канал (Server-Sent Events): версии данных при каждой публикации"""
+    return engine.push.response(request)
+
+
 @app.get("/api/status")
 async def api_status():
     """Проверка статуса сервера"""
-    data = get_weather_data()
     return {
         "status": "running",
-        "data_available": data is not None,
+        "data_available": store.current is not None,
+        "snapshot": get_manifest(),
         "last_update": get_last_update_time(),
-        "server_time": datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        "server_time": datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+        "refresh": engine.stats,
+        "sections": engine.fetcher.section_stats,
+        "upstream_cache": engine.fetcher.http_cache.stats,
+        "upstream": engine.client.summary(),
+        "push": engine.push.stats,
+        "notify": engine.notifier.stats,
+        "worker": {"pid": os.getpid(), "leader": engine.is_leader}
     }
 
 
+@app.get("/api/history/{series}")
+async def api_history(series: str,
+                      time_from: Optional[str] = Query(None, alias="from"),
+                      time_to: Optional[str] = Query(None, alias="to"),
+                      step: Optional[str] = None):
+    """История ряда из локального архива: сырые отсчеты или min/max/mean по step
+
+    По умолчанию - последние сутки; при большом числе точек шаг выбирается сам.
+    """
+    history = engine.fetcher.history
+    if series not in history:
+        raise HTTPException(status_code=404, detail=f"Неизвестный ряд: {series}")
+    t_to = parse_time_param(time_to, int(time.time()))
+    t_from = parse_time_param(time_from, t_to - 86400)
+    if t_from > t_to:
+        raise HTTPException(status_code=400, detail="Начало диапазона позже конца")
+    return await asyncio.to_thread(history.query, series, t_from, t_to, parse_step(step))
+
+
+@app.get("/api/aurora")
+async def api_aurora_probability(request: Request, lat: float = Query(..., ge=-90, le=90),
+                                 lon: float = Query(..., ge=-180, le=360)):
+    """Вероятность увидеть сияние в точке (%) - поиск в готовой сетке снимка"""
+    grid = current_aurora_grid()
+    if grid is None:
+        return JSONResponse(status_code=503, content={"error": "Сетка сияний еще не построена"})
+    headers = {"ETag": f'"{grid.digest[:32]}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    content = {"lat": lat, "lon": lon, "probability": grid.lookup(lat, lon), **grid.summary()}
+    return JSONResponse(content=content, headers=headers)
+
+
+@app.post("/api/aurora")
+async def api_aurora_batch(request: Request):
+    """Пакетный запрос: {"points": [[lat, lon], ...]} -> вероятности в том же порядке"""
+    grid = current_aurora_grid()
+    if grid is None:
+        return JSONResponse(status_code=503, content={"error": "Сетка сияний еще не построена"})
+    try:
+        points = [(float(lat), float(lon)) for lat, lon in (await request.json())["points"]]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail='Ожидается {"points": [[lat, lon], ...]}')
+    if len(points) > MAX_AURORA_POINTS:
+        raise HTTPException(status_code=413, detail=f"Не больше {MAX_AURORA_POINTS} точек за запрос")
+    if any(not (-90 <= lat <= 90 and -180 <= lon <= 360) for lat, lon in points):
+        raise HTTPException(status_code=400, detail="Широта - от -90 до 90, долгота - от -180 до 360")
+    lats, lons = [lat for lat, _ in points], [lon for _, lon in points]
+    return {"probabilities": grid.lookup_many(lats, lons).tolist(), **grid.summary()}
+
+
+@app.get("/api/aurora/image/{digest}")
+async def api_aurora_image(digest: str):
+    """Изображение сияний по хэшу содержимого - не меняется никогда"""
+    content = await load_image(digest)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    return Response(content=content, media_type="image/jpeg", headers={
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    })
+
+
+@app.get("/api/aurora/{hemisphere}")
+async def api_aurora(hemisphere: str, request: Request):
+    """Актуальное изображение сияний для полушария (north/south)"""
+    if hemisphere not in ("north", "south"):
+        raise HTTPException(status_code=404, detail="Неизвестное полушарие")
+    digest = current_image_hash(hemisphere)
+    content = await load_image(digest) if digest else None
+    if content is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="image/jpeg", headers=headers)
+
+
 @app.get("/health")
 async def health_check():
     """Проверка здоровья сервера"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
-@app.post("/api/update-data")
-async def update_data(background_tasks: BackgroundTasks):
+@app.post("/api/update-data", status_code=202)
+async def update_data():
     """
     Запускает обновление данных из NOAA в фоновом режиме
+
+    Повторные запросы присоединяются к идущему обновлению; состояние -
+    GET /api/update-data/{job_id}.
     """
+    job, outcome = engine.request_update()
+    messages = {
+        "started": "Обновление данных запущено",
+        "joined": "Обновление уже идет, запрос присоединен к нему",
+        "debounced": "Данные только что обновлены",
+        "unavailable": "Данные еще не загружены ведущим процессом, повторите позже",
+    }
+    return {
+        "status": outcome,
+        "message": messages[outcome],
+        "job": job["id"],
+        "url": f"/api/update-data/{job['id']}",
+    }
 
-    def run_fetcher():
-        try:
-            # Запускаем fetcher.py как отдельный процесс
-            result = subprocess.run(
-                [sys.executable, "fetcher.py"],
-                capture_output=True,
-                text=True,
-                timeout=120  # таймаут 2 минуты
-            )
-            if result.returncode == 0:
-                print(f"✅ Данные успешно обновлены: {result.stdout}")
-            else:
-                print(f"❌ Ошибка при обновлении: {result.stderr}")
-        except Exception as e:
-            print(f"❌ Исключение при обновлении: {e}")
-
-    # Запускаем в фоне, чтобы не блокировать ответ
-    background_tasks.add_task(run_fetcher)
-
-    return {"status": "started", "message": "Обновление данных запущено"}
-
-
-async def run_fetcher_periodically():
-    """Запускает fetcher каждые 3 минуты в фоне"""
-    while True:
-        try:
-            print(f"\n{'=' * 60}")
-            print(f"🕐 Автоматический запуск fetcher в {datetime.now().strftime('%H:%M:%S')}")
-            print(f"{'=' * 60}\n")
-
-            # Запускаем fetcher.py
-            result = subprocess.run(
-                [sys.executable, "fetcher.py"],
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
-            if result.returncode == 0:
-                print("✅ Автообновление успешно")
-            else:
-                print(f"❌ Ошибка автообновления: {result.stderr}")
-
-        except Exception as e:
-            print(f"❌ Исключение в автообновлении: {e}")
-
-        # Ждем 3 минуты
-        await asyncio.sleep(180)
+
+@app.get("/api/update-data/{job_id}")
+async def update_data_status(job_id: str):
+    """Состояние и длительность задания ручного обновления"""
+    job = engine.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return engine.job_info(job)
+
+
+@app.post("/api/subscriptions", status_code=201)
+async def subscribe(request: Request):
+    """Подписка на уведомления Telegram: {"username": "@user", "events": ["Kp≥5", ...]}
+
+    Пользователь сначала пишет /start боту - по этому сообщению сервер узнает чат.
+    """
+    notifier = engine.notifier
+    if not notifier.enabled:
+        raise HTTPException(status_code=503, detail="Уведомления на сервере не настроены")
+    try:
+        body = await request.json()
+        username, events = str(body["username"]).strip(), [str(event) for event in body.get("events", [])]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise HTTPException(status_code=400, detail='Ожидается {"username": "@user", "events": [...]}')
+    if len(username.lstrip("@")) < 2:
+        raise HTTPException(status_code=400, detail="Не указан username")
+    data = store.current.data if store.current is not None else None
+    subscription = await notifier.subscribe(username, events, data)
+    if subscription is None:
+        raise HTTPException(status_code=404, detail="Чат не найден: напишите /start боту и повторите")
+    return {
+        "status": "subscribed",
+        "chat_id": subscription.chat_id,
+        "username": subscription.username,
+        "events": list(subscription.events),
+        "token": subscription.token,
+    }
+
+
+@app.delete("/api/subscriptions/{chat_id}", status_code=204)
+async def unsubscribe(chat_id: int, token: str):
+    """Отписка по токену, выданному при подписке"""
+    if not await engine.notifier.unsubscribe(chat_id, token):
+        raise HTTPException(status_code=404, detail="Подписка не найдена")
+    return Response(status_code=204)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Запускает фоновую задачу при старте сервера"""
-    asyncio.create_task(run_fetcher_periodically())
+    """Запускает фоновое обновление при старте сервера"""
+    # Сохраненный снимок доступен сразу, пока идет первое обновление
+    await asyncio.to_thread(store.load_file, JSON_PATH)
+    await engine.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Останавливает обновление и закрывает пул соединений к NOAA"""
+    await engine.stop()
 
 # ============================================
 # ЗАПУСК СЕРВЕРА
@@ -164,7 +434,7 @@ async def startup_event():
 if __name__ == "__main__":
     print("=" * 60)
     print("🚀 Space Weather Server запускается...")
-    print("📡 Режим: Веб-сервер (данные из fetcher.py)")
+    print("📡 Режим: Веб-сервер (обновление данных внутри процесса)")
     print("=" * 60)
 
     # Проверяем наличие данных
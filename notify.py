@@ -0,0 +1,546 @@
+import asyncio
+import html
+import json
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Callable
+
+import aiohttp
+
+from snapshot import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows: один процесс, блокировка не нужна
+    fcntl = None
+
+# Telegram Bot API; токен бота - только на сервере (переменная окружения)
+TELEGRAM_API = 'https://api.telegram.org'
+
+# Типы уведомлений (как в форме подписки) и плановая сводка - всем подписчикам
+EVENTS = ('CME', 'X-вспышка', 'Kp≥5', 'Ежедневно')
+SUMMARY = 'summary'
+SUMMARY_INTERVAL = 12 * 3600
+
+# Правило Kp: уведомление при Kp >= 5 и росте на полбалла с прошлого;
+# после спада ниже 4.5 следующий рост снова уведомляет
+KP_ALERT = 5.0
+KP_ALERT_STEP = 0.5
+KP_RESET = 4.5
+
+# Доставка: лимит Telegram - около 30 сообщений в секунду на бота и
+# одно в секунду в один чат; длина сообщения - до 4096 символов
+GLOBAL_RATE = 30.0
+CHAT_INTERVAL = 1.0
+MESSAGE_LIMIT = 4096
+WORKERS = 16
+# Повторы при 429, 5xx и сетевых ошибках: экспоненциальная задержка с полным разбросом
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+REQUEST_TIMEOUT = 15
+# Рассылка на много чатов ставится в очередь порциями, чтобы не занимать event loop
+FANOUT_CHUNK = 5000
+
+SEPARATOR = '\n\n— — —\n\n'
+
+
+class Subscription:
+    """Подписка чата Telegram; token - для отписки без доступа к чату"""
+
+    __slots__ = ('chat_id', 'username', 'events', 'token', 'created')
+
+    def __init__(self, chat_id: int, username: str, events: Iterable[str], token: str, created: int):
+        self.chat_id = chat_id
+        self.username = username
+        self.events = tuple(event for event in events if event in EVENTS)
+        self.token = token
+        self.created = created
+
+    def to_record(self) -> Dict[str, Any]:
+        return {'op': 'add', 'chat_id': self.chat_id, 'username': self.username,
+                'events': list(self.events), 'token': self.token, 'created': self.created}
+
+
+class SubscriptionStore:
+    """Подписки в журнале только для дозаписи (JSON Lines)
+
+    Запись подписки любым воркером - одна строка под flock; каждый процесс
+    дочитывает журнал с последнего смещения. Сжатие (переписывание только
+    живых подписок) меняет файл целиком - читатели замечают это по inode.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscribers: Dict[int, Subscription] = {}
+        self.by_event: Dict[str, set] = {event: set() for event in EVENTS}
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._records = 0
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def _lock(self):
+        """Блокировка журнала (отдельный файл: переживает замену журнала при сжатии)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path + '.lock', 'a')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Дописывает записи одной операцией и сразу применяет их (в потоке)"""
+        payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self._lock():
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(payload)
+        self.refresh()
+
+    def refresh(self) -> int:
+        """Дочитывает новые строки журнала; возвращает их число (в потоке)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Журнал сжат другим процессом - читаем заново
+            self.subscribers.clear()
+            for chats in self.by_event.values():
+                chats.clear()
+            self._inode, self._offset, self._records = stat.st_ino, 0, 0
+        if stat.st_size == self._offset:
+            return 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # Незавершенную последнюю строку дочитаем в следующий раз
+        complete = chunk.rfind(b'\n') + 1
+        lines = chunk[:complete].splitlines()
+        for line in lines:
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+        self._offset += complete
+        self._records += len(lines)
+        return len(lines)
+
+    def _apply(self, record: Dict[str, Any]):
+        chat_id = int(record['chat_id'])
+        previous = self.subscribers.pop(chat_id, None)
+        if previous is not None:
+            for event in previous.events:
+                self.by_event[event].discard(chat_id)
+        if record['op'] == 'add':
+            subscription = Subscription(chat_id, record.get('username', ''), record.get('events', ()),
+                                        record.get('token', ''), int(record.get('created', 0)))
+            self.subscribers[chat_id] = subscription
+            for event in subscription.events:
+                self.by_event[event].add(chat_id)
+
+    def compact(self):
+        """Переписывает журнал только живыми подписками, если он разросся вдвое (в потоке)"""
+        with self._lock():
+            self.refresh()
+            if self._records <= 2 * len(self.subscribers) + 1000:
+                return
+            payload = ''.join(json.dumps(subscription.to_record(), ensure_ascii=False) + '\n'
+                              for subscription in self.subscribers.values()).encode('utf-8')
+            write_atomic(self.path, payload)
+            stat = os.stat(self.path)
+            self._inode, self._offset, self._records = stat.st_ino, stat.st_size, len(self.subscribers)
+
+
+def summary_text(data: Dict[str, Any], label: str) -> str:
+    """Сводка текущих показателей (как на странице), HTML-разметка Telegram"""
+    kp = data.get('kpIndex')
+    wind = data.get('solar_wind', {}).get('speed')
+    geo = data.get('geomagnetic', {})
+    if kp is None:
+        kp_line = '—'
+    else:
+        status = 'СИЛЬНАЯ БУРЯ' if kp >= 7 else 'МАГНИТНАЯ БУРЯ' if kp >= KP_ALERT else 'Спокойно'
+        kp_line = f"<b>{kp:.1f}</b>  ({status})"
+    lines = [
+        f"<b>Space Weather Pro — {label}</b>",
+        f"{datetime.now(timezone.utc).strftime('%d.%m.%Y %H:%M')} UTC",
+        "",
+        "<b>ТЕКУЩИЕ ПОКАЗАТЕЛИ</b>",
+        f"Kp-индекс:        {kp_line}",
+        f"Солнечный ветер:  {round(wind)} км/с" if wind is not None else "Солнечный ветер:  —",
+        f"Bz (ММП):        {geo.get('bz', '—')} нТл",
+        f"Bt:               {geo.get('bt', '—')} нТл",
+        f"Солнечные пятна:  {data.get('sun', {}).get('sunspot_number', '—')}",
+        "",
+        "<b>СОБЫТИЯ ЗА 7 ДНЕЙ</b>",
+        f"CME-выбросов:     {data.get('cmeCount', '—')}",
+        f"Вспышек:          {data.get('flareCount', '—')}  "
+        f"(макс. класс: {data.get('flares', {}).get('strongest_class', '—')})",
+        "",
+        "Источник: NOAA SWPC",
+    ]
+    return '\n'.join(lines)
+
+
+def welcome_text(events: Iterable[str], data: Optional[Dict[str, Any]]) -> str:
+    lines = ['<b>Space Weather Pro</b>', '', 'Вы подписаны на уведомления о космической погоде.', '',
+             'Вы будете получать:', '   - Сводку каждые 12 часов']
+    lines += [f'   - Экстренное уведомление при: {event}' for event in events if event != 'Ежедневно']
+    text = '\n'.join(lines)
+    if data:
+        text += '\n\nТекущее состояние:\n\n' + summary_text(data, 'Сводка на момент подписки')
+    return text
+
+
+class AlertRules:
+    """Правила уведомлений: проверяются один раз на снимок в ведущем процессе
+
+    Состояние (последний Kp с уведомлением, последние вспышка и CME, время
+    сводки) хранится на диске, поэтому перезапуск не повторяет рассылок.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Any] = {'kp_alerted': 0.0, 'flare_peak': None, 'cme_key': None, 'summary_at': None}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_atomic(self.path, json.dumps(self.state).encode('utf-8'))
+
+    def evaluate(self, data: Dict[str, Any], now: float) -> List[Tuple[str, str]]:
+        """Новые уведомления по снимку: [(тип, текст)]"""
+        state = self.state
+        alerts = []
+
+        kp = data.get('kpIndex')
+        if kp is not None:
+            if kp < KP_RESET:
+                state['kp_alerted'] = 0.0
+            elif kp >= KP_ALERT and kp - state['kp_alerted'] >= KP_ALERT_STEP:
+                state['kp_alerted'] = kp
+                level = 'СИЛЬНАЯ БУРЯ' if kp >= 7 else 'МАГНИТНАЯ БУРЯ'
+                note = 'Возможны помехи GPS, радиосвязи и энергосетей.\n' if kp >= 7 else ''
+                alerts.append(('Kp≥5', f"<b>ВНИМАНИЕ: {level}</b>\nKp = {kp:.1f}\n\n"
+                                        + summary_text(data, 'Экстренное уведомление')
+                                        + f"\n\n{note}Полярные сияния возможны на широтах выше 55 градусов."))
+
+        # Вспышки и CME: при первом запуске - только запоминаем последние, без рассылки истории
+        flares = data.get('flares', {}).get('events', [])
+        peaks = [event.peak for event in flares]
+        if peaks:
+            if state['flare_peak'] is not None:
+                for event in flares:
+                    if event.cls == 'X' and event.peak > state['flare_peak']:
+                        alerts.append(('X-вспышка', f"<b>ВСПЫШКА {event.class_full}</b>\n"
+                                                     f"Пик: {event.peak_time.strftime('%d.%m.%Y %H:%M')} UTC\n"
+                                                     f"Возможны радиопомехи на дневной стороне Земли."))
+            state['flare_peak'] = max(peaks + [state['flare_peak'] or 0])
+
+        cmes = data.get('cme', {}).get('events', [])
+        keys = [f"{event.date} {event.time}" for event in cmes]
+        if keys:
+            if state['cme_key'] is not None:
+                for event, key in zip(cmes, keys):
+                    if key > state['cme_key']:
+                        speed = f", скорость {event.speed} км/с" if event.speed else ''
+                        alerts.append(('CME', f"<b>КОРОНАЛЬНЫЙ ВЫБРОС МАССЫ</b>\n{event.date} {event.time} UTC{speed}\n\n"
+                                              f"{html.escape(event.message)}"))
+            state['cme_key'] = max(keys + [state['cme_key'] or ''])
+
+        if state['summary_at'] is None:
+            state['summary_at'] = now
+        elif now - state['summary_at'] >= SUMMARY_INTERVAL:
+            state['summary_at'] = now
+            alerts.append((SUMMARY, summary_text(data, 'Сводка за 12 часов')))
+        return alerts
+
+
+class RateLimiter:
+    """Общий лимит отправки: каждому запросу - свой слот времени (равномерно, без всплесков)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def pack(texts: List[str]) -> Tuple[str, int]:
+    """Несколько ожидающих сообщений одного чата - в одно (до MESSAGE_LIMIT): (текст, сколько вошло)"""
+    message = texts[0][:MESSAGE_LIMIT]
+    count = 1
+    for text in texts[1:]:
+        if len(message) + len(SEPARATOR) + len(text) > MESSAGE_LIMIT:
+            break
+        message += SEPARATOR + text
+        count += 1
+    return message, count
+
+
+class Dispatcher:
+    """Доставка сообщений: очередь asyncio и пул воркеров
+
+    В очереди - идентификаторы чатов, тексты ждут в pending: новое сообщение
+    в чат, которому уже что-то ждет отправки, присоединяется к нему (одно
+    сообщение вместо нескольких). Лимиты: общий (RateLimiter) и не чаще
+    CHAT_INTERVAL в один чат; при 429 - пауза retry_after, при 5xx и сетевых
+    ошибках - повтор с экспоненциальной задержкой.
+    """
+
+    def __init__(self, api: str, token: str, workers: int = WORKERS, rate: float = GLOBAL_RATE,
+                 chat_interval: float = CHAT_INTERVAL, on_blocked: Optional[Callable[[int], None]] = None):
+        self.url = f"{api}/bot{token}/sendMessage"
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.limiter = RateLimiter(rate)
+        self.on_blocked = on_blocked
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: Dict[int, List[str]] = {}
+        self.attempts: Dict[int, int] = {}
+        self.next_allowed: Dict[int, float] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {'sent': 0, 'messages': 0, 'coalesced': 0, 'retried': 0, 'rate_limited': 0,
+                      'failed': 0, 'blocked': 0}
+
+    def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue()
+        connector = aiohttp.TCPConnector(limit=self.workers, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def enqueue(self, chat_id: int, text: str):
+        texts = self.pending.get(chat_id)
+        if texts is not None:
+            texts.append(text)
+            self.stats['coalesced'] += 1
+            return
+        self.pending[chat_id] = [text]
+        self._schedule(chat_id, self.next_allowed.get(chat_id, 0.0) - time.monotonic())
+
+    async def broadcast(self, chat_ids: List[int], text: str):
+        """Одно сообщение многим чатам; очередь заполняется порциями"""
+        now = time.monotonic()
+        self.next_allowed = {chat_id: t for chat_id, t in self.next_allowed.items() if t > now}
+        for start in range(0, len(chat_ids), FANOUT_CHUNK):
+            for chat_id in chat_ids[start:start + FANOUT_CHUNK]:
+                self.enqueue(chat_id, text)
+            await asyncio.sleep(0)
+
+    def _schedule(self, chat_id: int, delay: float):
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, chat_id)
+        else:
+            self.queue.put_nowait(chat_id)
+
+    async def wait_idle(self, poll: float = 0.05):
+        """Ждет, пока не останется неотправленных сообщений"""
+        while self.pending:
+            await asyncio.sleep(poll)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self.queue.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception as e:
+                print(f"⚠️ Уведомления: ошибка доставки в {chat_id}: {e}")
+                self._give_up(chat_id)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, chat_id: int):
+        texts = self.pending.get(chat_id)
+        if not texts:
+            self.pending.pop(chat_id, None)
+            return
+        message, count = pack(texts)
+        await self.limiter.acquire()
+        outcome, retry_after = await self._send(chat_id, message)
+
+        if outcome == 'ok':
+            self.stats['sent'] += 1
+            self.stats['messages'] += count
+            self.attempts.pop(chat_id, None)
+            self.next_allowed[chat_id] = time.monotonic() + self.chat_interval
+            # Пока шла отправка, в чат могли прийти новые сообщения
+            del texts[:count]
+            if texts:
+                self._schedule(chat_id, self.chat_interval)
+            else:
+                del self.pending[chat_id]
+        elif outcome == 'retry':
+            attempt = self.attempts.get(chat_id, 0) + 1
+            if attempt >= MAX_ATTEMPTS:
+                self._give_up(chat_id)
+                return
+            self.attempts[chat_id] = attempt
+            self.stats['retried'] += 1
+            delay = retry_after or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            self._schedule(chat_id, delay)
+        else:
+            if outcome == 'blocked':
+                self.stats['blocked'] += 1
+                if self.on_blocked is not None:
+                    self.on_blocked(chat_id)
+            self._give_up(chat_id)
+
+    def _give_up(self, chat_id: int):
+        self.stats['failed'] += len(self.pending.pop(chat_id, ()))
+        self.attempts.pop(chat_id, None)
+
+    async def _send(self, chat_id: int, text: str) -> Tuple[str, float]:
+        """Один sendMessage: ('ok' | 'retry' | 'blocked' | 'rejected', пауза retry_after)"""
+        try:
+            async with self.session.post(self.url, json={'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML',
+                                                         'disable_web_page_preview': True}) as response:
+                status = response.status
+                payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return 'retry', 0.0
+        if status == 200 and payload.get('ok'):
+            return 'ok', 0.0
+        if status == 429:
+            self.stats['rate_limited'] += 1
+            return 'retry', float((payload.get('parameters') or {}).get('retry_after', 1))
+        if status >= 500:
+            return 'retry', 0.0
+        # 403 - пользователь заблокировал бота; 400 - чат не найден
+        return 'blocked' if status == 403 else 'rejected', 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(self.stats, pending=len(self.pending), queued=self.queue.qsize() if self.queue else 0)
+
+
+class Notifier:
+    """Серверные уведомления подписчикам Telegram: подписки, правила, доставка
+
+    Правила проверяет только ведущий процесс (один раз на снимок); подписаться
+    и получить приветствие можно через любой воркер. Без токена бота
+    (TELEGRAM_BOT_TOKEN) подсистема выключена.
+    """
+
+    def __init__(self, directory: str, token: Optional[str] = None, api: Optional[str] = None,
+                 workers: int = WORKERS, rate: float = GLOBAL_RATE):
+        self.token = token if token is not None else os.environ.get('TELEGRAM_BOT_TOKEN', '')
+        self.api = api or os.environ.get('TELEGRAM_API', TELEGRAM_API)
+        self.store = SubscriptionStore(os.path.join(directory, 'subscriptions.jsonl'))
+        self.rules = AlertRules(os.path.join(directory, 'state.json'))
+        self.dispatcher = Dispatcher(self.api, self.token, workers, rate, on_blocked=self._blocked)
+        self._blocked_chats: List[int] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    async def start(self):
+        if not self.enabled:
+            print("🔕 Уведомления выключены: не задан TELEGRAM_BOT_TOKEN")
+            return
+        await asyncio.to_thread(self.store.refresh)
+        self.dispatcher.start()
+
+    async def stop(self):
+        await self.dispatcher.stop()
+
+    def _blocked(self, chat_id: int):
+        self._blocked_chats.append(chat_id)
+
+    async def evaluate(self, data: Dict[str, Any]) -> int:
+        """Проверка правил по новому снимку и рассылка; возвращает число адресатов"""
+        if not self.enabled:
+            return 0
+        await asyncio.to_thread(self.store.refresh)
+        if self._blocked_chats:
+            # Заблокировавшие бота - отписываются
+            blocked, self._blocked_chats = self._blocked_chats, []
+            await asyncio.to_thread(self.store.append, [{'op': 'remove', 'chat_id': chat_id} for chat_id in blocked])
+        state = dict(self.rules.state)
+        alerts = self.rules.evaluate(data, time.time())
+        if self.rules.state != state:
+            try:
+                await asyncio.to_thread(self.rules.save)
+            except OSError as e:
+                print(f"⚠️ Уведомления: не удалось сохранить состояние: {e}")
+        recipients = 0
+        for event, text in alerts:
+            chats = self.store.subscribers if event == SUMMARY else self.store.by_event.get(event, ())
+            chat_ids = list(chats)
+            await self.dispatcher.broadcast(chat_ids, text)
+            recipients += len(chat_ids)
+            print(f"📨 Уведомление {event}: {len(chat_ids)} подписчиков")
+        if alerts:
+            try:
+                await asyncio.to_thread(self.store.compact)
+            except OSError as e:
+                print(f"⚠️ Уведомления: не удалось сжать журнал подписок: {e}")
+        return recipients
+
+    async def resolve_chat(self, username: str) -> Optional[int]:
+        """chat_id по @username: среди последних сообщений боту (пользователь пишет /start)"""
+        clean = username.lstrip('@').lower()
+        url = f"{self.api}/bot{self.token}/getUpdates"
+        try:
+            async with self.dispatcher.session.get(url, params={'limit': '100'}) as response:
+                payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+        for update in reversed(payload.get('result') or []):
+            message = update.get('message') or update.get('edited_message') or update.get('channel_post')
+            chat = (message or {}).get('chat') or {}
+            if (chat.get('username') or '').lower() == clean:
+                return int(chat['id'])
+        return None
+
+    async def subscribe(self, username: str, events: List[str],
+                        data: Optional[Dict[str, Any]] = None) -> Optional[Subscription]:
+        """Подписка по @username с приветствием; None - бот не знает такого пользователя"""
+        chat_id = await self.resolve_chat(username)
+        if chat_id is None:
+            return None
+        subscription = Subscription(chat_id, '@' + username.lstrip('@'), events,
+                                    secrets.token_urlsafe(16), int(time.time()))
+        await asyncio.to_thread(self.store.append, [subscription.to_record()])
+        self.dispatcher.enqueue(chat_id, welcome_text(subscription.events, data))
+        return subscription
+
+    async def unsubscribe(self, chat_id: int, token: str) -> bool:
+        await asyncio.to_thread(self.store.refresh)
+        subscription = self.store.subscribers.get(chat_id)
+        if subscription is None or not secrets.compare_digest(subscription.token, token):
+            return False
+        await asyncio.to_thread(self.store.append, [{'op': 'remove', 'chat_id': chat_id}])
+        return True
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {'enabled': False}
+        return dict(self.dispatcher.summary(), enabled=True, subscribers=len(self.store))
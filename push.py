@@ -0,0 +1,131 @@
+import asyncio
+import time
+from typing import Dict, Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from snapshot import encode_json
+
+# Комментарий-пинг для прокси и обнаружения разорванных соединений (сек)
+HEARTBEAT_INTERVAL = 25
+
+# Готовые сообщения ASGI: рекомендуемая задержка переподключения EventSource и пинг
+RETRY_MESSAGE = {'type': 'http.response.body', 'body': b"retry: 5000\n\n", 'more_body': True}
+PING_MESSAGE = {'type': 'http.response.body', 'body': b": ping\n\n", 'more_body': True}
+
+
+class PushHub:
+    """Рассылка уведомлений о новых версиях данных (Server-Sent Events)
+
+    У подписчика нет своей очереди: все ждут одно общее событие asyncio,
+    которое подменяется при каждой публикации. Поэтому память на соединение
+    минимальна, а медленный клиент получает сразу последнюю версию, а не
+    накопившиеся промежуточные.
+
+    Кадр версии кодируется один раз при публикации вместе с сообщением ASGI,
+    и все подписчики отправляют этот же объект. Пинг - тоже общий: один
+    таймер будит всех раз в heartbeat, у подписчика нет своих таймеров и задач.
+    """
+
+    def __init__(self, heartbeat: float = HEARTBEAT_INTERVAL):
+        self.heartbeat = heartbeat
+        self.generation = 0
+        self.message: Optional[bytes] = None
+        self.subscribers = 0
+        self.delivered = 0
+        self._body: Optional[Dict[str, Any]] = None
+        self._changed = asyncio.Event()
+        self._pulse: Optional[asyncio.Task] = None
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, payload: Dict[str, Any]):
+        """Новая версия: будит всех подписчиков (вызывать на event loop)"""
+        self.generation += 1
+        payload = dict(payload, generation=self.generation, sent_at=round(time.time(), 3))
+        self.message = (f"id: {self.generation}\nevent: version\ndata: ".encode('utf-8')
+                        + encode_json(payload) + b"\n\n")
+        self._body = {'type': 'http.response.body', 'body': self.message, 'more_body': True}
+        self._wake()
+
+    async def _beat(self):
+        """Общий пульс: пока есть подписчики, будит их без новой версии - они шлют пинг"""
+        while self.subscribers:
+            await asyncio.sleep(self.heartbeat)
+            self._wake()
+
+    async def stream(self, send: Send, last_seen: int = 0):
+        """Поток SSE одного подписчика; last_seen - Last-Event-ID при переподключении"""
+        self.subscribers += 1
+        if self._pulse is None or self._pulse.done():
+            self._pulse = asyncio.create_task(self._beat())
+        try:
+            await send(RETRY_MESSAGE)
+            while True:
+                changed = self._changed
+                if self._body is not None and self.generation != last_seen:
+                    last_seen = self.generation
+                    await send(self._body)
+                    self.delivered += 1
+                    # Пока сообщение отправлялось, могла выйти еще одна версия
+                    continue
+                await changed.wait()
+                if self.generation == last_seen:
+                    await send(PING_MESSAGE)
+        finally:
+            self.subscribers -= 1
+
+    def response(self, request: Request) -> 'EventStreamResponse':
+        """Ответ text/event-stream; разрыв соединения завершает поток"""
+        last_event_id = request.headers.get('last-event-id', '')
+        last_seen = int(last_event_id) if last_event_id.isdigit() else 0
+        return EventStreamResponse(self, last_seen)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'subscribers': self.subscribers, 'generation': self.generation, 'delivered': self.delivered}
+
+
+class EventStreamResponse(Response):
+    """Поток PushHub.stream без StreamingResponse: готовые сообщения уходят в send как есть
+
+    Разрыв соединения слушает отдельная задача и отменяет поток.
+    """
+
+    media_type = 'text/event-stream'
+
+    def __init__(self, hub: PushHub, last_seen: int = 0):
+        self.hub = hub
+        self.last_seen = last_seen
+        self.status_code = 200
+        self.background = None
+        self.init_headers({
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # nginx не должен буферизовать поток
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        stream = asyncio.current_task()
+        disconnected = False
+
+        async def listen():
+            nonlocal disconnected
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected = True
+            stream.cancel()
+
+        listener = asyncio.create_task(listen())
+        try:
+            await self.hub.stream(send, self.last_seen)
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            stream.uncancel()
+        finally:
+            listener.cancel()
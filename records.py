@@ -0,0 +1,104 @@
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional
+
+
+class PointSeries:
+    """Ряд точек графика в двух параллельных массивах: время (сек Unix) и значение
+
+    Вместо списка словарей {'label', 'value'} - 16 байт на точку; подписи и
+    словари создаются только при сериализации (to_json).
+    """
+
+    __slots__ = ('times', 'values', 'label_key', 'value_key', 'label_format', 'utc')
+
+    def __init__(self, times: Iterable[int] = (), values: Iterable[float] = (), label_key: str = 'label',
+                 value_key: str = 'value', label_format: str = '%H:%M', utc: bool = True):
+        self.times = array('q', times)
+        self.values = values if isinstance(values, array) else array('d', values)
+        self.label_key = label_key
+        self.value_key = value_key
+        self.label_format = label_format
+        self.utc = utc
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, timestamp: int, value: float):
+        self.times.append(timestamp)
+        self.values.append(value)
+
+    def labels(self) -> List[str]:
+        tz = timezone.utc if self.utc else None
+        return [datetime.fromtimestamp(t, tz).strftime(self.label_format) for t in self.times]
+
+    def points(self) -> List[Dict[str, Any]]:
+        """Точки в формате снимка: [{label_key: подпись, value_key: значение}]"""
+        return [{self.label_key: label, self.value_key: value}
+                for label, value in zip(self.labels(), self.values)]
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return self.points()
+
+
+class FlareEvent:
+    """Вспышка из детектора (время - секунды Unix, класс - по пиковому потоку)"""
+
+    __slots__ = ('start', 'peak', 'end', 'flux', 'class_full')
+
+    def __init__(self, start: int, peak: int, end: Optional[int], flux: float, class_full: str):
+        self.start = start
+        self.peak = peak
+        self.end = end
+        self.flux = flux
+        self.class_full = class_full
+
+    @property
+    def cls(self) -> str:
+        return self.class_full[0]
+
+    @property
+    def peak_time(self) -> datetime:
+        return datetime.fromtimestamp(self.peak, timezone.utc)
+
+    def to_json(self) -> Dict[str, Any]:
+        peak = self.peak_time
+        return {
+            'date': peak.strftime('%Y-%m-%d'),
+            'time': peak.strftime('%H:%M'),
+            'class': self.cls,
+            'class_full': self.class_full,
+            'flux': self.flux,
+            'start': utc_tag(self.start),
+            'peak': utc_tag(self.peak),
+            'end': utc_tag(self.end) if self.end is not None else None,
+        }
+
+
+class CmeEvent:
+    """CME из алерта NOAA: дата и время выпуска (как в алерте), скорость, начало текста"""
+
+    __slots__ = ('date', 'time', 'speed', 'message')
+
+    def __init__(self, date: str, time: str, speed: int, message: str):
+        self.date = date
+        self.time = time
+        self.speed = speed
+        self.message = message
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'date': self.date, 'time': self.time, 'speed': self.speed, 'message': self.message}
+
+
+def utc_tag(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def to_json(obj):
+    """Хук json.dumps (default=): записи и массивы сериализуются только на границе"""
+    method = getattr(obj, 'to_json', None)
+    if method is not None:
+        return method()
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
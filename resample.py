@@ -0,0 +1,160 @@
+import numpy as np
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Tuple
+
+from timeseries import parse_time_tags, _number
+
+# Шаг общей сетки (сек) и уровни агрегации: 5 минут и час
+GRID_STEP = 60
+AGGREGATE_STEPS = (300, 3600)
+# Пропуски короче этого (шагов сетки) заполняются последним значением и помечаются
+MAX_FILL = 5
+
+NAT = np.iinfo(np.int64).min
+
+
+def feed_columns(records: List[Dict[str, Any]], fields: List[str]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Записи продукта RTSW -> (время, сек Unix; столбцы float64), по возрастанию времени
+
+    time_tag разбирается один раз; записи с active=false (резервный спутник)
+    отбрасываются.
+    """
+    active = [item for item in records if isinstance(item, dict) and item.get('active', True) is not False]
+    try:
+        tags = list(map(itemgetter('time_tag'), active))
+    except KeyError:
+        tags = [item.get('time_tag') for item in active]
+    columns = {}
+    for field in fields:
+        values = [item.get(field) for item in active]
+        try:
+            columns[field] = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            columns[field] = np.array([_number(value) for value in values], dtype=np.float64)
+    return sort_columns(parse_time_tags(tags).astype(np.int64), columns)
+
+
+def sort_columns(times: np.ndarray, columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Сортировка по времени (ленты NOAA бывают и от новых к старым); метки NaT
+    отбрасываются, из повторов одной метки остается последний"""
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    valid = times != NAT
+    valid[:-1] &= times[:-1] != times[1:]
+    return times[valid], {name: values[order][valid] for name, values in columns.items()}
+
+
+class AlignedFrame:
+    """Несколько продуктов на общей минутной сетке и их 5-минутные и часовые агрегаты
+
+    time - начала минут (сек Unix); columns - значения на сетке (NaN - пропуск);
+    filled - точки, заполненные последним значением; aggregates[step] -
+    time/mean/min/max/count по каждому столбцу.
+    """
+
+    __slots__ = ('time', 'columns', 'filled', 'aggregates')
+
+    def __init__(self, time: np.ndarray, columns: Dict[str, np.ndarray], filled: Dict[str, np.ndarray]):
+        self.time = time
+        self.columns = columns
+        self.filled = filled
+        self.aggregates = {step: aggregate(time, columns, step) for step in AGGREGATE_STEPS}
+
+    @classmethod
+    def empty(cls) -> 'AlignedFrame':
+        return cls(np.empty(0, dtype=np.int64), {}, {})
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def latest(self, name: str) -> Optional[Tuple[int, float]]:
+        """Последнее измеренное (не заполненное) значение столбца и его время"""
+        values = self.columns.get(name)
+        if values is None:
+            return None
+        measured = np.flatnonzero(~np.isnan(values) & ~self.filled[name])
+        if not measured.size:
+            return None
+        index = measured[-1]
+        return int(self.time[index]), float(values[index])
+
+    def window(self, name: str, points: int, step: int = GRID_STEP,
+               reduce: str = 'mean') -> Tuple[np.ndarray, np.ndarray]:
+        """Последние points интервалов шага step без пропусков: (время, значения)"""
+        if step == GRID_STEP:
+            times, values = self.time, self.columns[name]
+        else:
+            level = self.aggregates[step]
+            times, values = level['time'], level[reduce][name]
+        keep = ~np.isnan(values[-points:])
+        return times[-points:][keep], values[-points:][keep]
+
+    def gaps(self, name: str, points: int) -> int:
+        """Число незаполненных пропусков среди последних points минут"""
+        return int(np.isnan(self.columns[name][-points:]).sum())
+
+
+def aggregate(times: np.ndarray, columns: Dict[str, np.ndarray], step: int) -> Dict[str, Any]:
+    """Свертка минутной сетки по step (сетка начинается на границе часа) без циклов по точкам"""
+    width = step // GRID_STEP
+    # Последний (текущий) интервал неполон - дополняется пропусками
+    pad = -times.size % width
+    result: Dict[str, Any] = {'time': times[::width], 'mean': {}, 'min': {}, 'max': {}, 'count': {}}
+    for name, values in columns.items():
+        blocks = np.concatenate((values, np.full(pad, np.nan))).reshape(-1, width)
+        present = ~np.isnan(blocks)
+        count = present.sum(axis=1)
+        total = np.where(present, blocks, 0.0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['mean'][name] = np.where(count > 0, total / count, np.nan)
+        # fmin/fmax пропускают NaN; блок целиком из NaN дает NaN без предупреждений
+        result['min'][name] = np.fmin.reduce(blocks, axis=1)
+        result['max'][name] = np.fmax.reduce(blocks, axis=1)
+        result['count'][name] = count
+    return result
+
+
+def align(feeds: Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]], step: int = GRID_STEP,
+          max_fill: int = MAX_FILL) -> AlignedFrame:
+    """Сведение продуктов на общую сетку: слияние отсортированных меток с узлами сетки
+
+    Сетка начинается с границы часа перед первым отсчетом (поэтому интервалы
+    агрегатов выровнены по 5 минутам и часам) и заканчивается последней
+    минутой, где есть хоть один продукт.
+    """
+    starts = [times[0] for times, _ in feeds.values() if times.size]
+    ends = [times[-1] for times, _ in feeds.values() if times.size]
+    if not starts:
+        return AlignedFrame.empty()
+    start = min(starts) - min(starts) % AGGREGATE_STEPS[-1]
+    end = max(ends) - max(ends) % step
+    grid = np.arange(start, end + step, step, dtype=np.int64)
+
+    columns: Dict[str, np.ndarray] = {}
+    filled: Dict[str, np.ndarray] = {}
+    for times, feed in feeds.values():
+        # Каждый отсчет - в узел сетки, в интервал которого он попал (merge-join
+        # двух отсортированных последовательностей; для повторов - последний)
+        slots = np.searchsorted(grid, times, side='right') - 1
+        for name, values in feed.items():
+            column = np.full(grid.size, np.nan)
+            column[slots] = values
+            columns[name], filled[name] = fill_gaps(column, max_fill)
+    return AlignedFrame(grid, columns, filled)
+
+
+def fill_gaps(column: np.ndarray, max_fill: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Короткие пропуски (до max_fill узлов) - последним значением; маска заполненных узлов"""
+    missing = np.isnan(column)
+    if not missing.any() or missing.all():
+        return column, np.zeros(column.size, dtype=bool)
+    index = np.arange(column.size)
+    # Индекс последнего измеренного значения для каждого узла
+    last = np.maximum.accumulate(np.where(missing, -1, index))
+    fill = missing & (last >= 0) & (index - last <= max_fill)
+    # Пропуск в конце сетки не заполняем: это еще не пропуск, а отсутствие данных
+    measured = np.flatnonzero(~missing)
+    fill[measured[-1] + 1:] = False
+    filled = column.copy()
+    filled[fill] = column[last[fill]]
+    return filled, fill
@@ -0,0 +1,255 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: один процесс, блокировка не нужна
+    fcntl = None
+
+# Заголовок управляющего файла (поля по 8 байт): метка, поколение,
+# счетчики запросов ручного обновления и выполненных запросов
+HEADER = struct.Struct('<8sQQQ')
+WORD = struct.Struct('<Q')
+GENERATION, REQUESTS, SERVED = 8, 16, 24
+HEADER_SIZE = 128
+MAGIC = b'CWSNAP03'
+# Сколько раз читатель перечитывает заголовок, если файл поколения уже удален
+READ_ATTEMPTS = 5
+# Файлы скольких последних поколений ведущий оставляет на диске
+KEEP_GENERATIONS = 2
+
+
+class LeaderLock:
+    """Выбор ведущего процесса: эксклюзивная неблокирующая flock на файле
+
+    Блокировку держит ровно один процесс; при его завершении ОС снимает ее
+    сама, и следующая попытка другого воркера делает его ведущим.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.held = False
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        if fcntl is None:
+            self.held = True
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self.held = True
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.held = False
+
+
+class Header(NamedTuple):
+    magic: bytes
+    generation: int
+    requests: int
+    served: int
+
+
+class SharedRegion:
+    """Общая для воркеров область: управляющий файл, отображенный в память (mmap),
+    и по файлу на каждое поколение публикации
+
+    Ведущий пишет поколение во временный файл, переименовывает его в
+    <path>.<поколение> и только затем меняет поколение в заголовке; файл
+    после этого не меняется. Читатель отображает его в память только для
+    чтения и отдает байты снимков прямо из отображения, без копирования:
+    страницы в кэше ОС общие для всех воркеров. Старые поколения ведущий
+    удаляет; уже открытое отображение остается действительным до конца
+    использования (Linux освобождает место после закрытия последнего).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _open(self, create: bool) -> bool:
+        if self._mm is not None:
+            return True
+        if not create and not os.path.exists(self.path):
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < HEADER_SIZE:
+            if not create:
+                os.close(self._fd)
+                self._fd = None
+                return False
+            os.ftruncate(self._fd, HEADER_SIZE)
+        self._mm = mmap.mmap(self._fd, HEADER_SIZE)
+        return True
+
+    @contextmanager
+    def _locked(self):
+        """Чтение-изменение-запись счетчиков: flock между процессами, Lock между потоками"""
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _header(self) -> Header:
+        return Header(*HEADER.unpack_from(self._mm, 0))
+
+    def _put(self, offset: int, value: int):
+        """Одно поле заголовка: счетчики запросов и публикация не затирают друг друга"""
+        WORD.pack_into(self._mm, offset, value)
+
+    def _payload_path(self, generation: int) -> str:
+        return f"{self.path}.{generation}"
+
+    def write(self, payload: bytes) -> int:
+        """Публикация (только ведущий): возвращает новое поколение"""
+        self._open(create=True)
+        header = self._header()
+        if header.magic != MAGIC:
+            # Файл создан только что или записан другой версией формата
+            with self._locked():
+                HEADER.pack_into(self._mm, 0, MAGIC, 0, 0, 0)
+                # Слоты прежнего формата лежали за заголовком - освобождаем место
+                os.ftruncate(self._fd, HEADER_SIZE)
+            header = self._header()
+        generation = header.generation + 1
+        tmp_path = self._payload_path(generation) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, self._payload_path(generation))
+        # Поколение меняется после переименования - читатель видит только целые файлы
+        self._put(GENERATION, generation)
+        self._prune(generation)
+        return generation
+
+    def _prune(self, generation: int):
+        """Удаляет файлы поколений старше KEEP_GENERATIONS последних (и брошенные .tmp)"""
+        directory, name = os.path.split(self.path)
+        prefix = name + '.'
+        for fname in os.listdir(directory):
+            number = fname[len(prefix):].split('.')[0]
+            if not fname.startswith(prefix) or not number.isdigit():
+                continue
+            if int(number) <= generation - KEEP_GENERATIONS or (fname.endswith('.tmp') and int(number) <= generation):
+                try:
+                    os.remove(os.path.join(directory, fname))
+                except OSError:
+                    pass
+
+    def read(self, known_generation: int) -> Optional[Tuple[int, mmap.mmap]]:
+        """Новая публикация, если поколение отличается от known_generation:
+        (поколение, отображение файла поколения только для чтения)"""
+        if not self._open(create=False):
+            return None
+        for _ in range(READ_ATTEMPTS):
+            header = self._header()
+            if header.magic != MAGIC or header.generation == 0 or header.generation == known_generation:
+                return None
+            try:
+                with open(self._payload_path(header.generation), 'rb') as f:
+                    return header.generation, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                # Ведущий успел опубликовать еще два поколения и удалить это - читаем заново
+                continue
+        return None
+
+    @property
+    def generation(self) -> int:
+        if not self._open(create=False):
+            return 0
+        return self._header().generation
+
+    def request_refresh(self) -> Optional[int]:
+        """Просьба ведущему обновить данные; номер запроса (сравнивать с refresh_served)"""
+        if not self._open(create=False):
+            return None
+        with self._locked():
+            header = self._header()
+            if header.magic != MAGIC:
+                return None
+            self._put(REQUESTS, header.requests + 1)
+        return header.requests + 1
+
+    def refresh_requests(self) -> int:
+        if not self._open(create=False):
+            return 0
+        return self._header().requests
+
+    def mark_served(self, requests: int):
+        """Ведущий: запросы с номером до requests включительно выполнены"""
+        if not self._open(create=False):
+            return
+        with self._locked():
+            header = self._header()
+            if header.magic == MAGIC and requests > header.served:
+                self._put(SERVED, requests)
+
+    def refresh_served(self) -> int:
+        if not self._open(create=False):
+            return 0
+        return self._header().served
+
+
+def pack_bundle(stores: Dict[str, Any]) -> bytes:
+    """Снимки нескольких хранилищ в один блок: длина метаданных, метаданные JSON, тела
+
+    Метаданные содержат смещения тел и разделов, поэтому читателю не нужно
+    ни сериализовать, ни сжимать, ни хэшировать данные заново.
+    """
+    meta: Dict[str, Any] = {}
+    blobs = []
+    offset = 0
+    for name, snapshot in stores.items():
+        if snapshot is None:
+            continue
+        meta[name] = snapshot.shared_meta()
+        meta[name]['body'] = [offset, len(snapshot.body)]
+        offset += len(snapshot.body)
+        meta[name]['gzip'] = [offset, len(snapshot.gzip_body)]
+        offset += len(snapshot.gzip_body)
+        blobs += [snapshot.body, snapshot.gzip_body]
+    header = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    return struct.pack('<I', len(header)) + header + b''.join(blobs)
+
+
+def unpack_bundle(payload) -> Dict[str, Tuple[Dict, memoryview, memoryview]]:
+    """Обратное pack_bundle: имя -> (метаданные, тело, gzip)
+
+    Тела - memoryview внутри payload (например, отображения файла поколения),
+    без копирования.
+    """
+    (size,) = struct.unpack_from('<I', payload, 0)
+    meta = json.loads(payload[4:4 + size])
+    data = memoryview(payload)[4 + size:]
+    result = {}
+    for name, item in meta.items():
+        body_start, body_len = item['body']
+        gzip_start, gzip_len = item['gzip']
+        result[name] = (item, data[body_start:body_start + body_len], data[gzip_start:gzip_start + gzip_len])
+    return result
@@ -0,0 +1,405 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Any, Optional, List
+
+from records import to_json
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без нее отдаем только gzip
+    brotli = None
+
+# Варианты кодирования в порядке предпочтения (br - только если установлен brotli)
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Расширения файлов с предварительно сжатыми вариантами снимка
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+# Ответы не длиннее этого (байт) не сжимаем: сжатие их только увеличит
+MIN_COMPRESS_SIZE = 1024
+# Сколько проекций и дельт кэшировать на снимок (поля и версию задает клиент)
+MAX_VARIANTS = 64
+
+
+def encode_json(data: Any) -> bytes:
+    """Компактная сериализация (без отступов) для отдачи клиентам
+
+    Записи и массивы разделов (records.py) превращаются в JSON только здесь.
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=to_json).encode('utf-8')
+
+
+def content_etag(body: bytes) -> str:
+    """Сильный ETag: хэш содержимого, одинаковый для всех вариантов кодирования"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Лучшее из ENCODINGS, которое принимает клиент (q=0 - отказ); None - без сжатия"""
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.partition(';')
+        quality = params.replace(' ', '')
+        # q=0, q=0.0, q=0.000 - кодирование запрещено
+        accepted[name.strip()] = not quality.startswith('q=') or quality[2:].strip('0.') != ''
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', False)):
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжатие с теми же параметрами, что и у полного снимка"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    return gzip.compress(body, compresslevel=6)
+
+
+def write_atomic(path: str, payload: bytes):
+    """Запись через временный файл, fsync и rename: читатель видит либо старый файл, либо новый"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def sync_directory(directory: str):
+    """fsync каталога, чтобы переименования пережили сбой питания (только POSIX)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def manifest_path(json_path: str) -> str:
+    """Манифест лежит рядом со снимком: space_weather_data.manifest.json"""
+    root, _ = os.path.splitext(json_path)
+    return root + '.manifest.json'
+
+
+def save_manifest(manifest: Dict[str, Any], json_path: str):
+    """Атомарная запись манифеста (несколько КБ, не зависит от размера снимка)"""
+    write_atomic(manifest_path(json_path), json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def read_manifest(json_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(json_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_compressed(json_path: str, body: bytes) -> Dict[str, bytes]:
+    """Сжатые варианты с диска, если манифест подтверждает, что они от этого же тела"""
+    manifest = read_manifest(json_path)
+    if manifest is None or manifest.get('etag') != content_etag(body):
+        return {}
+    compressed = {}
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        try:
+            with open(json_path + suffix, 'rb') as f:
+                compressed[encoding] = f.read()
+        except OSError:
+            pass
+    return compressed
+
+
+class Variant:
+    """Производный ответ снимка (проекция или дельта): тело, ETag и сжатые варианты
+
+    Каждое кодирование сжимается один раз - при первом запросе.
+    """
+
+    __slots__ = ('body', 'etag', 'compressed')
+
+    def __init__(self, body: bytes, etag: Optional[str] = None):
+        self.body = body
+        self.etag = etag
+        self.compressed: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: Optional[str]):
+        """(байты, фактическое кодирование): мелкие ответы отдаются без сжатия"""
+        if encoding is None or len(self.body) <= MIN_COMPRESS_SIZE:
+            return self.body, None
+        payload = self.compressed.get(encoding)
+        if payload is None:
+            payload = self.compressed[encoding] = compress(self.body, encoding)
+        return payload, encoding
+
+
+class Snapshot:
+    """Неизменяемый снимок данных, готовый к отправке: байты, gzip, ETag
+
+    Каждый раздел верхнего уровня сериализуется отдельно (parts), из этих
+    частей собирается тело; версии и хэши разделов позволяют отдавать
+    клиенту только изменившиеся разделы.
+
+    Байты (body, gzip_body, parts) - bytes у ведущего и memoryview общей
+    области у остальных воркеров. data - разобранный JSON тела, одинаковый
+    в любом процессе; разбирается только при первом обращении.
+    """
+
+    __slots__ = ('_data', '_sections', '_variants', 'parts', 'body', 'gzip_body', 'etag', 'last_modified', 'timestamp',
+                 'headers', 'version', 'section_versions', 'section_hashes', 'removed', '_br_body')
+
+    def __init__(self, data: Dict, timestamp: Optional[float] = None,
+                 compressed: Optional[Dict[str, bytes]] = None):
+        """compressed - уже сжатые варианты этого же тела (например, с диска)"""
+        compressed = compressed or {}
+        self._data = None
+        self._sections: Dict[str, Any] = {}
+        self._variants: 'OrderedDict[tuple, Variant]' = OrderedDict()
+        self.parts = {key: encode_json(value) for key, value in data.items()}
+        # То же, что encode_json(data), но без повторной сериализации разделов
+        self.body = b'{' + b','.join(encode_json(key) + b':' + part for key, part in self.parts.items()) + b'}'
+        self.gzip_body = compressed.get('gzip') or compress(self.body, 'gzip')
+        self._br_body = compressed.get('br')
+        self.etag = content_etag(self.body)
+        self.section_hashes = {key: hashlib.sha256(part).hexdigest()[:16] for key, part in self.parts.items()}
+        self.section_versions: Dict[str, int] = {}
+        self.removed: Dict[str, int] = {}
+        self.version = 0
+        self._set_timestamp(timestamp if timestamp is not None else time.time())
+
+    def _set_timestamp(self, timestamp: float):
+        self.timestamp = timestamp
+        self.last_modified = formatdate(self.timestamp, usegmt=True)
+        self.headers = {
+            'ETag': self.etag,
+            'Last-Modified': self.last_modified,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if self.version:
+            self.headers['X-Snapshot-Version'] = str(self.version)
+
+    def shared_meta(self) -> Dict[str, Any]:
+        """Все, кроме байтов: для передачи снимка другим воркерам (см. shared.py)"""
+        offsets = []
+        offset = 1  # после '{'
+        for key, part in self.parts.items():
+            start = offset + len(encode_json(key)) + 1
+            offsets.append([key, start, len(part)])
+            offset = start + len(part) + 1
+        return {
+            'etag': self.etag,
+            'timestamp': self.timestamp,
+            'version': self.version,
+            'parts': offsets,
+            'section_hashes': self.section_hashes,
+            'section_versions': self.section_versions,
+            'removed': self.removed,
+        }
+
+    @classmethod
+    def from_shared(cls, meta: Dict[str, Any], body: bytes, gzip_body: bytes) -> 'Snapshot':
+        """Снимок из готовых байтов ведущего процесса - без сериализации, сжатия и разбора"""
+        snapshot = cls.__new__(cls)
+        snapshot.body = body
+        snapshot.gzip_body = gzip_body
+        snapshot._br_body = None
+        snapshot._data = None
+        snapshot._sections = {}
+        snapshot._variants = OrderedDict()
+        snapshot.parts = {key: body[start:start + size] for key, start, size in meta['parts']}
+        snapshot.etag = meta['etag']
+        snapshot.version = meta['version']
+        snapshot.section_hashes = meta['section_hashes']
+        snapshot.section_versions = meta['section_versions']
+        snapshot.removed = meta['removed']
+        snapshot._set_timestamp(meta['timestamp'])
+        return snapshot
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = json.loads(str(self.body, 'utf-8'))
+        return self._data
+
+    def section(self, key: str, default: Any = None) -> Any:
+        """Один раздел без разбора всего тела (изображения, сетка сияний, свежесть)"""
+        if self._data is not None:
+            return self._data.get(key, default)
+        part = self.parts.get(key)
+        if part is None:
+            return default
+        if key not in self._sections:
+            self._sections[key] = json.loads(str(part, 'utf-8'))
+        return self._sections[key]
+
+    @property
+    def br_body(self) -> Optional[bytes]:
+        """Brotli-вариант: сжимается один раз при первом запросе; None без brotli"""
+        if self._br_body is None and brotli is not None:
+            self._br_body = compress(self.body, 'br')
+        return self._br_body
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """Готовые байты для Content-Encoding (None - несжатое тело)"""
+        if encoding == 'br':
+            return self.br_body
+        if encoding == 'gzip':
+            return self.gzip_body
+        return self.body
+
+    def not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """Проверка условного запроса (If-None-Match имеет приоритет)"""
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or self.etag in tags or ('W/' + self.etag) in tags
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.timestamp) <= since
+        return False
+
+    def changed_since(self, version: int, fields: Optional[List[str]] = None):
+        """Разделы, изменившиеся после версии клиента, и удаленные с тех пор разделы"""
+        changed = [key for key, v in self.section_versions.items() if v > version]
+        removed = [key for key, v in self.removed.items() if v > version]
+        if fields is not None:
+            changed = [key for key in changed if key in fields]
+            removed = [key for key in removed if key in fields]
+        return changed, removed
+
+    def _variant(self, key: tuple, build) -> Variant:
+        """Проекция или дельта из кэша снимка; самые давно не запрошенные вытесняются"""
+        variant = self._variants.get(key)
+        if variant is not None:
+            self._variants.move_to_end(key)
+            return variant
+        variant = self._variants[key] = build()
+        if len(self._variants) > MAX_VARIANTS:
+            self._variants.popitem(last=False)
+        return variant
+
+    def projection(self, fields: List[str]) -> Variant:
+        """Только запрошенные разделы из готовых частей; ETag - по хэшам этих разделов"""
+        keys = tuple(key for key in dict.fromkeys(fields) if key in self.parts)
+
+        def build():
+            body = b'{' + b','.join(encode_json(key) + b':' + self.parts[key] for key in keys) + b'}'
+            signature = '|'.join(f"{key}:{self.section_hashes[key]}" for key in keys)
+            return Variant(body, '"' + hashlib.sha256(signature.encode('utf-8')).hexdigest()[:32] + '"')
+
+        return self._variant(('fields', keys), build)
+
+    def project(self, fields: List[str]):
+        """Только запрошенные разделы из готовых частей: (тело, ETag)"""
+        variant = self.projection(fields)
+        return variant.body, variant.etag
+
+    def delta_variant(self, version: int, fields: Optional[List[str]] = None, patch: bool = False) -> Variant:
+        """delta или patch относительно версии клиента - из кэша снимка"""
+        key = ('patch' if patch else 'delta', version, tuple(fields) if fields is not None else None)
+        return self._variant(key, lambda: Variant((self.patch if patch else self.delta)(version, fields)))
+
+    def manifest(self) -> Dict[str, Any]:
+        """Сводка снимка без данных: размеры, хэши и версии разделов, свежесть источников"""
+        freshness = self.section('freshness')
+        if not isinstance(freshness, dict):
+            freshness = {}
+        sections = {}
+        for key, part in self.parts.items():
+            entry = {'size': len(part), 'hash': self.section_hashes[key],
+                     'version': self.section_versions.get(key, self.version)}
+            if key in freshness:
+                entry.update(freshness[key])
+            sections[key] = entry
+        return {
+            'version': self.version,
+            'etag': self.etag,
+            'timestamp': self.timestamp,
+            'last_modified': self.last_modified,
+            'size': len(self.body),
+            'gzip_size': len(self.gzip_body),
+            'sections': sections,
+        }
+
+    def delta(self, version: int, fields: Optional[List[str]] = None) -> bytes:
+        """Только изменившиеся разделы: {version, since, changed: {...}, removed: [...]}"""
+        changed, removed = self.changed_since(version, fields)
+        sections = b','.join(encode_json(key) + b':' + self.parts[key] for key in changed)
+        return (b'{"version":' + str(self.version).encode() + b',"since":' + str(version).encode()
+                + b',"changed":{' + sections + b'},"removed":' + encode_json(removed) + b'}')
+
+    def patch(self, version: int, fields: Optional[List[str]] = None) -> bytes:
+        """То же в виде JSON Patch (RFC 6902) по разделам верхнего уровня"""
+        changed, removed = self.changed_since(version, fields)
+        ops = [b'{"op":"add","path":' + encode_json('/' + key.replace('~', '~0').replace('/', '~1'))
+               + b',"value":' + self.parts[key] + b'}' for key in changed]
+        ops += [encode_json({'op': 'remove', 'path': '/' + key.replace('~', '~0').replace('/', '~1')})
+                for key in removed]
+        return b'[' + b','.join(ops) + b']'
+
+
+class SnapshotStore:
+    """Горячий кэш текущего снимка; замена ссылки атомарна для обработчиков
+
+    Версии монотонно растут (миллисекунды, не меньше предыдущей + 1), поэтому
+    после перезапуска сервера версии клиентов оказываются старше любых
+    текущих и клиенты получают полный набор разделов.
+    """
+
+    def __init__(self):
+        self.current: Optional[Snapshot] = None
+        self.version = 0
+        self.section_versions: Dict[str, int] = {}
+        self.section_hashes: Dict[str, str] = {}
+        self.removed: Dict[str, int] = {}
+
+    def publish(self, data: Dict, timestamp: Optional[float] = None,
+                compressed: Optional[Dict[str, bytes]] = None) -> Snapshot:
+        """Сериализует снимок и подменяет текущий; вызывать можно из потока"""
+        snapshot = Snapshot(data, timestamp, compressed)
+        if self.current is not None and self.current.etag == snapshot.etag:
+            return self.current
+
+        self.version = max(self.version + 1, int(time.time() * 1000))
+        for key, digest in snapshot.section_hashes.items():
+            if self.section_hashes.get(key) != digest:
+                self.section_hashes[key] = digest
+                self.section_versions[key] = self.version
+                self.removed.pop(key, None)
+        for key in [key for key in self.section_hashes if key not in snapshot.section_hashes]:
+            del self.section_hashes[key]
+            del self.section_versions[key]
+            self.removed[key] = self.version
+
+        snapshot.version = self.version
+        snapshot.section_versions = dict(self.section_versions)
+        snapshot.removed = dict(self.removed)
+        snapshot.headers['X-Snapshot-Version'] = str(self.version)
+        self.current = snapshot
+        return snapshot
+
+    def adopt(self, snapshot: Snapshot):
+        """Принимает готовый снимок ведущего процесса (воркер-читатель)"""
+        self.version = snapshot.version
+        self.section_versions = dict(snapshot.section_versions)
+        self.section_hashes = dict(snapshot.section_hashes)
+        self.removed = dict(snapshot.removed)
+        self.current = snapshot
+
+    def load_file(self, json_path: str) -> Optional[Snapshot]:
+        """Начальная загрузка из JSON файла (до первого обновления)"""
+        try:
+            if os.path.exists(json_path):
+                with open(json_path, 'rb') as f:
+                    body = f.read()
+                data = json.loads(body)
+                return self.publish(data, os.path.getmtime(json_path), load_compressed(json_path, body))
+        except Exception as e:
+            print(f"Ошибка чтения JSON: {e}")
+        return None
@@ -59,176 +59,6 @@ function toggleTheme() {
     document.getElementById('ttext').textContent = t === 'light' ? 'Светлая' : 'Тёмная';
 })();
 
-// ═══════════════════════════════════════════════════════════
-//  TELEGRAM BOT
-// ═══════════════════════════════════════════════════════════
-const TG = {
-    token: '8663758089:AAFA39NWvNy3p5W2G3sguWMsOgGfeLGOBEk',
-};
-
-let lastAlertKp = 0;
-
-// Получить chat_id пользователя по @username через getUpdates
-async function getTelegramChatId(username) {
-    try {
-        // Запрашиваем последние 100 обновлений
-        const r = await fetch(`https://api.telegram.org/bot${TG.token}/getUpdates?limit=100&allowed_updates=["message"]`);
-        const data = await r.json();
-        if (!data.ok) return null;
-        const clean = username.replace('@', '').toLowerCase();
-        // Ищем в обратном порядке (сначала свежие)
-        for (const upd of [...(data.result || [])].reverse()) {
-            const msg = upd.message || upd.channel_post || upd.edited_message;
-            if (!msg || !msg.chat) continue;
-            const uname = (msg.chat.username || '').toLowerCase();
-            if (uname === clean) return msg.chat.id;
-        }
-        // Ничего не нашли — попробуем ещё раз без offset (сбросить состояние)
-        const r2 = await fetch(`https://api.telegram.org/bot${TG.token}/getUpdates?offset=-1&limit=1`);
-        const d2 = await r2.json();
-        if (d2.ok && d2.result && d2.result.length) {
-            const msg = d2.result[0].message || d2.result[0].edited_message;
-            if (msg && (msg.chat.username || '').toLowerCase() === clean) return msg.chat.id;
-        }
-        return null;
-    } catch (e) {
-        console.error('[TG] getUpdates error:', e);
-        return null;
-    }
-}
-
-async function sendTelegram(chatId, text) {
-    try {
-        const r = await fetch(`https://api.telegram.org/bot${TG.token}/sendMessage`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ chat_id: chatId, text, parse_mode: 'HTML' })
-        });
-        const data = await r.json();
-        if (!data.ok) throw new Error(data.description || 'TG error');
-        console.log('[TG] Отправлено ->', chatId);
-        return true;
-    } catch (e) {
-        console.error('[TG] Ошибка:', e.message);
-        const errEl  = document.getElementById('subError');
-        const errTxt = document.getElementById('subErrorText');
-        if (errEl && errTxt) {
-            errTxt.textContent = 'Ошибка Telegram: ' + e.message;
-            errEl.style.display = 'flex';
-            setTimeout(() => { errEl.style.display = 'none'; }, 10000);
-        }
-        return false;
-    }
-}
-
-// Формирует текст сводки по текущим данным NOAA
-function buildSummaryText(label) {
-    const kp    = liveData.kp        != null ? liveData.kp.toFixed(1) : '—';
-    const wind  = liveData.windSpeed != null ? liveData.windSpeed + ' км/с' : '—';
-    const bz    = liveData.bz        != null ? liveData.bz + ' нТл' : '—';
-    const bt    = liveData.bt        != null ? liveData.bt + ' нТл' : '—';
-    const ss    = liveData.sunspots  != null ? liveData.sunspots : '—';
-    const cme   = liveData.cmeCount  != null ? liveData.cmeCount : '—';
-    const flr   = liveData.flareCount!= null ? liveData.flareCount : '—';
-    const flrCl = liveData.flareClass|| '—';
-    const now   = new Date().toLocaleString('ru-RU', { day: '2-digit', month: '2-digit', year: 'numeric', hour: '2-digit', minute: '2-digit' });
-
-    const kpStatus = parseFloat(kp) >= 7 ? 'СИЛЬНАЯ БУРЯ'
-                   : parseFloat(kp) >= 5 ? 'МАГНИТНАЯ БУРЯ'
-                   : 'Спокойно';
-
-    return `<b>Space Weather Pro — ${label}</b>
-${now} UTC
-
-<b>ТЕКУЩИЕ ПОКАЗАТЕЛИ</b>
-Kp-индекс:        <b>${kp}</b>  (${kpStatus})
-Солнечный ветер:  ${wind}
-Bz (ММП):        ${bz}
-Bt:               ${bt}
-Солнечные пятна:  ${ss}
-
-<b>СОБЫТИЯ ЗА 7 ДНЕЙ</b>
-CME-выбросов:     ${cme}
-Вспышек:          ${flr}  (макс. класс: ${flrCl})
-
-Источник: NOAA SWPC`;
-}
-
-// Немедленная сводка при подписке
-async function sendWelcomeTelegram(chatId, events) {
-    const welcome =
-`<b>Space Weather Pro</b>
-
-Вы подписаны на уведомления о космической погоде.
-
-Вы будете получать:
-   - Сводку каждые 12 часов
-${events.filter(e => e !== 'Ежедневно').map(e => '   - Экстренное уведомление при: ' + e).join('\n')}
-
-Текущее состояние:
-
-` + buildSummaryText('Сводка на момент подписки');
-    return sendTelegram(chatId, welcome);
-}
-
-// Отправить сводку всем подписчикам (вызывается каждые 12 часов)
-async function sendScheduledSummary() {
-    const subs = JSON.parse(localStorage.getItem('swp_subs') || '[]');
-    const targets = subs.filter(s => s.type === 'telegram' && s.chatId);
-    if (!targets.length) return;
-    const text = buildSummaryText('Сводка за 12 часов');
-    for (const sub of targets) {
-        await sendTelegram(sub.chatId, text);
-    }
-    console.log('[TG] Плановая 12-часовая сводка отправлена:', targets.length, 'подписчикам');
-}
-
-// Запустить 12-часовой таймер сводок
-function startSummaryScheduler() {
-    const INTERVAL_MS = 12 * 60 * 60 * 1000; // 12 часов
-    const lastSentStr = localStorage.getItem('swp_last_summary');
-    const lastSent    = lastSentStr ? parseInt(lastSentStr) : 0;
-    const now         = Date.now();
-    const elapsed     = now - lastSent;
-
-    // Если с прошлой отправки прошло больше 12 часов — отправить сразу
-    if (elapsed >= INTERVAL_MS) {
-        const subs = JSON.parse(localStorage.getItem('swp_subs') || '[]');
-        if (subs.some(s => s.type === 'telegram' && s.chatId)) {
-            sendScheduledSummary();
-            localStorage.setItem('swp_last_summary', String(Date.now()));
-        }
-    }
-
-    // Повторять каждые 12 часов пока страница открыта
-    setInterval(async () => {
-        await sendScheduledSummary();
-        localStorage.setItem('swp_last_summary', String(Date.now()));
-    }, INTERVAL_MS);
-}
-
-async function sendStormAlert(kp, bz, wind) {
-    const subs    = JSON.parse(localStorage.getItem('swp_subs') || '[]');
-    const targets = subs.filter(s => s.type === 'telegram' && s.chatId && s.events.includes('Kp≥5'));
-    if (!targets.length) return;
-    if (kp - lastAlertKp < 0.5) return;
-    lastAlertKp = kp;
-
-    const level = kp >= 7 ? 'СИЛЬНАЯ БУРЯ' : 'МАГНИТНАЯ БУРЯ';
-    const text =
-`<b>ВНИМАНИЕ: ${level}</b>
-Kp = ${kp.toFixed(1)}
-
-` + buildSummaryText('Экстренное уведомление') +
-`
-${kp >= 7 ? 'Возможны помехи GPS, радиосвязи и энергосетей.' : ''}
-Полярные сияния возможны на широтах выше 55 градусов.`;
-
-    for (const sub of targets) {
-        await sendTelegram(sub.chatId, text);
-    }
-}
-
 // ═══════════════════════════════════════════════════════════
 //  НАВИГАЦИЯ
 // ═══════════════════════════════════════════════════════════
@@ -277,7 +107,23 @@ function initGeolocation() {
         });
 }
 
+// Вероятность сияний в точке пользователя - из сетки сервера (OVATION и Kp)
+let auroraPointProb = null;
+
+async function loadAuroraProbability() {
+    try {
+        const r = await fetch(`/api/aurora?lat=${userLat.toFixed(2)}&lon=${userLon.toFixed(2)}`);
+        if (!r.ok) return;
+        const d = await r.json();
+        auroraPointProb = d.probability;
+        setText('auroraProb', auroraPointProb + '%');
+    } catch (e) {
+        // Остается оценка по Kp
+    }
+}
+
 function updatePersonal() {
+    loadAuroraProbability();
     const kp  = liveData.kp ?? 3.3;
     const lat = Math.abs(userLat);
     const notice = document.getElementById('personalNotice');
@@ -308,6 +154,8 @@ const liveData = {
     windHistory: [],
     cmeEvents:   [],  // [{date, time, speed, warn}]
     flareEvents: [],  // [{date, time, cls, warn}]
+    averages: null,   // скользящие 30-дневные средние с сервера
+    storm: null,      // оценка угрозы бури по минутным данным RTSW ({level, reasons})
 };
 
 const AVG_30 = { cme: 2.5, flares: 5.3, kp: 3.2, wind: 430 };
@@ -315,147 +163,27 @@ const AVG_30 = { cme: 2.5, flares: 5.3, kp: 3.2, wind: 430 };
 // ═══════════════════════════════════════════════════════════
 //  NOAA API
 // ═══════════════════════════════════════════════════════════
-// Прокси для обхода CORS и блокировок в России
-async function safeFetch(url) {
-    const proxies = [
-        u => u,
-        u => `https://corsproxy.io/?${encodeURIComponent(u)}`,
-        u => `https://api.allorigins.win/raw?url=${encodeURIComponent(u)}`,
-    ];
-    for (const makeUrl of proxies) {
-        try {
-            const controller = new AbortController();
-            const timer = setTimeout(() => controller.abort(), 8000);
-            const r = await fetch(makeUrl(url), { signal: controller.signal });
-            clearTimeout(timer);
-            if (!r.ok) throw new Error('HTTP ' + r.status);
-            const data = await r.json();
-            if (data) return data;
-        } catch (e) {
-            console.warn('[NOAA] прокси не сработал:', e.message);
-        }
-    }
-    return null;
-}
+// Все данные NOAA собирает наш сервер: один небольшой запрос к своему домену
+// (ETag - браузер сам получает 304, если данные не изменились)
+const LIVE_FIELDS = ['kp', 'kpForecast', 'windSpeed', 'windDensity', 'bz', 'bt', 'sunspots',
+                     'flareCount', 'flareClass', 'cmeCount', 'kpHistory', 'windHistory',
+                     'cmeEvents', 'flareEvents', 'averages', 'storm'];
+// Поля, для которых null с сервера - значение (угрозы нет), а не отсутствие данных
+const LIVE_NULLABLE = ['storm'];
 
 async function fetchAllNoaaData() {
-    const [kpRaw, kpFcRaw, windRaw, magRaw, ssRaw, alertsRaw] = await Promise.all([
-        safeFetch('https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json'),
-        safeFetch('https://services.swpc.noaa.gov/json/geospace/predicted_kp.json'),
-        safeFetch('https://services.swpc.noaa.gov/json/rtsw/rtsw_wind_1m.json'),
-        safeFetch('https://services.swpc.noaa.gov/json/rtsw/rtsw_mag_1m.json'),
-        safeFetch('https://services.swpc.noaa.gov/json/sunspot_regions.json'),
-        safeFetch('https://services.swpc.noaa.gov/json/alerts.json'),
-    ]);
-
-    // Kp текущий + история
-    if (kpRaw && Array.isArray(kpRaw)) {
-        const rows = kpRaw.filter((r, i) => i > 0 && !isNaN(parseFloat(r[1])));
-        if (rows.length) {
-            liveData.kp = parseFloat(rows[rows.length - 1][1]);
-            liveData.kpHistory = rows.slice(-24).map(r => ({
-                label: String(r[0]).slice(11, 16),
-                value: parseFloat(r[1])
-            }));
-        }
-    }
-
-    // Kp прогноз
-    if (kpFcRaw && Array.isArray(kpFcRaw)) {
-        const rows = kpFcRaw.filter((r, i) => i > 0 && !isNaN(parseFloat(r[1])));
-        if (rows.length) liveData.kpForecast = parseFloat(rows[0][1]);
-    }
-
-    // Солнечный ветер
-    if (windRaw && Array.isArray(windRaw)) {
-        for (let i = windRaw.length - 1; i >= 0; i--) {
-            const w = windRaw[i];
-            if (w.proton_speed != null && !isNaN(w.proton_speed)) {
-                liveData.windSpeed   = Math.round(w.proton_speed);
-                liveData.windDensity = w.proton_density != null ? parseFloat(w.proton_density).toFixed(1) : null;
-                break;
-            }
-        }
-        const step = Math.max(1, Math.floor(windRaw.length / 48));
-        liveData.windHistory = [];
-        for (let i = 0; i < windRaw.length; i += step) {
-            const w = windRaw[i];
-            if (w.proton_speed != null && !isNaN(w.proton_speed)) {
-                liveData.windHistory.push({ label: String(w.time_tag || '').slice(11, 16), value: Math.round(w.proton_speed) });
-            }
-        }
-        liveData.windHistory = liveData.windHistory.slice(-48);
-    }
-
-    // Bz / Bt (межпланетное магнитное поле)
-    if (magRaw && Array.isArray(magRaw)) {
-        for (let i = magRaw.length - 1; i >= 0; i--) {
-            const m = magRaw[i];
-            if (m.bz_gsm != null && !isNaN(m.bz_gsm)) {
-                liveData.bz = parseFloat(m.bz_gsm).toFixed(1);
-                liveData.bt = m.bt != null ? parseFloat(m.bt).toFixed(1) : null;
-                break;
-            }
-        }
-    }
-
-    // Солнечные пятна
-    if (ssRaw && Array.isArray(ssRaw)) {
-        liveData.sunspots = ssRaw.length;
-    }
-
-    // Алерты (вспышки + CME)
-    if (alertsRaw && Array.isArray(alertsRaw)) {
-        const weekAgo = Date.now() - 7 * 24 * 3600 * 1000;
-        const recent  = alertsRaw.filter(a => {
-            const t = new Date(a.issue_datetime).getTime();
-            return !isNaN(t) && t >= weekAgo;
-        });
-
-        const cmeArr = recent.filter(a =>
-            (a.product_id && a.product_id.includes('CME')) ||
-            (a.message    && /coronal mass ejection|CME/i.test(a.message))
-        );
-        if (cmeArr.length) liveData.cmeCount = cmeArr.length;
-
-        // Сохраняем отдельные CME с реальными датами NOAA
-        liveData.cmeEvents = cmeArr.map((a, i) => {
-            const d       = new Date(a.issue_datetime);
-            const dateStr = d.toLocaleDateString('ru-RU', { day: '2-digit', month: '2-digit', year: 'numeric' });
-            const timeStr = d.toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
-            const speedM  = (a.message || '').match(/(\d{3,4})\s*km\/s/i);
-            const speed   = speedM ? parseInt(speedM[1]) : null;
-            return { num: i + 1, date: dateStr, time: timeStr, speed, warn: speed ? speed > 450 : false };
-        });
-
-        const flrArr = recent.filter(a =>
-            (a.product_id && (a.product_id.includes('AL_FLARE') || a.product_id.includes('WATA'))) ||
-            (a.message    && /solar flare|X-ray|class [XMC]/i.test(a.message))
-        );
-        if (flrArr.length) liveData.flareCount = flrArr.length;
-
-        // Сохраняем отдельные вспышки с реальными датами NOAA
-        liveData.flareEvents = flrArr.map(a => {
-            const d       = new Date(a.issue_datetime);
-            const dateStr = d.toLocaleDateString('ru-RU', { day: '2-digit', month: '2-digit', year: 'numeric' });
-            const timeStr = d.toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
-            const clsM    = (a.message || '').match(/([XMC]\d+(?:\.\d+)?)/);
-            const cls     = clsM ? clsM[1] : '?';
-            return { date: dateStr, time: timeStr, cls, warn: cls[0] === 'X' || cls[0] === 'M' };
-        });
-
-        const order = { X: 3, M: 2, C: 1 };
-        let maxCls = null;
-        recent.forEach(a => {
-            const hits = (a.message || '').match(/([XMC]\d+(?:\.\d+)?)/g) || [];
-            hits.forEach(cls => {
-                if (!maxCls ||
-                    order[cls[0]] > order[maxCls[0]] ||
-                    (order[cls[0]] === order[maxCls[0]] && parseFloat(cls.slice(1)) > parseFloat(maxCls.slice(1))))
-                    maxCls = cls;
-            });
+    try {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), 8000);
+        const r = await fetch('/api/live', { signal: controller.signal });
+        clearTimeout(timer);
+        if (!r.ok) throw new Error('HTTP ' + r.status);
+        const data = await r.json();
+        LIVE_FIELDS.forEach(key => {
+            if (data[key] != null || (LIVE_NULLABLE.includes(key) && key in data)) liveData[key] = data[key];
         });
-        if (maxCls) liveData.flareClass = maxCls;
+    } catch (e) {
+        console.warn('[API] данные не получены:', e.message);
     }
 }
 
@@ -647,13 +375,14 @@ function applyAllData() {
     const flareProb = flareClass[0] === 'X' ? 45 : flareClass[0] === 'M' ? 22 : 8;
     setText('flareProb',   flareProb + '%');
     setText('kpForecast',  typeof kpFc === 'number' ? kpFc.toFixed(1) : kpFc);
-    setText('auroraProb',  auroraProb + '%');
+    setText('auroraProb',  (auroraPointProb ?? auroraProb) + '%');
 
     // ── Карточки сравнения ──
-    updateCompCard('comp-cme-badge', 'c-cme-now', 'c-cme-avg', 'c-cme-diff', cmeCount,   AVG_30.cme,    cmeCount > 2);
-    updateCompCard('comp-flr-badge', 'c-flr-now', 'c-flr-avg', 'c-flr-diff', flareCount, AVG_30.flares, flareCount < 3 || flareCount > 8);
-    updateCompCard('comp-kp-badge',  'c-kp-now',  'c-kp-avg',  'c-kp-diff',  kp,         AVG_30.kp,     kp >= 5, 1);
-    updateCompCard('comp-wnd-badge', 'c-wnd-now', 'c-wnd-avg', 'c-wnd-diff', windSpeed,  AVG_30.wind,   windSpeed > 600);
+    const avg = { ...AVG_30, ...(liveData.averages || {}) };
+    updateCompCard('comp-cme-badge', 'c-cme-now', 'c-cme-avg', 'c-cme-diff', cmeCount,   avg.cme,    cmeCount > 2);
+    updateCompCard('comp-flr-badge', 'c-flr-now', 'c-flr-avg', 'c-flr-diff', flareCount, avg.flares, flareCount < 3 || flareCount > 8);
+    updateCompCard('comp-kp-badge',  'c-kp-now',  'c-kp-avg',  'c-kp-diff',  kp,         avg.kp,     kp >= 5, 1);
+    updateCompCard('comp-wnd-badge', 'c-wnd-now', 'c-wnd-avg', 'c-wnd-diff', windSpeed,  avg.wind,   windSpeed > 600);
 
     // ── Алерт-баннер ──
     updateStormBanner(kp, bzNum);
@@ -681,7 +410,9 @@ function updateCompCard(badgeId, nowId, avgId, diffId, now, avg, isWarn, dec = 0
 
 function updateStormBanner(kp, bzNum) {
     let banner = document.getElementById('stormBanner');
-    const isBig = kp >= 5 || (!isNaN(bzNum) && bzNum < -10);
+    // Оценка сервера по часам минутных данных RTSW (южный Bz, функция Ньюэлла, давление)
+    const storm = liveData.storm && liveData.storm.level !== 'normal' ? liveData.storm : null;
+    const isBig = kp >= 5 || (!isNaN(bzNum) && bzNum < -10) || !!storm;
     if (isBig) {
         if (!banner) {
             banner = document.createElement('div');
@@ -696,9 +427,10 @@ function updateStormBanner(kp, bzNum) {
             ].join(';');
             document.body.appendChild(banner);
         }
-        const lvl    = kp >= 7 ? '🔴 СИЛЬНАЯ БУРЯ' : '🟡 МАГНИТНАЯ БУРЯ';
+        const lvl    = kp >= 7 ? '🔴 СИЛЬНАЯ БУРЯ' : kp >= 5 ? '🟡 МАГНИТНАЯ БУРЯ' : '🟠 УГРОЗА БУРИ';
         const bzNote = !isNaN(bzNum) && bzNum < 0 ? ` · Bz = ${liveData.bz} нТл (юг)` : '';
-        banner.innerHTML = `⚠️ ${lvl} — Kp = ${kp.toFixed(1)}${bzNote} &nbsp;|&nbsp; <span style="opacity:0.8;font-weight:400;font-size:13px;">Помехи связи, сияния на широтах > 55°</span>`;
+        const drivers = storm ? ` · ${storm.reasons.join(', ')}` : '';
+        banner.innerHTML = `⚠️ ${lvl} — Kp = ${kp.toFixed(1)}${bzNote}${drivers} &nbsp;|&nbsp; <span style="opacity:0.8;font-weight:400;font-size:13px;">Помехи связи, сияния на широтах > 55°</span>`;
     } else if (banner) {
         banner.remove();
     }
@@ -719,7 +451,8 @@ function startCountdown() {
         countdownSec--;
         if (countdownSec <= 0) {
             countdownSec = UPDATE_INTERVAL_SEC;
-            loadAllData();
+            // При активном push-канале сервер сам сообщит о новых данных
+            if (!pushConnected) loadAllData();
         }
         renderCountdown();
     }, 1000);
@@ -732,6 +465,25 @@ function renderCountdown() {
     if (el) el.textContent = `⏱ следующее обновление через ${m}:${s}`;
 }
 
+// ═══════════════════════════════════════════════════════════
+//  PUSH-УВЕДОМЛЕНИЯ О НОВЫХ ДАННЫХ (Server-Sent Events)
+// ═══════════════════════════════════════════════════════════
+let pushConnected = false;
+let liveVersion   = null;
+
+function subscribeUpdates() {
+    if (!window.EventSource) return;
+    const source = new EventSource('/api/events');
+    source.onopen  = () => { pushConnected = true; };
+    source.onerror = () => { pushConnected = false; }; // EventSource переподключится сам
+    source.addEventListener('version', e => {
+        const msg = JSON.parse(e.data);
+        // Первое сообщение - текущая версия; загружаем только изменившиеся данные
+        if (liveVersion !== null && msg.live !== liveVersion) loadAllData();
+        liveVersion = msg.live;
+    });
+}
+
 // ═══════════════════════════════════════════════════════════
 //  КАРТА ПОЛЯРНЫХ СИЯНИЙ
 // ═══════════════════════════════════════════════════════════
@@ -770,11 +522,10 @@ function updateAuroraMap() {
 }
 
 function updateAuroraImages() {
+    // Изображения OVATION отдает наш сервер (кэш по хэшу, 304 если не изменились)
     const timestamp = new Date().getTime();
-    document.getElementById('aurora-north').src =
-        `https://services.swpc.noaa.gov/images/aurora-forecast-northern-hemisphere.jpg?t=${timestamp}`;
-    document.getElementById('aurora-south').src =
-        `https://services.swpc.noaa.gov/images/aurora-forecast-southern-hemisphere.jpg?t=${timestamp}`;
+    document.getElementById('aurora-north').src = `/api/aurora/north?t=${timestamp}`;
+    document.getElementById('aurora-south').src = `/api/aurora/south?t=${timestamp}`;
 }
 updateAuroraImages();
 setInterval(updateAuroraImages, 3600000);
@@ -1507,14 +1258,6 @@ async function loadAllData() {
         `;
     }
     startCountdown();
-
-    // Email-алерт при буре
-    const kp = liveData.kp ?? 0;
-    if (kp >= 5) {
-        const bz   = liveData.bz   != null ? parseFloat(liveData.bz) : null;
-        const wind = liveData.windSpeed;
-        sendStormAlert(kp, bz, wind);
-    }
 }
 
 // ═══════════════════════════════════════════════════════════
@@ -1547,9 +1290,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     // Всегда грузим при открытии — данные всегда свежие
     await loadAllData();
     checkDailyRefresh(); // сохраняем дату для следующего дня
-
-    // Запустить 12-часовой планировщик сводок в Telegram
-    startSummaryScheduler();
+    subscribeUpdates();
 
     initCMEChart();
     initGeoChart();
@@ -1579,7 +1320,9 @@ function switchSubTab(type, btn) {
     if (ss) ss.classList.remove('show');
 }
 
-function submitSubscription(type) {
+// Подписка хранится на сервере: сводки и экстренные уведомления рассылает он,
+// даже когда страница закрыта. В localStorage - только токен для отписки.
+async function submitSubscription(type) {
     const input = document.getElementById('subTgInput');
     const val   = input ? input.value.trim() : '';
     if (!val) { if (input) input.focus(); return; }
@@ -1593,8 +1336,6 @@ function submitSubscription(type) {
     if (document.getElementById('chkKp')?.checked)    events.push('Kp≥5');
     if (document.getElementById('chkDaily')?.checked) events.push('Ежедневно');
 
-    const subs = JSON.parse(localStorage.getItem('swp_subs') || '[]');
-
     // Показываем промежуточный статус
     const st = document.getElementById('subSuccessTitle');
     const sx = document.getElementById('subSuccessText');
@@ -1603,23 +1344,39 @@ function submitSubscription(type) {
     if (sx) sx.textContent = `Убедитесь что вы написали /start боту @spaceweather67_bot`;
     if (ss) ss.classList.add('show');
 
-    getTelegramChatId(username).then(chatId => {
-        const entry = { type: 'telegram', value: username, chatId, events, date: new Date().toLocaleDateString('ru-RU') };
-        subs.push(entry);
-        localStorage.setItem('swp_subs', JSON.stringify(subs));
-
-        if (chatId) {
-            sendWelcomeTelegram(chatId, events);
-            if (st) st.textContent = 'Telegram подключён!';
-            if (sx) sx.textContent = `Сводка отправлена на ${username}. Следующая — через 12 часов. Уведомления при: ${events.join(', ')}.`;
-        } else {
-            if (st) st.textContent = 'Аккаунт не найден';
-            if (sx) sx.textContent = `Напишите /start боту @spaceweather67_bot в Telegram, затем попробуйте снова.`;
-        }
-    });
+    let resp, body = {};
+    try {
+        resp = await fetch('/api/subscriptions', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, events })
+        });
+        body = await resp.json().catch(() => ({}));
+    } catch (e) {
+        console.error('[SWP] Подписка:', e);
+        if (st) st.textContent = 'Сервер недоступен';
+        if (sx) sx.textContent = 'Попробуйте позже.';
+        return;
+    }
 
-    if (input) input.value = '';
-    console.log('[Space Weather Pro] Подписка Telegram:', { username, events });
+    if (resp.ok) {
+        const subs = JSON.parse(localStorage.getItem('swp_subs') || '[]')
+            .filter(s => s.chatId !== body.chat_id);
+        subs.push({ type: 'telegram', value: body.username || username, chatId: body.chat_id,
+                    token: body.token, events: body.events || events,
+                    date: new Date().toLocaleDateString('ru-RU') });
+        localStorage.setItem('swp_subs', JSON.stringify(subs));
+        if (st) st.textContent = 'Telegram подключён!';
+        if (sx) sx.textContent = `Сводка отправлена на ${username}. Следующая — через 12 часов. Уведомления при: ${events.join(', ')}.`;
+        if (input) input.value = '';
+    } else if (resp.status === 404) {
+        if (st) st.textContent = 'Аккаунт не найден';
+        if (sx) sx.textContent = `Напишите /start боту @spaceweather67_bot в Telegram, затем попробуйте снова.`;
+    } else {
+        if (st) st.textContent = 'Подписка не оформлена';
+        if (sx) sx.textContent = body.detail || `Ошибка сервера (${resp.status})`;
+    }
+    console.log('[Space Weather Pro] Подписка Telegram:', { username, events, status: resp.status });
 }
 
 function openManageModal() {
@@ -1640,8 +1397,19 @@ function openManageModal() {
     document.getElementById('subManageOverlay').classList.add('open');
 }
 
-function deleteSub(idx) {
+async function deleteSub(idx) {
     const subs = JSON.parse(localStorage.getItem('swp_subs') || '[]');
+    const sub  = subs[idx];
+    if (sub && sub.chatId && sub.token) {
+        try {
+            const r = await fetch(`/api/subscriptions/${sub.chatId}?token=${encodeURIComponent(sub.token)}`, { method: 'DELETE' });
+            // 404 - подписки на сервере уже нет: запись все равно удаляется
+            if (!r.ok && r.status !== 404) throw new Error('HTTP ' + r.status);
+        } catch (e) {
+            console.error('[SWP] Отписка:', e);
+            return;
+        }
+    }
     subs.splice(idx, 1);
     localStorage.setItem('swp_subs', JSON.stringify(subs));
     openManageModal();
@@ -0,0 +1,74 @@
+"""Разбор наукаста OVATION и запросы точек сетки сияний (aurora.py)"""
+import json
+import os
+
+import numpy as np
+
+from aurora import (AuroraGrid, build_grid, load_ovation, parse_ovation, view_grid, OVATION_MAX_AGE,
+                    VIEW_DEGREES)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'ovation_aurora_latest.json')
+OBSERVED = 1792311540  # 2026-10-18T08:19:00Z
+
+
+def load_fixture():
+    with open(FIXTURE, 'rb') as f:
+        return f.read()
+
+
+def test_parse_ovation_places_points():
+    overhead, observed = parse_ovation(json.loads(load_fixture()))
+    assert observed == OBSERVED
+    assert overhead.shape == (181, 360) and overhead.dtype == np.uint8
+    assert overhead[65 + 90, 37] == 80 and overhead[64 + 90, 37] == 10
+    # Долгота 360 - та же, что 0; дробные координаты округляются, вероятность ограничена 100
+    assert overhead[71 + 90, 0] == 17
+    assert overhead[46 + 90, 181] == 100
+    # Широта вне сетки отбрасывается
+    assert overhead.sum() == 80 + 10 + 42 + 17 + 80 + 5 + 100
+    assert np.array_equal(load_ovation(load_fixture())[0], overhead)
+
+
+def test_lookup_wraps_longitude():
+    overhead, _ = parse_ovation(json.loads(load_fixture()))
+    grid = AuroraGrid(overhead, 'ovation', OBSERVED, 3.0)
+    for lon in (359, -1, 359.4, 719, -361):
+        assert grid.lookup(70, lon) == 42
+    for lon in (0, 360, -0.4, 359.6):
+        assert grid.lookup(71, lon) == 17
+    # Широта за полюсом прижимается к крайнему ряду
+    assert grid.lookup(95, 180) == 5 and grid.lookup(-100, 0) == 0
+    assert grid.lookup_many([70, 70, 71, 95], [-1, 719, 359.6, 180]).tolist() == [42, 42, 17, 5]
+
+
+def test_view_band_looks_poleward_in_each_hemisphere():
+    overhead, _ = parse_ovation(json.loads(load_fixture()))
+    view = view_grid(overhead)
+
+    def weight(distance):
+        return int(np.rint(80 * (1.0 - 0.5 * distance / VIEW_DEGREES)))
+
+    # Север: сияние на 65° с.ш. видно южнее (к экватору), но не севернее
+    assert view[65 + 90, 37] == 80
+    assert [int(view[65 - d + 90, 37]) for d in range(2, VIEW_DEGREES + 1)] == \
+        [weight(d) for d in range(2, VIEW_DEGREES + 1)]
+    assert view[64 + 90, 37] == weight(1)  # свой узел (10) слабее видимого сияния
+    assert view[65 - VIEW_DEGREES - 1 + 90, 37] == 5  # край полосы узла 64° (10 · 0.5)
+    assert view[65 - VIEW_DEGREES - 2 + 90, 37] == 0
+    assert view[66 + 90, 37] == 0
+    # Юг: сияние на 65° ю.ш. видно севернее (к экватору), но не южнее
+    assert [int(view[-65 + d + 90, 20]) for d in range(1, VIEW_DEGREES + 1)] == \
+        [weight(d) for d in range(1, VIEW_DEGREES + 1)]
+    assert view[-66 + 90, 20] == 0
+    assert view[-65 + VIEW_DEGREES + 1 + 90, 20] == 0
+
+
+def test_build_grid_falls_back_to_kp_model():
+    ovation = parse_ovation(json.loads(load_fixture()))
+    fresh = build_grid(3.0, ovation, now=OBSERVED + 60)
+    assert fresh.source == 'ovation' and fresh.lookup(62, 37) == view_grid(ovation[0])[62 + 90, 37]
+    stale = build_grid(3.0, ovation, now=OBSERVED + OVATION_MAX_AGE + 1)
+    assert stale.source == 'kp' and stale.observed is None
+    assert build_grid(3.0, None).source == 'kp'
+    # Пустой наукаст не заменяет модель
+    assert build_grid(3.0, (np.zeros_like(ovation[0]), OBSERVED), now=OBSERVED).source == 'kp'
@@ -0,0 +1,99 @@
+"""HTTP-кэш продуктов NOAA (fetcher.fetch_json + httpcache.py) на заглушке aiohttp.web
+
+Запуск из корня проекта:  python -m pytest -q tests
+"""
+import asyncio
+import json
+
+from aiohttp import web
+
+from fetcher import SpaceWeatherFetcher
+from httpclient import HttpClient
+
+KP_PATH = '/json/planetary_k_index_1m.json'
+KP_BODY = json.dumps([{'time_tag': '2026-10-18T08:00:00', 'kp_index': 3, 'estimated_kp': 3.33}]).encode()
+ETAG = '"kp-1"'
+
+
+async def start_stub():
+    """Заглушка NOAA: продукт Kp с ETag, на If-None-Match отвечает 304"""
+    requests = []
+
+    async def kp_index(request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == ETAG:
+            return web.Response(status=304, headers={'ETag': ETAG})
+        return web.Response(body=KP_BODY, content_type='application/json', headers={'ETag': ETAG})
+
+    app = web.Application()
+    app.router.add_get(KP_PATH, kp_index)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}', requests
+
+
+def counting(parsed):
+    """json.loads со счетчиком вызовов"""
+    def parse(body):
+        parsed.append(body)
+        return json.loads(body)
+    return parse
+
+
+def test_revalidation_reuses_parsed_result(tmp_path):
+    async def scenario():
+        runner, base, requests = await start_stub()
+        parsed = []
+        try:
+            fetcher = SpaceWeatherFetcher(str(tmp_path), base_url=base)
+            url = fetcher.endpoints['kp_index']
+            async with HttpClient() as client:
+                first = await fetcher.fetch_json(client, url, 'Kp index', parse=counting(parsed))
+                second = await fetcher.fetch_json(client, url, 'Kp index', parse=counting(parsed))
+                # В пределах max_age ответ берется из кэша без запроса
+                third = await fetcher.fetch_json(client, url, 'Kp index', max_age=60, parse=counting(parsed))
+            stats = fetcher.http_cache.stats['Kp index']
+        finally:
+            await runner.cleanup()
+        return first, second, third, stats, requests, parsed
+
+    first, second, third, stats, requests, parsed = asyncio.run(scenario())
+    assert first == json.loads(KP_BODY)
+    assert second is first and third is first
+    assert requests == [None, ETAG]
+    assert len(parsed) == 1
+    assert stats == {'hits': 1, 'revalidations': 1, 'misses': 1, 'bytes_saved': 2 * len(KP_BODY)}
+
+
+def test_restart_parses_cached_body_once(tmp_path):
+    async def scenario():
+        runner, base, requests = await start_stub()
+        parsed = []
+        try:
+            async with HttpClient() as client:
+                await SpaceWeatherFetcher(str(tmp_path), base_url=base).fetch_json(
+                    client, base + KP_PATH, 'Kp index')
+                # Новый процесс: валидаторы и тело с диска, сервер отвечает 304
+                fetcher = SpaceWeatherFetcher(str(tmp_path), base_url=base)
+                data = await fetcher.fetch_json(client, base + KP_PATH, 'Kp index', parse=counting(parsed))
+                again = await fetcher.fetch_json(client, base + KP_PATH, 'Kp index', parse=counting(parsed))
+            stats = fetcher.http_cache.stats['Kp index']
+        finally:
+            await runner.cleanup()
+        return data, again, stats, requests, parsed
+
+    data, again, stats, requests, parsed = asyncio.run(scenario())
+    assert data == json.loads(KP_BODY) and again is data
+    assert requests == [None, ETAG, ETAG]
+    assert parsed == [KP_BODY]
+    assert stats == {'hits': 0, 'revalidations': 2, 'misses': 0, 'bytes_saved': 2 * len(KP_BODY)}
+
+
+def test_base_url_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('NOAA_BASE', 'http://mirror.example/')
+    fetcher = SpaceWeatherFetcher(str(tmp_path))
+    assert fetcher.endpoints['kp_index'] == 'http://mirror.example' + KP_PATH
+    assert SpaceWeatherFetcher(str(tmp_path), base_url='http://other').endpoints['ovation'].startswith('http://other/json/')
@@ -0,0 +1,250 @@
+import math
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Any, Iterable, Optional
+
+# Запись фиксированной ширины: время (секунды Unix, UTC) и значение
+RECORD = np.dtype([('t', '<i8'), ('v', '<f8')])
+# Записей в одном файле-сегменте (~1 МБ, полтора месяца минутных данных)
+SEGMENT_RECORDS = 1 << 16
+# Максимум точек в одном ответе; больше - сворачиваем с автоматическим шагом
+MAX_POINTS = 5000
+
+
+def parse_time_tags(tags: Iterable[Optional[str]]) -> np.ndarray:
+    """ISO time_tag NOAA ('2024-01-01T00:00:00Z', '2024-01-01 00:00:00.000') -> datetime64[s] (UTC)
+
+    Нераспознанные и пустые метки превращаются в NaT и отбрасываются вызывающим кодом.
+    """
+    values = [(tag or 'NaT')[:19] for tag in tags]
+    try:
+        times = np.array(values, dtype='datetime64[s]')
+    except ValueError:
+        times = np.array([_parse_tag(tag) for tag in values], dtype='datetime64[s]')
+    return times
+
+
+def _parse_tag(tag: str):
+    try:
+        return np.datetime64(tag, 's')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+class Series:
+    """Один временной ряд: упорядоченные по времени сегменты только для дозаписи
+
+    Сегмент - файл <время первой записи>.seg из записей RECORD; читается через
+    np.memmap, поэтому запрос диапазона не загружает в память весь ряд.
+    """
+
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._maps: Dict[int, np.memmap] = {}  # заполненные сегменты не меняются
+        os.makedirs(directory, exist_ok=True)
+        self.segments: List[int] = []
+        self._scanned = None
+        self.last_time: Optional[int] = None
+        self._load_tail()
+
+    def _load_tail(self, repair: bool = False):
+        """Сегменты и время последней записи с диска: пока процесс был читателем,
+        ряд дописывал другой (ведущий) процесс
+
+        Обрезать недописанную запись (repair) может только пишущий процесс -
+        ведущий, в append; читатель ее просто не видит (_count округляет вниз).
+        """
+        self._scan()
+        self.last_time = None
+        if self.segments:
+            if repair:
+                self._repair(self.segments[-1])
+            last = self._map(self.segments[-1])
+            if last.size:
+                self.last_time = int(last['t'][-1])
+
+    def _scan(self):
+        """Список сегментов; перечитывается, если ведущий процесс начал новый сегмент"""
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._scanned:
+            self.segments = sorted(
+                int(fname[:-4]) for fname in os.listdir(self.directory) if fname.endswith('.seg')
+            )
+            self._scanned = mtime
+
+    def _path(self, start: int) -> str:
+        return os.path.join(self.directory, f"{start:012d}.seg")
+
+    def _count(self, start: int) -> int:
+        path = self._path(start)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // RECORD.itemsize
+
+    def _repair(self, start: int):
+        """Обрезает недописанную запись в конце сегмента (после аварийной остановки)"""
+        path = self._path(start)
+        size = os.path.getsize(path)
+        if size % RECORD.itemsize:
+            with open(path, 'r+b') as f:
+                f.truncate(size - size % RECORD.itemsize)
+
+    def _map(self, start: int) -> np.ndarray:
+        mapped = self._maps.get(start)
+        if mapped is not None:
+            return mapped
+        count = self._count(start)
+        if count == 0:
+            return np.empty(0, dtype=RECORD)
+        mapped = np.memmap(self._path(start), dtype=RECORD, mode='r', shape=(count,))
+        if count >= SEGMENT_RECORDS:
+            self._maps[start] = mapped
+        return mapped
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> int:
+        """Дописывает отсчеты новее последнего; возвращает число записанных"""
+        times = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        mask = ~np.isnan(values) & (times != np.iinfo(np.int64).min)
+
+        with self._lock:
+            self._load_tail(repair=True)
+            if self.last_time is not None:
+                mask &= times > self.last_time
+            if not mask.any():
+                return 0
+
+            # Сортировка и удаление повторов по времени (остается первое значение)
+            times, first = np.unique(times[mask], return_index=True)
+            records = np.empty(times.size, dtype=RECORD)
+            records['t'] = times
+            records['v'] = values[mask][first]
+
+            written = 0
+            while written < records.size:
+                if not self.segments or self._count(self.segments[-1]) >= SEGMENT_RECORDS:
+                    self.segments.append(int(records['t'][written]))
+                start = self.segments[-1]
+                room = SEGMENT_RECORDS - self._count(start)
+                chunk = records[written:written + room]
+                with open(self._path(start), 'ab') as f:
+                    f.write(chunk.tobytes())
+                written += chunk.size
+            self.last_time = int(records['t'][-1])
+        return int(records.size)
+
+    def read(self, t_from: int, t_to: int):
+        """Отсчеты в интервале [t_from, t_to]: (массив времени, массив значений)"""
+        parts = []
+        with self._lock:
+            self._scan()
+            segments = list(self.segments)
+        for i, start in enumerate(segments):
+            following = segments[i + 1] if i + 1 < len(segments) else None
+            if start > t_to or (following is not None and following <= t_from):
+                continue
+            records = self._map(start)
+            lo = np.searchsorted(records['t'], t_from, side='left')
+            hi = np.searchsorted(records['t'], t_to, side='right')
+            if hi > lo:
+                parts.append(np.array(records[lo:hi]))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        joined = np.concatenate(parts)
+        return joined['t'], joined['v']
+
+
+def rollup(times: np.ndarray, values: np.ndarray, t_from: int, step: int) -> Dict[str, np.ndarray]:
+    """Свертка отсортированных отсчетов по интервалам step: min/max/mean/count"""
+    buckets = (times - t_from) // step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, times.size])
+    return {
+        'time': t_from + buckets[starts] * step,
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'mean': np.add.reduceat(values, starts) / counts,
+        'count': counts,
+    }
+
+
+class TimeSeriesStore:
+    """Локальный архив временных рядов (Kp, солнечный ветер, ММП, Dst, X-ray)"""
+
+    def __init__(self, directory: str, names: Iterable[str]):
+        self.directory = directory
+        self.names = tuple(names)
+        self._series: Dict[str, Series] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def series(self, name: str) -> Series:
+        with self._lock:
+            if name not in self._series:
+                self._series[name] = Series(name, os.path.join(self.directory, name))
+            return self._series[name]
+
+    def append(self, name: str, times: np.ndarray, values: np.ndarray) -> int:
+        return self.series(name).append(times, values)
+
+    def ingest(self, records: List[Dict[str, Any]], fields: Dict[str, str]) -> Dict[str, int]:
+        """Дописывает поля записей NOAA (ряд -> ключ записи) по их time_tag
+
+        Записи RTSW с active=false (резервный аппарат) пропускаются.
+        """
+        rows = [item for item in records if isinstance(item, dict) and item.get('active', True)]
+        if not rows:
+            return {}
+        times = parse_time_tags(item.get('time_tag') for item in rows)
+        added = {}
+        for name, key in fields.items():
+            values = np.array([_number(item.get(key)) for item in rows], dtype=np.float64)
+            added[name] = self.append(name, times, values)
+        return added
+
+    def query(self, name: str, t_from: int, t_to: int, step: int = 0) -> Dict[str, Any]:
+        """Диапазон ряда: сырые отсчеты или свертка по step секунд"""
+        times, values = self.series(name).read(t_from, t_to)
+        if not step and times.size > MAX_POINTS:
+            # Слишком много точек - выбираем шаг, кратный минуте
+            step = math.ceil((t_to - t_from + 1) / MAX_POINTS / 60) * 60
+
+        result = {'series': name, 'from': _iso(t_from), 'to': _iso(t_to), 'step': step, 'points': []}
+        if not times.size:
+            return result
+
+        if step:
+            # Интервалы выровнены по кратным step (метки 10:00, 10:10 ...)
+            rolled = rollup(times, values, t_from - t_from % step, step)
+            labels = _iso_array(rolled['time'])
+            result['points'] = [
+                {'time': label, 'min': lo, 'max': hi, 'mean': mean, 'count': count}
+                for label, lo, hi, mean, count in zip(labels, rolled['min'].tolist(), rolled['max'].tolist(),
+                                                      rolled['mean'].tolist(), rolled['count'].tolist())
+            ]
+        else:
+            result['points'] = [
+                {'time': label, 'value': value}
+                for label, value in zip(_iso_array(times), values.tolist())
+            ]
+        return result
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _iso(seconds: int) -> str:
+    return str(np.datetime64(int(seconds), 's')) + 'Z'
+
+
+def _iso_array(seconds: np.ndarray) -> List[str]:
+    return [label + 'Z' for label in np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s').tolist()]
@@ -0,0 +1,56 @@
+import numpy as np
+from itertools import repeat
+from operator import itemgetter
+from typing import Dict, List, Any
+
+from timeseries import parse_time_tags, _number
+
+# Пороги классов вспышек по потоку 0.1-0.8 нм (Вт/м²)
+C_THRESHOLD = 1e-6
+M_THRESHOLD = 1e-5
+X_THRESHOLD = 1e-4
+
+# Коды энергетических каналов GOES
+BAND_LONG = 0   # 0.1-0.8 нм - по нему определяется класс вспышки
+BAND_SHORT = 1  # 0.05-0.4 нм
+BAND_OTHER = 2
+
+BAND_CODES = {'0.1-0.8nm': BAND_LONG, '0.05-0.4nm': BAND_SHORT}
+
+
+def xray_columns(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Один проход по записям xrays-*.json на каждый столбец -> массивы numpy
+
+    time - datetime64[s] (UTC), flux - float64 (NaN, если нет значения),
+    band - int8 (BAND_LONG / BAND_SHORT / BAND_OTHER). Записи без
+    распознаваемого time_tag пропускаются.
+    """
+    try:
+        # Быстрый путь: обход записей в C (map + itemgetter); обрезка
+        # до 19 символов (без 'Z') и разбор дат выполняются внутри numpy
+        tags = list(map(itemgetter('time_tag'), records))
+        times = np.array(tags, dtype='S19').astype('datetime64[s]')
+        flux = np.array(list(map(itemgetter('flux'), records)), dtype=np.float64)
+        energy = list(map(itemgetter('energy'), records))
+    except (KeyError, TypeError, ValueError):
+        # Записи с пропусками полей или нестандартными датами: разбор по одной,
+        # записи с нераспознанным временем отбрасываются
+        records = [item for item in records if isinstance(item, dict)]
+        times = parse_time_tags(tag if isinstance(tag, str) else None
+                                for tag in (item.get('time_tag') for item in records))
+        keep = ~np.isnat(times)
+        times = times[keep]
+        flux = np.array([_number(item.get('flux')) for item in records], dtype=np.float64)[keep]
+        energy = [item.get('energy') for item, kept in zip(records, keep.tolist()) if kept]
+
+    band = np.fromiter(map(BAND_CODES.get, energy, repeat(BAND_OTHER)), dtype=np.int8, count=len(energy))
+    return {'time': times, 'flux': flux, 'band': band}
+
+
+def flux_class(flux: float) -> str:
+    """Класс вспышки по потоку: X1.2, M3.4, C5.0 ..."""
+    if flux >= X_THRESHOLD:
+        return f"X{flux / X_THRESHOLD:.1f}"
+    elif flux >= M_THRESHOLD:
+        return f"M{flux / M_THRESHOLD:.1f}"
+    return f"C{flux / C_THRESHOLD:.1f}"